@@ -0,0 +1,86 @@
+"""low-stock alerts: per-product reorder thresholds and a live stream of crossings (migration 8).
+
+a product is low when stock_quantity < its threshold, which is its own reorder_level,
+else its supplier's default_reorder_level, else the global default (StockAlertSetting,
+ERP_LOW_STOCK_THRESHOLD). triggers keep the LowStock set current on every stock or
+threshold change from any write path, and append a StockAlert row whenever a product
+falls below its threshold ('low'), gets back to it ('restocked') or is deleted while
+low ('deleted').
+
+/api/alerts/stream sends those rows to the browser as server-sent events. each client
+holds one cheap `id > ?` query per poll interval on the alert log, instead of reloading
+the dashboard; reconnects resume from the Last-Event-ID the browser sends.
+"""
+import json
+import time
+
+from db import connection
+
+_COLUMNS = '''a.id, a.product_id, a.event, a.stock_quantity, a.threshold, a.created_at,
+              p.name, p.sku, s.name'''
+
+
+def set_default_threshold(db, threshold):
+    """sets the global default; the triggers re-evaluate every product if it changed."""
+    db.execute('UPDATE StockAlertSetting SET default_threshold = ? WHERE id = 1 AND default_threshold != ?',
+               (threshold, threshold))
+
+
+def default_threshold(db):
+    return db.execute('SELECT default_threshold FROM StockAlertSetting WHERE id = 1').fetchone()[0]
+
+
+def latest_id(db):
+    return db.execute('SELECT COALESCE(MAX(id), 0) FROM StockAlert').fetchone()[0]
+
+
+def since(db, after, limit=100):
+    """alerts with id > after, oldest first, with the product's name, sku and supplier."""
+    rows = db.execute(f'''
+        SELECT {_COLUMNS}
+        FROM StockAlert a
+        LEFT JOIN Product p ON p.id = a.product_id
+        LEFT JOIN Supplier s ON s.id = p.supplier_id
+        WHERE a.id > ?
+        ORDER BY a.id
+        LIMIT ?
+    ''', (after, limit)).fetchall()
+    return [dict(zip(('id', 'product_id', 'event', 'stock_quantity', 'threshold', 'created_at',
+                      'name', 'sku', 'supplier_name'), row)) for row in rows]
+
+
+def low_count(db):
+    return db.execute('SELECT COUNT(*) FROM LowStock').fetchone()[0]
+
+
+def _event(alert, low):
+    data = json.dumps({**alert, 'low_count': low}, separators=(',', ':'))
+    return f'id: {alert["id"]}\nevent: {alert["event"]}\ndata: {data}\n\n'
+
+
+def stream(app, after, poll=1.0, duration=300.0, keepalive=15.0):
+    """server-sent events for every alert after `after`, for `duration` seconds.
+
+    a pooled connection is borrowed only for each poll, so open streams do not hold
+    connections. the stream then ends and the browser reconnects on its own, which
+    keeps a worker thread from being tied up forever by a tab left open.
+    """
+    yield f'retry: {int(poll * 1000) + 1000}\n\n'
+    deadline = time.monotonic() + duration
+    quiet_since = time.monotonic()
+    while time.monotonic() < deadline:
+        with connection(app) as db:
+            alerts = since(db, after)
+            low = low_count(db) if alerts else None
+        for alert in alerts:
+            after = alert['id']
+            yield _event(alert, low)
+        now = time.monotonic()
+        if alerts:
+            quiet_since = now
+        elif now - quiet_since >= keepalive:
+            # comment line: keeps proxies from closing an idle connection
+            yield ': keepalive\n\n'
+            quiet_since = now
+        if len(alerts) < 100:
+            time.sleep(poll)
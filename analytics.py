@@ -0,0 +1,334 @@
+"""columnar analytics over the stock ledger: abc classes, turnover, days of supply, dead stock.
+
+the per-product metrics need every stock movement of the window, which row at a time
+sql (or a python loop over the rows) cannot do quickly on a few million rows. so the
+StockMovement ledger (migration 4) is held in memory as numpy columns, one array per
+field, and each metric is a handful of vectorized passes over them (masks, bincount
+per product). StockMovement is append-only and its ids grow in commit order (one
+writer at a time), so the columns are brought up to date by reading only the rows
+with an id above the last one loaded. an edited or deleted transaction shows up as
+reversal rows, never as a change to rows already loaded.
+
+the columns are also saved to a .npy file (ANALYTICS_CACHE_PATH) that a new process
+maps in instead of reading the whole ledger from sqlite again; it is rewritten once
+ANALYTICS_SAVE_ROWS new rows were loaded, and by `flask analytics-refresh`.
+
+over the window of `window_days` days ending on `as_of`, per product:
+
+    units sold      units of sale movements minus reversed sales
+    abc class       products by sales value, highest first: A until the cumulative share
+                    reaches ANALYTICS_ABC_A (80%), B until ANALYTICS_ABC_B (95%), C the rest
+    turnover        units sold per year / average units on hand (end of each day)
+    days of supply  stock on hand / average units sold per day (None: nothing sold)
+    dead stock      stock on hand, stocked for at least `dead_days` and no sale in them
+
+numpy is imported on first use, not when the app starts.
+"""
+import os
+import threading
+from datetime import date
+
+from flask import current_app
+
+from utils import is_iso_date
+
+EPOCH = date(1970, 1, 1)
+
+# one entry per StockMovement row
+COLUMNS = [
+    ('id', 'i8'),
+    ('product_id', 'i8'),
+    ('day', 'i4'),          # date as days since 1970-01-01
+    ('quantity', 'i8'),     # signed stock change
+    ('sold', 'i8'),         # units sold: the issued quantity, negative for a reversed sale
+    ('unit_price', 'f8'),
+]
+
+_LOAD_SQL = '''
+    SELECT id, product_id, COALESCE(CAST(julianday(date) - 2440587.5 AS INTEGER), 0), quantity,
+           CASE WHEN reason = 'issue' OR (reason = 'reversal' AND quantity > 0) THEN -quantity ELSE 0 END,
+           COALESCE(unit_price, 0)
+    FROM StockMovement
+    WHERE id > ?
+    ORDER BY id
+'''
+
+ABC_CLASSES = ('A', 'B', 'C')
+
+
+class ColumnStore:
+    """the StockMovement ledger as numpy columns, caught up by id on every refresh()."""
+
+    def __init__(self, cache_path=None, save_rows=50_000):
+        self.cache_path = cache_path
+        self.save_rows = save_rows
+        self._columns = None  # {name: array}, allocated by the first refresh()
+        self._size = 0
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def last_id(self):
+        return int(self._columns['id'][self._size - 1]) if self._size else 0
+
+    def columns(self):
+        """{name: array} of the rows loaded so far. the arrays are views, valid after later refreshes."""
+        size = self._size
+        return {name: column[:size] for name, column in (self._columns or {}).items()}
+
+    def _append(self, rows):
+        import numpy as np
+        needed = self._size + len(rows)
+        if needed > len(self._columns['id']):
+            capacity = max(needed, 2 * len(self._columns['id']), 1024)
+            for name, dtype in COLUMNS:
+                grown = np.empty(capacity, dtype)
+                grown[:self._size] = self._columns[name][:self._size]
+                self._columns[name] = grown
+        for name, _ in COLUMNS:
+            self._columns[name][self._size:needed] = rows[name]
+        # readers only look at [:size], so the new rows appear in one step
+        self._size = needed
+
+    def _load_file(self, db):
+        import numpy as np
+        try:
+            data = np.load(self.cache_path, mmap_mode='r')
+        except (FileNotFoundError, ValueError, OSError):
+            return
+        if data.dtype != np.dtype(COLUMNS) or not len(data):
+            return
+        # the file must belong to this database: its last row has to be there unchanged
+        last = data[-1]
+        row = db.execute('SELECT product_id, quantity FROM StockMovement WHERE id = ?',
+                         (int(last['id']),)).fetchone()
+        if row is None or tuple(row) != (int(last['product_id']), int(last['quantity'])):
+            current_app.logger.info('analytics cache %s is for another database, reloading', self.cache_path)
+            return
+        self._append(data)
+
+    def save(self):
+        """writes the loaded rows to cache_path (temporary file, then renamed over the old one)."""
+        import numpy as np
+        if not self.cache_path or self._columns is None:
+            return
+        with self._lock:
+            size = self._size
+            data = np.empty(size, COLUMNS)
+            for name, _ in COLUMNS:
+                data[name] = self._columns[name][:size]
+            self._unsaved = 0
+        temp_path = f'{self.cache_path}.{os.getpid()}-{threading.get_ident()}.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                np.save(f, data)
+            os.replace(temp_path, self.cache_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def refresh(self, db):
+        """loads the rows added since the last call (all of them the first time). returns how many."""
+        import numpy as np
+        with self._lock:
+            if self._columns is None:
+                self._columns = {name: np.empty(0, dtype) for name, dtype in COLUMNS}
+                if self.cache_path:
+                    self._load_file(db)
+            before = self._size
+            cursor = db.cursor()
+            cursor.row_factory = None  # plain tuples, what np.fromiter takes
+            cursor.execute(_LOAD_SQL, (self.last_id(),))
+            while True:
+                rows = cursor.fetchmany(100_000)
+                if not rows:
+                    break
+                self._append(np.fromiter(rows, COLUMNS, len(rows)))
+            added = self._size - before
+            self._unsaved += added
+            save = self.cache_path and self._unsaved >= self.save_rows
+        if save:
+            try:
+                self.save()
+            except OSError as e:
+                current_app.logger.warning('analytics cache not saved: %s', e)
+        return added
+
+
+def get_store():
+    return current_app.extensions['analytics_store']
+
+
+def default_params(config, today=None):
+    return {'as_of': today or date.today(),
+            'window_days': config['ANALYTICS_WINDOW_DAYS'],
+            'dead_days': config['ANALYTICS_DEAD_STOCK_DAYS']}
+
+
+def parse_params(args, config, today=None):
+    """reads as_of (YYYY-MM-DD), window_days and dead_days from query args. returns (params, error message)."""
+    params = default_params(config, today)
+    if args.get('as_of'):
+        if not is_iso_date(args['as_of']):
+            return None, 'as_of must be a YYYY-MM-DD date.'
+        params['as_of'] = date.fromisoformat(args['as_of'])
+    for key in ('window_days', 'dead_days'):
+        if args.get(key):
+            try:
+                params[key] = int(args[key])
+            except ValueError:
+                return None, f'{key} must be a number.'
+            if not 1 <= params[key] <= 3650:
+                return None, f'{key} must be between 1 and 3650.'
+    return params, None
+
+
+def _products(db):
+    cursor = db.cursor()
+    cursor.row_factory = None
+    return cursor.execute('''
+        SELECT p.id, p.name, p.sku, p.unit_price, s.name
+        FROM Product p
+        LEFT JOIN Supplier s ON s.id = p.supplier_id
+        ORDER BY p.id
+    ''').fetchall()
+
+
+def _round(values, digits):
+    # rounded floats, None where the value is undefined (nan / inf)
+    import numpy as np
+    return [value if value == value else None
+            for value in np.round(np.where(np.isfinite(values), values, np.nan), digits).tolist()]
+
+
+def compute(db, store, params, abc_a=0.8, abc_b=0.95):
+    """per-product metrics and their summary for parsed params, from the ledger columns
+    (store, caught up first) and the products in db. plain lists/dicts, ready for json."""
+    import numpy as np
+    store.refresh(db)
+    products = _products(db)
+    columns = store.columns()
+    window = params['window_days']
+    end = (params['as_of'] - EPOCH).days
+    start = end - window + 1
+
+    ids = np.fromiter((row[0] for row in products), np.int64, len(products))
+    size = int(max(ids.max(initial=-1), columns['product_id'].max(initial=-1))) + 1
+    product_id, day = columns['product_id'], columns['day']
+
+    def per_product(mask, weights):
+        # a sum per product of the weights where mask is set (zeroed, not filtered: no copy of the rows)
+        return np.bincount(product_id, np.where(mask, weights, 0), minlength=size)[ids]
+
+    upto = day <= end
+    in_window = upto & (day >= start)
+    quantity, sold = columns['quantity'], columns['sold']
+    stock = per_product(upto, quantity)
+    units_sold = per_product(in_window, sold)
+    sales_value = per_product(in_window, sold * columns['unit_price'])
+    # average of the end of day stock over the window: a movement on day d counted in
+    # today's stock was not there on the (d - start) days of the window before it
+    average_stock = stock - per_product(in_window, quantity * (day - start)) / window
+
+    # last day with units sold. a deleted or edited sale leaves its issue row behind plus a
+    # reversal, so for products with reversals the days are netted first; those are few
+    sales = upto & (sold != 0)
+    reversed_ids = np.unique(product_id[sales & (sold < 0)])
+    has_reversal = np.isin(product_id, reversed_ids)
+    plain = sales & (sold > 0) & ~has_reversal
+    # (ufunc.at is only fast when the target has the dtype of the values, int32 here)
+    last_sale = np.full(size, -1, day.dtype)
+    np.maximum.at(last_sale, product_id[plain], day[plain])
+    if len(reversed_ids):
+        netted = sales & has_reversal
+        days, inverse = np.unique(np.stack([product_id[netted], day[netted]], axis=1), axis=0, return_inverse=True)
+        days = days[np.bincount(inverse.ravel(), sold[netted]) > 0]
+        np.maximum.at(last_sale, days[:, 0], days[:, 1].astype(day.dtype))
+    last_sale = last_sale[ids]
+    first_seen = np.full(size, end + 1, day.dtype)
+    np.minimum.at(first_seen, product_id[upto], day[upto])
+    first_seen = first_seen[ids]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        turnover = np.where(average_stock > 0, units_sold * (365 / window) / average_stock, np.nan)
+        days_of_supply = np.where(units_sold > 0, np.maximum(stock, 0) / (units_sold / window), np.nan)
+    days_since_sale = np.where(last_sale >= 0, end - last_sale, -1)
+    dead = (stock > 0) & (end - first_seen >= params['dead_days']) & \
+        ((last_sale < 0) | (days_since_sale >= params['dead_days']))
+
+    # abc: cumulative share of sales value before each product, in descending value order
+    order = np.argsort(-sales_value, kind='stable')
+    total_sales = float(sales_value.sum())
+    ranked = sales_value[order]
+    share_before = np.empty(len(ids))
+    share_before[order] = (np.cumsum(ranked) - ranked) / total_sales if total_sales > 0 else 1.0
+    abc = np.where(sales_value <= 0, 2, np.where(share_before < abc_a, 0, np.where(share_before < abc_b, 1, 2)))
+
+    unit_price = np.fromiter((row[3] or 0 for row in products), np.float64, len(products))
+    stock_value = stock * unit_price
+    # the rows in rank order; each column goes to python values in one call
+    last_sale_dates = last_sale.astype('datetime64[D]').astype(str)
+    per_row = zip([products[i] for i in order.tolist()], abc[order].tolist(),
+                  stock[order].astype(np.int64).tolist(), units_sold[order].astype(np.int64).tolist(),
+                  _round(sales_value[order], 2), _round(turnover[order], 2), _round(days_of_supply[order], 1),
+                  last_sale_dates[order].tolist(), days_since_sale[order].tolist(), dead[order].tolist(),
+                  _round(stock_value[order], 2))
+    rows = []
+    for rank, (product, klass, stock_i, sold_i, value_i, turnover_i, supply_i, last_i, since_i, dead_i,
+               stock_value_i) in enumerate(per_row, 1):
+        rows.append({'product_id': product[0], 'name': product[1], 'sku': product[2],
+                     'supplier_name': product[4], 'rank': rank, 'abc_class': ABC_CLASSES[klass],
+                     'stock': stock_i, 'stock_value': stock_value_i, 'units_sold': sold_i,
+                     'sales_value': value_i, 'turnover': turnover_i, 'days_of_supply': supply_i,
+                     'last_sale': last_i if since_i >= 0 else None,
+                     'days_since_sale': since_i if since_i >= 0 else None, 'dead_stock': dead_i})
+
+    classes = {}
+    for i, name in enumerate(ABC_CLASSES):
+        members = abc == i
+        value = float(sales_value[members].sum())
+        classes[name] = {'products': int(members.sum()), 'sales_value': round(value, 2),
+                         'share': round(value / total_sales, 4) if total_sales > 0 else 0,
+                         'stock_value': round(float(stock_value[members].sum()), 2)}
+    stocked = average_stock > 0
+    return {'as_of': params['as_of'].isoformat(),
+            'window_days': window,
+            'dead_days': params['dead_days'],
+            'movements': len(columns['id']),
+            'totals': {'products': len(ids),
+                       'units_sold': int(units_sold.sum()),
+                       'sales_value': round(total_sales, 2),
+                       'stock_value': round(float(stock_value.sum()), 2),
+                       # units sold per year over the average units on hand, all products together
+                       'turnover': round(float(units_sold[stocked].sum() * 365 / window / average_stock[stocked].sum()), 2)
+                       if stocked.any() else None},
+            'abc': classes,
+            'dead_stock': {'products': int(dead.sum()), 'units': int(stock[dead].sum()),
+                           'value': round(float(stock_value[dead].sum()), 2)},
+            'products': rows}
+
+
+def pareto_curve(products, points=100):
+    """cumulative share of sales value over the share of products, products in rank order:
+    at most `points` (percent of products, percent of sales value) pairs for a chart."""
+    values = [product['sales_value'] or 0 for product in products]
+    total = sum(values)
+    if not values or total <= 0:
+        return []
+    step = max(1, len(values) // points)
+    curve, running = [], 0
+    for i, value in enumerate(values, 1):
+        running += value
+        if i % step == 0 or i == len(values):
+            curve.append((round(100 * i / len(values), 1), round(100 * running / total, 1)))
+    return curve
+
+
+def init_app(app):
+    config = app.config
+    cache_path = None
+    if config['ANALYTICS_CACHE_ENABLED']:
+        cache_path = config['ANALYTICS_CACHE_PATH'] or config['DATABASE'] + '.analytics.npy'
+    app.extensions['analytics_store'] = ColumnStore(cache_path, config['ANALYTICS_SAVE_ROWS'])
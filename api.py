@@ -0,0 +1,383 @@
+"""versioned json api for suppliers, products and transactions, mounted at /api/v1.
+
+    GET    /api/v1/<entity>              page by id, ?cursor= (next_cursor) and ?limit=
+    GET    /api/v1/<entity>/<id>
+    POST   /api/v1/<entity>              one object, 201 with the stored record
+    POST   /api/v1/<entity>/bulk         list of objects, all or nothing
+    PUT    /api/v1/<entity>/<id>         full record
+    PATCH  /api/v1/<entity>/<id>         only the fields given
+    DELETE /api/v1/<entity>/<id>         204
+    POST   /api/v1/orders                a multi-line sale/purchase, applied atomically
+
+input goes through validation.py and stock changes through stock.py, the same as the
+forms, so the rules (no negative stock, unique sku, ...) are identical. errors are
+{"error": message} with 400 (invalid input), 404 or 409 (refused by the data).
+
+GETs carry an ETag built from the DataVersion counters (migration 6), which triggers
+bump on every write to a table. If-None-Match is answered with 304 after reading one
+small row, before the query behind the response runs. rows are read as plain tuples
+and encoded once with a compact encoder: stored dates and timestamps are passed
+through as the strings they already are.
+"""
+import json
+import sqlite3
+import zlib
+from datetime import date
+
+from flask import Blueprint, Response, current_app, request, url_for
+
+import search
+import stock
+from cache import invalidate
+from db import get_db, write_transaction
+from stock import StockError
+from utils import clamp_int, decode_cursor, encode_cursor, parse_transaction_filters, transaction_filter_sql
+from validation import ValidationError, clean_order, clean_product, clean_supplier, clean_transaction
+
+bp = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+ENTITY = '<any(suppliers, products, transactions):entity>'
+
+# entity -> (table, alias, columns, cache tags invalidated by its writes)
+ENTITIES = {
+    'suppliers': ('Supplier', 's', ('id', 'name', 'contact_email', 'default_reorder_level', 'created_at',
+                                    'updated_at'), ('suppliers',)),
+    'products': ('Product', 'p', ('id', 'name', 'sku', 'stock_quantity', 'unit_price', 'supplier_id',
+                                  'reorder_level', 'created_at', 'updated_at'), ('products',)),
+    'transactions': ('"Transaction"', 't', ('id', 'product_id', 'type', 'quantity', 'unit_price', 'date'),
+                     ('transactions', 'products')),
+}
+
+# allow_nan=False: NaN/Infinity are not JSON, fail loudly instead of answering with them
+_encode = json.JSONEncoder(ensure_ascii=False, check_circular=False, allow_nan=False, separators=(',', ':')).encode
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+@bp.errorhandler(ApiError)
+def _api_error(error):
+    return _json({'error': str(error), **error.extra}, error.status)
+
+
+def _json(payload, status=200, etag=None, headers=None):
+    response = Response(_encode(payload), status=status, mimetype='application/json', headers=headers)
+    if etag:
+        response.set_etag(etag)
+    return response
+
+
+def _rows(sql, params=()):
+    cursor = get_db().cursor()
+    # tuples zipped with the column names, cheaper than sqlite3.Row -> dict per row
+    cursor.row_factory = None
+    cursor.execute(sql, params)
+    names = [column[0] for column in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def _etag(entity):
+    version = get_db().execute('SELECT version FROM DataVersion WHERE name = ?', (entity,)).fetchone()
+    url = zlib.crc32(request.full_path.encode())
+    return f'{entity}-{version[0] if version else 0}-{url:08x}'
+
+
+def _not_modified(etag):
+    # weak comparison: compress.py hands out the etag as W/"..." on compressed responses
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def _body():
+    data = request.get_json(silent=True)
+    if data is None:
+        raise ApiError('Request body must be JSON.')
+    return data
+
+
+def _fetch(entity, item_id):
+    table, alias, columns, _ = ENTITIES[entity]
+    rows = _rows(f'SELECT {", ".join(columns)} FROM {table} WHERE id = ?', (item_id,))
+    if not rows:
+        raise ApiError(f'{entity[:-1].capitalize()} {item_id} not found.', 404)
+    return rows[0]
+
+
+def _list_filters(entity):
+    args = request.args
+    if entity == 'transactions':
+        filters, error = parse_transaction_filters(args)
+        if error:
+            raise ApiError(error)
+        return transaction_filter_sql(filters)
+    where, params = [], []
+    if entity == 'products':
+        if args.get('supplier_id'):
+            try:
+                params.append(int(args['supplier_id']))
+            except ValueError:
+                raise ApiError('supplier_id must be a number.')
+            where.append('p.supplier_id = ?')
+        if args.get('q', '').strip():
+            condition, condition_params = search.match_filter(args['q'])
+            where.append(condition)
+            params.extend(condition_params)
+    return where, params
+
+
+@bp.route(f'/{ENTITY}', methods=['GET'])
+def list_entities(entity):
+    """one page in id order. pass next_cursor back as ?cursor= for the following page"""
+    etag = _etag(entity)
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+    config = current_app.config
+    limit = clamp_int(request.args.get('limit'), config['API_PAGE_SIZE'], 1, config['API_MAX_PAGE_SIZE'])
+    table, alias, columns, _ = ENTITIES[entity]
+    where, params = _list_filters(entity)
+    after = decode_cursor(request.args.get('cursor'))
+    if after and len(after) == 1 and isinstance(after[0], int):
+        where.append(f'{alias}.id > ?')
+        params.append(after[0])
+    where_sql = ('WHERE ' + ' AND '.join(where)) if where else ''
+    rows = _rows(f'''
+        SELECT {", ".join(f"{alias}.{column}" for column in columns)}
+        FROM {table} {alias}
+        {where_sql}
+        ORDER BY {alias}.id
+        LIMIT ?
+    ''', (*params, limit + 1))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['id'])
+    return _json({entity: rows, 'next_cursor': next_cursor, 'limit': limit}, etag=etag)
+
+
+@bp.route(f'/{ENTITY}/<int:item_id>', methods=['GET'])
+def get_entity(entity, item_id):
+    etag = _etag(entity)
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+    return _json(_fetch(entity, item_id), etag=etag)
+
+
+# --- writes: each takes cleaned input and runs inside the caller's write_transaction ---
+
+def _resolve_product(db, txn):
+    if txn['product_id'] is None:
+        row = db.execute('SELECT id FROM Product WHERE sku = ?', (txn['sku'],)).fetchone()
+        if row is None:
+            raise ValidationError(f'Product with SKU "{txn["sku"]}" not found.')
+        txn['product_id'] = row[0]
+
+
+def _check_supplier(db, supplier_id):
+    if db.execute('SELECT 1 FROM Supplier WHERE id = ?', (supplier_id,)).fetchone() is None:
+        raise ValidationError(f'Supplier {supplier_id} not found.')
+
+
+def _create_supplier(db, supplier):
+    return db.execute('INSERT INTO Supplier (name, contact_email, default_reorder_level) VALUES (?, ?, ?)',
+                      (supplier['name'], supplier['contact_email'], supplier['default_reorder_level'])).lastrowid
+
+
+def _create_product(db, product):
+    _check_supplier(db, product['supplier_id'])
+    return db.execute('''
+        INSERT INTO Product (name, sku, stock_quantity, unit_price, supplier_id, reorder_level)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (product['name'], product['sku'], product['stock_quantity'], product['unit_price'],
+          product['supplier_id'], product['reorder_level'])).lastrowid
+
+
+def _create_transaction(db, txn):
+    _resolve_product(db, txn)
+    return stock.add_transaction(db, txn['product_id'], txn['type'], txn['quantity'], txn['date'],
+                                 txn['unit_price'])
+
+
+def _update_supplier(db, item_id, supplier):
+    db.execute('''
+        UPDATE Supplier
+        SET name = ?, contact_email = ?, default_reorder_level = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (supplier['name'], supplier['contact_email'], supplier['default_reorder_level'], item_id))
+
+
+def _update_product(db, item_id, product):
+    _check_supplier(db, product['supplier_id'])
+    db.execute('''
+        UPDATE Product
+        SET name = ?, sku = ?, unit_price = ?, supplier_id = ?, reorder_level = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (product['name'], product['sku'], product['unit_price'], product['supplier_id'],
+          product['reorder_level'], item_id))
+    # like the edit form: a changed count is recorded as a stock adjustment
+    stock.set_stock(db, item_id, product['stock_quantity'], date.today().isoformat())
+
+
+def _update_transaction(db, item_id, txn):
+    _resolve_product(db, txn)
+    stock.update_transaction(db, item_id, txn['product_id'], txn['type'], txn['quantity'], txn['date'],
+                             txn['unit_price'])
+
+
+def _delete_supplier(db, item_id):
+    if db.execute('SELECT 1 FROM Product WHERE supplier_id = ? LIMIT 1', (item_id,)).fetchone():
+        raise StockError('Cannot delete supplier. Products are associated with this supplier.')
+    db.execute('DELETE FROM Supplier WHERE id = ?', (item_id,))
+
+
+def _delete_product(db, item_id):
+    if db.execute('SELECT 1 FROM "Transaction" WHERE product_id = ? LIMIT 1', (item_id,)).fetchone():
+        raise StockError('Cannot delete product. It has associated transactions. Please delete transactions first.')
+    db.execute('DELETE FROM Product WHERE id = ?', (item_id,))
+
+
+# entity -> (clean, create, update, delete)
+WRITERS = {
+    'suppliers': (clean_supplier, _create_supplier, _update_supplier, _delete_supplier),
+    'products': (clean_product, _create_product, _update_product, _delete_product),
+    'transactions': (clean_transaction, _create_transaction, _update_transaction, stock.delete_transaction),
+}
+
+
+def _write(entity, action, index=None):
+    """runs action(db) in one write transaction, mapping refusals to api errors."""
+    db = get_db()
+    extra = {} if index is None else {'index': index}
+    try:
+        with write_transaction(db):
+            result = action(db)
+    except ValidationError as e:
+        raise ApiError(str(e), 400, **extra)
+    except StockError as e:
+        raise ApiError(str(e), 409, **extra)
+    except sqlite3.IntegrityError as e:
+        raise ApiError(f'Conflicts with an existing {entity[:-1]}: {e}', 409, **extra)
+    invalidate(*ENTITIES[entity][3])
+    return result
+
+
+def _clean(entity, data):
+    if not isinstance(data, dict):
+        raise ValidationError('Each item must be a JSON object.')
+    return WRITERS[entity][0](data)
+
+
+@bp.route(f'/{ENTITY}', methods=['POST'])
+def create_entity(entity):
+    try:
+        cleaned = _clean(entity, _body())
+    except ValidationError as e:
+        raise ApiError(str(e))
+    item_id = _write(entity, lambda db: WRITERS[entity][1](db, cleaned))
+    return _json(_fetch(entity, item_id), 201,
+                 headers={'Location': url_for('.get_entity', entity=entity, item_id=item_id)})
+
+
+@bp.route(f'/{ENTITY}/bulk', methods=['POST'])
+def bulk_create(entity):
+    """a list of objects (or {"items": [...]}) created in one transaction: all of them or none"""
+    items = _body()
+    if isinstance(items, dict):
+        items = items.get('items')
+    if not isinstance(items, list) or not items:
+        raise ApiError('Body must be a non-empty JSON list of objects.')
+    max_items = current_app.config['API_BULK_MAX_ITEMS']
+    if len(items) > max_items:
+        raise ApiError(f'At most {max_items} items per request.', 413)
+    cleaned, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            cleaned.append(_clean(entity, item))
+        except ValidationError as e:
+            errors.append({'index': index, 'error': str(e)})
+    if errors:
+        raise ApiError(f'{len(errors)} invalid items, nothing was created.', 400, errors=errors)
+
+    create = WRITERS[entity][1]
+    position = {'index': 0}
+
+    def create_all(db):
+        ids = []
+        for index, item in enumerate(cleaned):
+            position['index'] = index
+            ids.append(create(db, item))
+        return ids
+
+    try:
+        ids = _write(entity, create_all)
+    except ApiError as e:
+        # which item was refused; none of them were kept
+        e.extra.setdefault('index', position['index'])
+        raise
+    return _json({'ids': ids, 'count': len(ids)}, 201)
+
+
+@bp.route(f'/{ENTITY}/<int:item_id>', methods=['PUT', 'PATCH'])
+def update_entity(entity, item_id):
+    """PUT takes the whole record, PATCH only the fields to change"""
+    body = _body()
+    if not isinstance(body, dict):
+        raise ApiError('Body must be a JSON object.')
+    # 404 for a missing id before validation, for PUT as well as PATCH
+    current = _fetch(entity, item_id)
+    data = {**current, **body} if request.method == 'PATCH' else body
+    try:
+        cleaned = _clean(entity, data)
+    except ValidationError as e:
+        raise ApiError(str(e))
+    _write(entity, lambda db: WRITERS[entity][2](db, item_id, cleaned))
+    return _json(_fetch(entity, item_id))
+
+
+@bp.route(f'/{ENTITY}/<int:item_id>', methods=['DELETE'])
+def delete_entity(entity, item_id):
+    _fetch(entity, item_id)
+    _write(entity, lambda db: WRITERS[entity][3](db, item_id))
+    return Response(status=204)
+
+
+@bp.route('/orders', methods=['POST'])
+def create_order():
+    """{"date", "type" (default sale), "lines": [{product_id or sku, quantity, unit_price, type?, date?}]}.
+    every line is validated, then all stock changes and transactions are written in one
+    transaction: the whole basket is recorded, or nothing (409 naming the short products)"""
+    data = _body()
+    if not isinstance(data, dict):
+        raise ApiError('Body must be a JSON object.')
+    try:
+        lines = clean_order(data, current_app.config['ORDER_MAX_LINES'])
+    except ValidationError as e:
+        raise ApiError(str(e), 400, errors=e.errors)
+
+    def apply(db):
+        skus = {line['sku'] for line in lines if line['product_id'] is None}
+        if skus:
+            found = dict(db.execute(f'SELECT sku, id FROM Product WHERE sku IN ({",".join("?" * len(skus))})',
+                                    list(skus)).fetchall())
+            unknown = sorted(skus - found.keys())
+            if unknown:
+                raise ValidationError(f'Unknown SKUs: {", ".join(unknown)}.')
+            for line in lines:
+                if line['product_id'] is None:
+                    line['product_id'] = found[line['sku']]
+        return stock.add_order(db, lines)
+
+    ids = _write('transactions', apply)
+    return _json({'transaction_ids': ids,
+                  'lines': len(lines),
+                  'quantity': sum(line['quantity'] for line in lines),
+                  'value': round(sum(line['quantity'] * line['unit_price'] for line in lines), 2)}, 201)
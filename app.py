@@ -1,34 +1,61 @@
 import sqlite3
-from flask import Flask,render_template, request,redirect,url_for,flash, g,jsonify
+from flask import Flask,render_template, request,redirect,url_for,flash, g,jsonify,Response,stream_with_context,current_app
+from flask.cli import AppGroup
+import click
+from markupsafe import Markup
 from datetime import datetime, timedelta
 import os
+import io
+import uuid
 import json # added json for parsing ai response
-from together import Together
-
-app =Flask(__name__)
-app.secret_key='ERP'
-
-# --- DB Configuration ---
-
-DATABASE = 'database.db'
-
-"""connects to existing db  / Cretes new"""
-def get_db():
-    db=getattr(g,'_database',None)
-    if db is None:
-        db =sqlite3.connect(DATABASE)
-        db.row_factory= sqlite3.Row
-    return db
-
-"""disconnects from the db at the end of the request"""
-@app.teardown_appcontext
-def close_connection(exception):
-    db =getattr(g,'_database', None)
-    if db is not None:
-        db.close()
-
-"""initialize the db schema."""
-def init_db():
+from config import Config
+from db import get_db, write_transaction, pool_stats, close_pool, init_app as init_db_app
+from utils import encode_cursor, decode_cursor, is_iso_date, clamp_int, transaction_filter_sql, parse_transaction_filters
+import migrations
+import cache
+from cache import cached, invalidate
+import metrics
+from validation import ValidationError, clean_product, clean_supplier, clean_transaction
+import importer
+import exporter
+import reorder_ai
+import forecast
+import ledger
+import search
+import stock
+from stock import StockError
+import valuation
+import api
+import jobs
+import alerts
+import reports as report_queries
+import models
+import snapshot
+import analytics
+import fragments
+import assets
+import compress
+
+# --- Views and CLI commands ---
+# views are recorded with @route and commands with @commands.command; create_app()
+# (at the bottom) attaches them to every app it builds.
+
+_routes=[]
+
+"""records a view for create_app(), takes the same arguments as Flask.route."""
+def route(rule, **options):
+    def register(view):
+        _routes.append((rule, view, options))
+        return view
+    return register
+
+# flask --app app <command>, run inside an app context like @app.cli.command
+commands=AppGroup('erp')
+
+"""initialize the db schema. safe to run any number of times and from several processes at
+once: tables are created if missing and each migration is applied once, under the write lock."""
+def init_db(app=None, quiet=False):
+    app=app or current_app._get_current_object()
     with app.app_context():
         db =get_db()
         cursor=db.cursor()
@@ -69,245 +96,415 @@ def init_db():
             )
         ''')
         db.commit()
-        print("Database initialized successfully.")
+        # indexes and later schema changes live in migrations.py
+        applied=migrations.migrate(db)
+        if applied:
+            message=f"Applied schema migrations: {applied}"
+            if quiet:
+                app.logger.info(message)
+            else:
+                print(message)
+        # products without their own or a supplier threshold are low below this
+        alerts.set_default_threshold(db, current_app.config['LOW_STOCK_THRESHOLD'])
+        db.commit()
+        if not quiet:
+            print("Database initialized successfully.")
 
 
 # --- Helper Functions for Database Operations ---
 # These must be defined BEFORE the routes that use them
 
-"""fetches all products with their supplier names and converts date strings to datetime objects."""
+"""fetches all products with their supplier names, as models.Product records (dates parse on read)."""
 def get_all_products():
-
-    db =get_db()
-    products_raw= db.execute('''
-        SELECT p.*, s.name AS supplier_name
-        FROM Product p
-        LEFT JOIN Supplier s ON p.supplier_id = s.id
-        ORDER BY p.name
-    ''').fetchall()
-
-    # convert 'created_at' and 'updated_at' strings to datetime tyope
-    products_list= []
-    for product in products_raw:
-        product_dict= dict(product)
-        if product_dict['created_at']:
-            # SQLite stores TIMESTAMP as 'YYYY-MM-DD HH:MM:%S'
-            product_dict['created_at'] =datetime.strptime(product_dict['created_at'],'%Y-%m-%d %H:%M:%S')
-        if product_dict['updated_at']:
-            product_dict['updated_at']=datetime.strptime(product_dict['updated_at'],'%Y-%m-%d %H:%M:%S')
-        products_list.append(product_dict)
-    return products_list
-
-"""load a single product by ID."""
+    return models.all_products(get_db())
+
+"""fetches one page of products ordered by name, optionally only those matching a search term.
+
+keyset cursor on (name, id) like the ledger pages, so /products stays one index range
+read however many SKUs there are. returns (products, next_cursor or None).
+"""
+def get_products_page(q='', cursor=None, limit=50):
+    where=[]
+    params=[]
+    if q:
+        condition,condition_params=search.match_filter(q)
+        where.append(condition)
+        params.extend(condition_params)
+    after=decode_cursor(cursor)
+    if after and len(after)==2 and isinstance(after[0], str) and isinstance(after[1], int):
+        where.append('(p.name, p.id) > (?, ?)')
+        params.extend(after)
+
+    where_sql=('WHERE ' + ' AND '.join(where)) if where else ''
+    rows=models.products_page(get_db(), where_sql, params, limit + 1)
+
+    next_cursor=None
+    if len(rows) > limit:
+        rows=rows[:limit]
+        next_cursor=encode_cursor(rows[-1]['name'], rows[-1]['id'])
+    return rows, next_cursor
+
+"""load a single product by ID, with its supplier name."""
 def get_product_by_id(product_id):
-    db= get_db()
-    product =db.execute('SELECT * FROM Product WHERE id = ?',(product_id,)).fetchone()
-    # if a product exists... convert its date strings to datetime objects
-    if product:
-        product_dict= dict(product)
-        if product_dict['created_at']:
-            product_dict['created_at'] =datetime.strptime(product_dict['created_at'], '%Y-%m-%d %H:%M:%S')
-        if product_dict['updated_at']:
-            product_dict['updated_at']=datetime.strptime(product_dict['updated_at'],'%Y-%m-%d %H:%M:%S')
-        return product_dict
-    return None
+    return models.product(get_db(), product_id)
 
 
 """fetch all suppliers and counts products associated with each."""
 def get_all_suppliers():
-    db=get_db()
-    suppliers= db.execute('''
-        SELECT s.*, COUNT(p.id) AS product_count
-        FROM Supplier s
-        LEFT JOIN Product p ON s.id = p.supplier_id
-        GROUP BY s.id
-        ORDER BY s.name
-    ''').fetchall()
-    return suppliers
+    return models.all_suppliers(get_db())
 
 
 """fetches a single supplier by ID."""
 def get_supplier_by_id(supplier_id):
-    db=get_db()
-    supplier=db.execute('SELECT * FROM Supplier WHERE id = ?',(supplier_id,)).fetchone()
-    return supplier
+    return models.supplier(get_db(), supplier_id)
 
-"""fetche all transactions with product names and converts date strings to datetime objects"""
+"""fetches all transactions with product names, as models.Transaction records"""
 def get_all_transactions():
-    db = get_db()
-    transactions_raw = db.execute('''
-        SELECT t.*, p.name AS product_name, p.sku AS product_sku, p.unit_price AS product_current_price
-        FROM "Transaction" t
-        JOIN Product p ON t.product_id = p.id
-        ORDER BY t.date DESC, t.id DESC
-    ''').fetchall()
-
-    transactions_list = []
-    for txn in transactions_raw:
-        txn_dict= dict(txn)
-        if txn_dict['date']:
-            txn_dict['date']=datetime.strptime(txn_dict['date'],'%Y-%m-%d')
-        transactions_list.append (txn_dict)
-    return transactions_list
+    return models.all_transactions(get_db())
+
+"""fetches one page of transactions, newest first, using a keyset cursor on (date, id).
+
+the cursor is the (date, id) of the last row of the previous page, so every page is
+a single index range read no matter how deep into the ledger it is. txn.date is a
+date, txn['date'] and dict(txn) keep the stored YYYY-MM-DD string.
+returns (rows, next_cursor or None).
+"""
+def get_transactions_page(filters=None, cursor=None, limit=50):
+    where,params=transaction_filter_sql(filters or {})
+    after=decode_cursor(cursor)
+    if after and len(after)==2 and isinstance(after[0], str) and isinstance(after[1], int):
+        where.append('(t.date, t.id) < (?, ?)')
+        params.extend(after)
+
+    where_sql=('WHERE ' + ' AND '.join(where)) if where else ''
+    # fetch one extra row to know whether there is a next page
+    rows=models.transactions_page(get_db(), where_sql, params, limit + 1)
+
+    next_cursor=None
+    if len(rows) > limit:
+        rows=rows[:limit]
+        next_cursor=encode_cursor(rows[-1]['date'], rows[-1]['id'])
+    return rows, next_cursor
 
 """fetches a single transaction by ID...including product details."""
 def get_transaction_by_id(transaction_id):
-    db =get_db()
-    txn=db.execute('''
-        SELECT t.*, p.name AS product_name, p.sku AS product_sku, p.stock_quantity AS current_product_stock
-        FROM "Transaction" t
-        JOIN Product p ON t.product_id = p.id
-        WHERE t.id = ?
-    ''', (transaction_id,)).fetchone()
-    if txn:
-        txn_dict =dict(txn)
-        if txn_dict['date']:
-            txn_dict['date']=datetime.strptime(txn_dict['date'],'%Y-%m-%d')
-        return txn_dict
-    return None
+    return models.transaction(get_db(), transaction_id)
+
+
+# --- Cached aggregates ---
+# dashboard/reports numbers go through cache.cached(), tagged with the tables they
+# read. the write routes call invalidate() with the same tags after committing.
+# they read snapshot.get_db(): the reporting snapshot when ERP_SNAPSHOT_ENABLED=1,
+# keyed with snapshot.cache_key() so a cached number follows the snapshot it came from.
+
+"""product count and total stock value at list price."""
+def get_inventory_summary():
+    def compute():
+        db=snapshot.get_db()
+        total_products=db.execute('SELECT COUNT(*) FROM Product').fetchone()[0]
+        total_value_row=db.execute('SELECT SUM(stock_quantity * unit_price) FROM Product').fetchone()
+        total_value=round(total_value_row[0] if total_value_row[0] is not None else 0, 2)
+        return {"total_products": total_products, "total_value": total_value}
+    return cached(snapshot.cache_key('agg:inventory_summary'), compute, tags=('products',))
+
+"""products below their reorder threshold with the threshold and supplier names, lowest stock first.
+the LowStock set is kept by triggers (migration 8), so this never scans Product."""
+def get_low_stock_products():
+    return cached(snapshot.cache_key('agg:low_stock_products'),
+                  lambda: query_low_stock_products(snapshot.get_db()), tags=('products', 'suppliers'))
+
+"""the query behind get_low_stock_products, for callers that must not get a cached list."""
+def query_low_stock_products(db):
+    rows=db.execute('''
+        SELECT p.*, l.threshold, s.name AS supplier_name
+        FROM LowStock l
+        JOIN Product p ON p.id = l.product_id
+        LEFT JOIN Supplier s ON p.supplier_id = s.id
+        ORDER BY l.stock_quantity ASC
+    ''').fetchall()
+    return [dict(row) for row in rows]
+
+def get_transaction_count():
+    return cached(snapshot.cache_key('agg:transaction_count'),
+                  lambda: snapshot.get_db().execute('SELECT COUNT(*) FROM "Transaction"').fetchone()[0],
+                  tags=('transactions',))
+
+def get_supplier_count():
+    return cached(snapshot.cache_key('agg:supplier_count'),
+                  lambda: snapshot.get_db().execute('SELECT COUNT(*) FROM Supplier').fetchone()[0],
+                  tags=('suppliers',))
+
+"""brings the cost valuation up to date for the products changed since the last call (see valuation.py)."""
+def refresh_valuation():
+    db=get_db()
+    method=current_app.config['VALUATION_METHOD']
+    if valuation.pending(db, method):
+        with write_transaction(db):
+            valuation.refresh(db, method)
+
+"""the default sales/purchase report: last REPORT_DEFAULT_MONTHS months by month (see reports.py)."""
+def default_report():
+    db=snapshot.get_db()
+    date_from,date_to=report_queries.default_range(db, current_app.config['REPORT_DEFAULT_MONTHS'])
+    return report_queries.summary(db, report_queries.default_params(date_from, date_to))
+
+"""chart data for the reports page: the default report plus the cost valuation series."""
+def compute_report_series():
+    db=get_db()
+    report=default_report()
+
+    # cost of goods sold, gross margin and inventory value at cost from the valuation
+    # engine (sales minus purchases is not a profit: stock bought is not yet an expense).
+    # read live: the refresh writes, and it only reads the small per-month valuation tables
+    refresh_valuation()
+    valuation_rows=valuation.monthly_summary(db, current_app.config['VALUATION_REPORT_MONTHS'])
+    valuation_months=[row['month'] for row in valuation_rows]
+    revenue_values=[row['revenue'] for row in valuation_rows]
+    cogs_values=[row['cogs'] for row in valuation_rows]
+    gross_margin_values=[row['gross_margin'] for row in valuation_rows]
+    inventory_cost_values=[row['inventory_value'] for row in valuation_rows]
+
+
+    return {"report": report,
+            "valuation_months": valuation_months,
+            "revenue_values": revenue_values,
+            "cogs_values": cogs_values,
+            "gross_margin_values": gross_margin_values,
+            "inventory_cost_values": inventory_cost_values,
+            "inventory_cost": inventory_cost_values[-1] if inventory_cost_values else 0,
+            "valuation_method": current_app.config['VALUATION_METHOD']}
+
+def get_report_series():
+    # product names show up in the top products chart
+    return cached(snapshot.cache_key('agg:report_series'), compute_report_series, tags=('transactions', 'products'))
+
+"""abc classes, turnover, days of supply and dead stock per product for parsed params (see analytics.py)."""
+def get_analytics(params):
+    db=snapshot.get_db()
+    config=current_app.config
+    key='analytics:'+json.dumps({**params, 'as_of': params['as_of'].isoformat()}, sort_keys=True)
+    return cached(snapshot.cache_key(key),
+                  lambda: analytics.compute(db, analytics.get_store(), params, config['ANALYTICS_ABC_A'], config['ANALYTICS_ABC_B']),
+                  tags=('transactions', 'products'))
 
 
 # ---BONUS POINT Im integrating TogetherAI API as some modles are free on it ive used it because i had a good experience with it in my personal projects ---
+# the client, prompt, result cache and the concurrent batch calls live in reorder_ai.py
+
+"""units sold and purchased per product over the last 30 days, for all given products in one query."""
+def get_30_day_movements(product_ids):
+    movements={product_id: {'sale': 0, 'purchase': 0} for product_id in product_ids}
+    if not movements:
+        return movements
+    thirty_days_ago =(datetime.now()-timedelta(days=30)).strftime('%Y-%m-%d')
+    marks=','.join('?' * len(movements))
+    rows=get_db().execute(f'''
+        SELECT product_id, type, SUM(quantity) as total_quantity
+        FROM "Transaction"
+        WHERE product_id IN ({marks}) AND date >= ?
+        GROUP BY product_id, type
+    ''', (*movements, thirty_days_ago)).fetchall()
+    for row in rows:
+        movements[row['product_id']][row['type']]=row['total_quantity']
+    return movements
+
 def suggest_reorder_quantity_from_ai(product_id):
 
-    db =get_db()
     product= get_product_by_id(product_id)
 
     if not product:
         return {"error": "Product not found."}, 404
 
     # calculate sales/purchases for the last 30 days
-    thirty_days_ago =(datetime.now()-timedelta(days=30)).strftime('%Y-%m-%d')
-    transactions_30_days_raw =db.execute('''
-        SELECT type, SUM(quantity) as total_quantity
-        FROM "Transaction"
-        WHERE product_id = ? AND date >= ?
-        GROUP BY type
-    ''', (product_id,thirty_days_ago)).fetchall()
-
-    total_sales_30_days=0
-    total_purchases_30_days=0
-    for txn in transactions_30_days_raw:
-        if txn['type']=='sale':
-            total_sales_30_days+= txn['total_quantity']
-        elif txn['type'] =='purchase':
-            total_purchases_30_days+=txn['total_quantity']
-
-    prompt_text = (
-        f"suggest an optimal reorder quantity for {product['name']} (SKU: {product['sku']}). " # we target the product using 'sku'
-        f"current stock: {product['stock_quantity']} units. "
-        f"transaction history for the last 30 days: {total_sales_30_days} units sold, "
-        f"{total_purchases_30_days} units purchased. "
-        "consider a typical lead time of 7 days and aim to maintain stock for approximately 30 days of sales. "
-        "output your suggestion strictly as a JSON object with two keys: 'reorder_quantity' (integer) and 'reasoning' (string)."
-        "for example: {'reorder_quantity': 100, 'reasoning': 'Based on average sales and safety stock.'}"
-    )
-
-#as of now we arent taking this protoype to a production level so i believe its okay to hardcode the api key here or else we could have stored it in env variable
-    client = Together(api_key="")
-    try:
-        response = client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free", # Specified model
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt_text
-                }
-            ],
-            response_format={"type": "json_object"}
-        )
-
-        if response.choices and response.choices[0].message and response.choices[0].message.content is not None:
-            ai_response_content=response.choices[0].message.content
-            print(f"DEBUG: Raw AI Response Content: '{ai_response_content}'")
-
-            if not ai_response_content.strip(): # Check if content is empty or just whitespace
-                return {"error": "AI returned an empty response."}, 500
-
-            try:
-                ai_data=json.loads(ai_response_content)
-                reorder_qty=ai_data.get('reorder_quantity')
-                reasoning=ai_data.get('reasoning', 'No specific reasoning provided.')
-
-                if isinstance(reorder_qty, int) and reorder_qty >= 0:
-                    return {"reorder_quantity": reorder_qty, "reasoning": reasoning}, 200
-                else:
-                    return {"error": "AI returned an invalid reorder quantity format or value."}, 500
-            except json.JSONDecodeError as e:
-                # This block will now catch the "Expecting value" error
-                print(f"ERROR: JSON Decode Error: {e} with raw content: '{ai_response_content}'")
-                return {"error": f"Failed to parse AI response as JSON: {e}. Raw response: {ai_response_content}"}, 500
+    movement=get_30_day_movements([product_id])[product_id]
+    return reorder_ai.suggest(current_app.config, product, movement['sale'], movement['purchase'])
+
+# --- Local reorder-point engine (default) ---
+# forecast.py computes reorder quantities for every product from the ledger in one pass;
+# the model is only asked to word an explanation when ?explain=1 is passed.
+
+"""forecast rows (see forecast.compute) for all products or the given ids, as a list."""
+def get_reorder_forecasts(product_ids=None, params=None):
+    if params is None and product_ids is None:
+        # the default full run is reused until the ledger or products change
+        default_params=forecast.ForecastParams.from_config(current_app.config)
+        return cached('agg:reorder_forecasts',
+                      lambda: list(forecast.compute(get_db(), default_params).values()),
+                      tags=('transactions', 'products'))
+    params=params or forecast.ForecastParams.from_config(current_app.config)
+    return list(forecast.compute(get_db(), params, product_ids).values())
+
+def suggest_reorder_quantity(product_id, explain=False):
+    params=forecast.ForecastParams.from_config(current_app.config)
+    rows=get_reorder_forecasts([product_id], params)
+    if not rows:
+        return {"error": "Product not found."}, 404
+    row=rows[0]
+    result={**row, "reasoning": forecast.reasoning(row, params), "source": "local"}
+    if explain:
+        ai_result,status=reorder_ai.explain(current_app.config, row, params.lead_time_days, params.cover_days)
+        if status==200:
+            result.update(reasoning=ai_result['reasoning'], source="local+ai")
         else:
-            return {"error": "Unexpected Together AI response format or missing content."}, 500
-
-    except Exception as e:
-        print(f"An error occurred during Together AI integration: {e}")
-        return {"error": f"Failed to get AI suggestion from Together API: {e}"}, 500
+            # the number is still valid without the wording, keep the local reasoning
+            result['ai_error']=ai_result.get('error')
+    return result, 200
+
+"""ai suggestions for several products (default: every low stock product), called concurrently."""
+def suggest_reorder_batch(product_ids=None):
+    if product_ids:
+        products_list=[p for p in (get_product_by_id(pid) for pid in product_ids) if p]
+    else:
+        products_list=get_low_stock_products()
+    movements=get_30_day_movements([p['id'] for p in products_list])
+    items=[(p, movements[p['id']]['sale'], movements[p['id']]['purchase']) for p in products_list]
+
+    suggestions=[]
+    for product,result,status in reorder_ai.suggest_many(current_app.config, items):
+        suggestions.append({"product_id": product['id'],
+                            "name": product['name'],
+                            "sku": product['sku'],
+                            "stock_quantity": product['stock_quantity'],
+                            "status": status,
+                            **result})
+    return suggestions
+
+
+# --- Background jobs ---
+# slow work (model calls, report rebuilds, big imports) can be handed to worker processes
+# started with `flask --app app jobs-worker`; the queue lives in the Job table, see jobs.py.
+# web endpoints only queue when a worker is alive and otherwise do the work inline.
+
+@jobs.task('reorder_suggestion', concurrency=Config.AI_MAX_CONCURRENCY)
+def reorder_suggestion_job(product_id, explain=False, mode='local'):
+    """the same answer as /api/suggest_reorder/<product_id>. model errors are retried."""
+    if mode=='ai':
+        result,status=suggest_reorder_quantity_from_ai(product_id)
+    else:
+        result,status=suggest_reorder_quantity(product_id, explain=explain)
+    if status==404:
+        raise jobs.JobError(result['error'])
+    if status!=200:
+        raise RuntimeError(result.get('error', f'status {status}'))
+    return result
+
+@jobs.task('rebuild_reports', concurrency=1)
+def rebuild_reports_job():
+    """recomputes MonthlyRollup from the ledger and brings the valuation up to date."""
+    db=get_db()
+    with write_transaction(db):
+        for statement in migrations.ROLLUP_REBUILD_SQL:
+            db.execute(statement)
+    refresh_valuation()
+    invalidate('transactions')
+    return {"rollup_rows": db.execute('SELECT COUNT(*) FROM MonthlyRollup').fetchone()[0]}
+
+# an import commits batch by batch, running it again would insert the first batches twice
+@jobs.task('import', concurrency=1, max_attempts=1)
+def import_job(kind, path, fmt):
+    """bulk import of an upload saved by /import/<kind>?async=1, the file is removed afterwards."""
+    if kind not in IMPORTERS:
+        raise jobs.JobError(f"Unknown import type '{kind}'.")
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            result=IMPORTERS[kind](get_db(), stream, fmt,
+                                   batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+                                   max_errors=current_app.config['IMPORT_MAX_ERRORS'])
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    invalidate('products', 'transactions')
+    return result.to_dict()
+
+# kinds clients may queue through POST /api/jobs (imports go through /import/<kind>?async=1)
+CLIENT_JOB_KINDS = ('reorder_suggestion', 'rebuild_reports')
+
+"""queues a job if a worker is serving the queue. returns the 202 response, or None to run inline."""
+def queue_job_response(kind, payload, dedupe=True):
+    if not jobs.workers_alive(get_db()):
+        return None
+    return enqueue_job_response(kind, payload, dedupe)
+
+"""queues a job and returns its 202 response, for callers that already know a worker is up."""
+def enqueue_job_response(kind, payload, dedupe=True):
+    job_id=jobs.enqueue(get_db(), kind, payload, max_attempts=current_app.config['JOB_MAX_ATTEMPTS'], dedupe=dedupe)
+    status_url=url_for('api_job', job_id=job_id)
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": status_url}), 202, {'Location': status_url}
 
 
 # --- Routes ---
 
-@app.route('/')
-@app.route('/dashboard')
+@route('/')
+@route('/dashboard')
 def dashboard():
-    """if available stock of x product < 10 then add x in low_stoc_products."""
-    db=get_db()
-
-    total_products=db.execute('SELECT COUNT(*) FROM Product').fetchone()[0]
-
-    total_value_row=db.execute('SELECT SUM(stock_quantity * unit_price) FROM Product').fetchone()
-    total_value= round(total_value_row[0] if total_value_row[0] is not None else 0, 2)
-
-    low_stock_products =db.execute('''
-        SELECT p.*, s.name AS supplier_name
-        FROM Product p
-        LEFT JOIN Supplier s ON p.supplier_id = s.id
-        WHERE p.stock_quantity < 10
-        ORDER BY p.stock_quantity ASC
-    ''').fetchall()
-    low_stock_count= len(low_stock_products)
-
-    total_transactions=db.execute('SELECT COUNT(*) FROM "Transaction"').fetchone()[0]
+    """summary cards and the products below their reorder level, kept current by /api/alerts/stream."""
+    summary=get_inventory_summary()
+    db=snapshot.get_db()
+    # read first, from the same data as the table: anything that happens after it
+    # (including changes newer than the reporting snapshot) reaches the page as an event
+    alerts_after=alerts.latest_id(db)
+    def low_stock_card():
+        # queried here, on a miss only, not taken from the aggregate cache: that one is
+        # per worker and may still hold a list older than the versions in the key
+        low_stock_products=query_low_stock_products(db)
+        return {'html': render_template('_low_stock_card.html', low_stock_products=low_stock_products),
+                'count': len(low_stock_products)}
+    # the card also follows the global threshold, which is not a table write
+    card=fragments.cached_for_versions(db, 'low_stock_card', low_stock_card, ('products', 'suppliers'),
+                                       key=f'{alerts_after}:{alerts.default_threshold(db)}')
 
     return render_template('dashboard.html',
-                           total_products=total_products,
-                           total_value=total_value,
-                           low_stock_products=low_stock_products,
-                           low_stock_count=low_stock_count,
-                           total_transactions=total_transactions)
-
-@app.route('/products')
+                           total_products=summary['total_products'],
+                           total_value=summary['total_value'],
+                           low_stock_card=Markup(card['html']),
+                           low_stock_count=card['count'],
+                           alerts_after=alerts_after,
+                           total_transactions=get_transaction_count(),
+                           snapshot_at=snapshot.as_of())
+
+@route('/products')
 def products():
-    """display the product list and a form for adding products"""
-    products_list=get_all_products()
-    suppliers_list=get_all_suppliers()
-    return render_template('products.html', products=products_list,suppliers=suppliers_list)
-
-@app.route('/add_product',methods=['POST'])
+    """display one page of the product list (optionally searched) and a form for adding products"""
+    q=request.args.get('q', '').strip()
+    limit=clamp_int(request.args.get('limit'), current_app.config['PRODUCTS_PAGE_SIZE'], 1, current_app.config['PRODUCTS_MAX_PAGE_SIZE'])
+    cursor=request.args.get('cursor')
+    def context():
+        products_list,next_cursor=get_products_page(q, cursor, limit)
+        return {'products': products_list, 'next_cursor': next_cursor, 'q': q, 'cursor': cursor, 'limit': limit}
+    # supplier names are shown in the table. only the plain first page is cached: searches
+    # and later pages are keyed by what the user typed and would be one entry each
+    first_page=not q and not cursor and limit==current_app.config['PRODUCTS_PAGE_SIZE']
+    product_table=fragments.render(get_db(), 'product_table', '_product_table.html', context,
+                                   ('products', 'suppliers'), cache=first_page)
+    return render_template('products.html', product_table=product_table, suppliers=get_all_suppliers(),
+                           q=q, limit=limit)
+
+@route('/api/products/search', methods=['GET'])
+def api_product_search():
+    """typeahead: top matches for ?q= by name, sku or supplier name"""
+    limit=clamp_int(request.args.get('limit'), current_app.config['SEARCH_LIMIT'], 1, current_app.config['SEARCH_MAX_LIMIT'])
+    return jsonify(search.search_products(get_db(), request.args.get('q', ''), limit))
+
+@route('/add_product',methods=['POST'])
 def add_product():
     """logic for adding a product."""
-    name=request.form['name']
-    sku=request.form['sku']
     try:
-        unit_price=float(request.form['unit_price'])
-        stock_quantity=int(request.form['stock_quantity'])
-        supplier_id=int(request.form['supplier_id'])
-    except ValueError:
-        flash('Invalid input for price, quantity, or supplier. Please ensure they are numbers.', 'danger')
-        return redirect(url_for('products'))
-
-    if unit_price <= 0 or stock_quantity < 0:
-        flash('Price must be positive and stock quantity cannot be negative.', 'danger')
+        product=clean_product(request.form)
+    except ValidationError as e:
+        flash(str(e), 'danger')
         return redirect(url_for('products'))
+    name,sku=product['name'],product['sku']
+    unit_price,stock_quantity,supplier_id=product['unit_price'],product['stock_quantity'],product['supplier_id']
 
     db=get_db()
     cursor=db.cursor()
     try:
         cursor.execute('''
-            INSERT INTO Product (name, sku, stock_quantity, unit_price, supplier_id)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (name, sku, stock_quantity, unit_price, supplier_id))
+            INSERT INTO Product (name, sku, stock_quantity, unit_price, supplier_id, reorder_level)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (name, sku, stock_quantity, unit_price, supplier_id, product['reorder_level']))
         db.commit()
+        invalidate('products')
         flash('Product added successfully!', 'success')
     except sqlite3.IntegrityError:
         flash(f'Error: Product with SKU "{sku}" already exists or supplier does not exist.', 'danger')
@@ -315,7 +512,7 @@ def add_product():
         flash(f'An error occurred: {e}', 'danger')
     return redirect(url_for('products'))
 
-@app.route('/edit_product/<int:product_id>', methods=['GET', 'POST'])
+@route('/edit_product/<int:product_id>', methods=['GET', 'POST'])
 def edit_product(product_id):
     """loads the edit product page and handles product updates."""
     db= get_db()
@@ -327,27 +524,25 @@ def edit_product(product_id):
         return redirect(url_for('products'))
 
     if request.method=='POST':
-        name=request.form['name']
-        sku= request.form['sku']
         try:
-            unit_price= float(request.form['unit_price'])
-            stock_quantity= int(request.form['stock_quantity'])
-            supplier_id =int(request.form['supplier_id'])
-        except ValueError:
-            flash('Invalid input for price, quantity, or supplier. Please ensure they are numbers.', 'danger')
-            return redirect(url_for('edit_product',product_id=product_id))
-
-        if unit_price <= 0 or stock_quantity < 0:
-            flash('Price must be positive and stock quantity cannot be negative.', 'danger')
+            cleaned=clean_product(request.form)
+        except ValidationError as e:
+            flash(str(e), 'danger')
             return redirect(url_for('edit_product',product_id=product_id))
+        name,sku=cleaned['name'],cleaned['sku']
+        unit_price,stock_quantity,supplier_id=cleaned['unit_price'],cleaned['stock_quantity'],cleaned['supplier_id']
 
         try:
-            db.execute('''
-                UPDATE Product
-                SET name = ?, sku = ?, stock_quantity = ?, unit_price = ?, supplier_id = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (name, sku, stock_quantity, unit_price, supplier_id, product_id))
-            db.commit()
+            with write_transaction(db):
+                db.execute('''
+                    UPDATE Product
+                    SET name = ?, sku = ?, unit_price = ?, supplier_id = ?, reorder_level = ?,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (name, sku, unit_price, supplier_id, cleaned['reorder_level'], product_id))
+                # a changed stock count goes into the movement ledger as an adjustment
+                stock.set_stock(db, product_id, stock_quantity, datetime.now().strftime('%Y-%m-%d'))
+            invalidate('products')
             flash('Product updated successfully!', 'success')
             return redirect(url_for('products'))
         except sqlite3.IntegrityError:
@@ -358,7 +553,7 @@ def edit_product(product_id):
     return render_template('edit_product.html', product=product, suppliers=suppliers_list)
 
 
-@app.route('/delete_product/<int:product_id>',methods=['POST'])
+@route('/delete_product/<int:product_id>',methods=['POST'])
 def delete_product(product_id):
     """handles deleting a product from the db"""
     db = get_db()
@@ -371,31 +566,39 @@ def delete_product(product_id):
 
         db.execute('DELETE FROM Product WHERE id = ?',(product_id,))
         db.commit()
+        invalidate('products')
         flash('Product deleted successfully!', 'success')
     except Exception as e:
         flash(f'An error occurred while deleting the product: {e}','danger')
     return redirect(url_for('products'))
 
-@app.route('/suppliers')
+@route('/suppliers')
 def suppliers():
     """loads the suppliers page, show all suppliers and add form"""
-    suppliers_list=get_all_suppliers()
-    return render_template('suppliers.html', suppliers=suppliers_list)
+    # product counts are shown in the table
+    supplier_table=fragments.render(get_db(), 'supplier_table', '_supplier_table.html',
+                                    lambda: {'suppliers': get_all_suppliers()}, ('suppliers', 'products'))
+    return render_template('suppliers.html', supplier_table=supplier_table)
 
-@app.route('/add_supplier', methods=['POST'])
+@route('/add_supplier', methods=['POST'])
 def add_supplier():
     """logic for adding a new supplier to the database."""
-    name=request.form['name']
-    contact_email=request.form.get('contact_email')
+    try:
+        supplier=clean_supplier(request.form)
+    except ValidationError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('suppliers'))
+    name,contact_email=supplier['name'],supplier['contact_email']
 
     db=get_db()
     cursor=db.cursor()
     try:
         cursor.execute('''
-            INSERT INTO Supplier (name, contact_email)
-            VALUES (?, ?)
-        ''', (name,contact_email))
+            INSERT INTO Supplier (name, contact_email, default_reorder_level)
+            VALUES (?, ?, ?)
+        ''', (name,contact_email,supplier['default_reorder_level']))
         db.commit()
+        invalidate('suppliers')
         flash('Supplier added successfully!', 'success')
     except sqlite3.IntegrityError:
         flash(f'Error: Supplier with name "{name}" already exists.', 'danger')
@@ -404,7 +607,7 @@ def add_supplier():
     return redirect(url_for('suppliers'))
 
 
-@app.route('/delete_supplier/<int:supplier_id>', methods=['POST'])
+@route('/delete_supplier/<int:supplier_id>', methods=['POST'])
 def delete_supplier(supplier_id):
     """logic for deleting a supplier from the db only if no products are associated."""
     db=get_db()
@@ -415,332 +618,629 @@ def delete_supplier(supplier_id):
         else:
             db.execute('DELETE FROM Supplier WHERE id = ?', (supplier_id,))
             db.commit()
+            invalidate('suppliers')
             flash('Supplier deleted successfully!', 'success')
     except Exception as e:
         flash(f'An error occurred while deleting the supplier: {e}', 'danger')
     return redirect(url_for('suppliers'))
 
-@app.route('/transactions')
+@route('/transactions')
 def transactions():
-    """loads the transactions page... showing transaction history and a form to add new transaction"""
-    transactions_list =get_all_transactions()
-    products_list=get_all_products()
+    """loads the transactions page... showing one page of transaction history and a form to add new transaction"""
+    filters,error=parse_transaction_filters(request.args)
+    if error:
+        flash(error, 'danger')
+        filters={}
+    limit=clamp_int(request.args.get('limit'), current_app.config['TRANSACTIONS_PAGE_SIZE'], 1, current_app.config['TRANSACTIONS_MAX_PAGE_SIZE'])
+    transactions_list,next_cursor=get_transactions_page(filters, request.args.get('cursor'), limit)
+    # products are picked through the search typeahead, only the filtered one is loaded
+    filter_product=get_product_by_id(filters['product_id']) if filters.get('product_id') else None
     current_date=datetime.now().strftime('%Y-%m-%d')
     return render_template('transactions.html',
                            transactions=transactions_list,
-                           products=products_list,
-                           current_date=current_date)
-
-@app.route('/add_transaction',methods=['POST'])
+                           filter_product=filter_product,
+                           current_date=current_date,
+                           filters=filters,
+                           limit=limit,
+                           next_cursor=next_cursor)
+
+@route('/api/transactions', methods=['GET'])
+def api_transactions():
+    """json page of transactions, pass back next_cursor as ?cursor= to get the following page"""
+    filters,error=parse_transaction_filters(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    limit=clamp_int(request.args.get('limit'), current_app.config['TRANSACTIONS_PAGE_SIZE'], 1, current_app.config['TRANSACTIONS_MAX_PAGE_SIZE'])
+    rows,next_cursor=get_transactions_page(filters, request.args.get('cursor'), limit)
+    return jsonify({"transactions": [dict(row) for row in rows],
+                    "next_cursor": next_cursor,
+                    "limit": limit})
+
+@route('/add_transaction',methods=['POST'])
 def add_transaction():
     """logic for adding a new transaction and updating product stock"""
-    product_id=request.form['product_id']
-    transaction_type = request.form['type']
-    date =request.form['date']
     try:
-        quantity=int(request.form['quantity'])
-        unit_price=float(request.form['unit_price'])
-    except ValueError:
-        flash('Invalid input for quantity or price. Please ensure they are numbers.', 'danger')
-        return redirect(url_for('transactions'))
-
-    if quantity <= 0 or unit_price <= 0:
-        flash('Quantity and Unit Price must be positive.', 'danger')
+        txn=clean_transaction(request.form)
+    except ValidationError as e:
+        flash(str(e), 'danger')
         return redirect(url_for('transactions'))
 
     db=get_db()
-    cursor=db.cursor()
-    product=get_product_by_id(product_id)
-
-    if not product:
-        flash('Selected product not found.', 'danger')
-        return redirect(url_for('transactions'))
-
-    new_stock=product['stock_quantity']
-
     try:
-        if transaction_type=='sale':
-            if new_stock < quantity:
-                flash(f'Not enough stock for sale! Only {new_stock} units available for {product["name"]}.', 'danger')
-                return redirect(url_for('transactions'))
-            new_stock-=quantity
-        elif transaction_type == 'purchase':
-            new_stock = quantity+ new_stock
-        else:
-            flash('Invalid transaction type.', 'danger')
-            return redirect(url_for('transactions'))
-
-        cursor.execute('''
-            INSERT INTO "Transaction" (product_id, quantity, type, date, unit_price)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (product_id,quantity,transaction_type,date,unit_price))
-
-        cursor.execute('''
-            UPDATE Product
-            SET stock_quantity = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (new_stock,product_id))
-
-        db.commit()
+        # stock is changed by a guarded UPDATE under the write lock (see stock.py),
+        # so parallel sales can't both spend the same units
+        with write_transaction(db):
+            stock.add_transaction(db, txn['product_id'], txn['type'], txn['quantity'],
+                                  txn['date'], txn['unit_price'])
+        invalidate('transactions', 'products')
         flash('Transaction added and stock updated successfully!', 'success')
+    except StockError as e:
+        flash(str(e), 'danger')
     except Exception as e:
-        db.rollback()
         flash(f'An error occurred during transaction: {e}', 'danger')
     return redirect(url_for('transactions'))
 
 
-@app.route('/edit_transaction/<int:transaction_id>', methods=['GET', 'POST'])
+@route('/edit_transaction/<int:transaction_id>', methods=['GET', 'POST'])
 def edit_transaction(transaction_id):
     """loads the edit transaction page and handles transaction updates"""
     db=get_db()
     transaction=get_transaction_by_id(transaction_id)
-    products_list=get_all_products()
 
     if not transaction:
         flash('Transaction not found.', 'danger')
         return redirect(url_for('transactions'))
 
     if request.method=='POST':
-        new_product_id= int(request.form['product_id'])
-        new_type =request.form['type']
-        new_date_str =request.form['date']
         try:
-            new_quantity=int(request.form['quantity'])
-            new_unit_price=float(request.form['unit_price'])
-        except ValueError:
-            flash('Invalid input for quantity or price. Please ensure they are numbers.', 'danger')
+            cleaned=clean_transaction(request.form)
+        except ValidationError as e:
+            flash(str(e), 'danger')
             return redirect(url_for('edit_transaction',transaction_id=transaction_id))
 
-        if new_quantity <=0 or new_unit_price <= 0:
-            flash('Quantity and Unit Price must be positive.', 'danger')
-            return redirect(url_for('edit_transaction',transaction_id=transaction_id))
-
-        original_txn = get_transaction_by_id(transaction_id)
-        original_product = get_product_by_id(original_txn['product_id'])
-
-        if not original_product:
-            flash('Original product for this transaction not found!', 'danger')
-            return redirect(url_for('transactions'))
-
         try:
-            db_conn=get_db()
-            cursor=db_conn.cursor()
-
-            #revert stock change for the original transaction
-            temp_stock = original_product['stock_quantity']
-            if original_txn['type']== 'sale':
-                temp_stock += original_txn['quantity']
-            elif original_txn['type']=='purchase':
-                temp_stock -=original_txn['quantity']
-
-            #apply new stock change to the affected product
-            target_product=get_product_by_id(new_product_id)
-            if not target_product:
-                flash('New selected product not found!', 'danger')
-                return redirect(url_for('edit_transaction', transaction_id=transaction_id))
-
-            #if product ID changed, adjust stock for original product before applying to new product
-            if original_txn['product_id'] != new_product_id:
-                cursor.execute('UPDATE Product SET stock_quantity = ? WHERE id = ?',
-                               (temp_stock, original_txn['product_id']))
-                current_target_stock=target_product['stock_quantity']
-            else:
-                current_target_stock =temp_stock #  curr product== temp_stock
-
-            if new_type=='sale':
-                if current_target_stock< new_quantity:
-                    flash(f'Not enough stock for sale! Only {current_target_stock} units available for {target_product["name"]}.', 'danger')
-                    db_conn.rollback()
-                    return redirect(url_for('edit_transaction', transaction_id=transaction_id))
-                current_target_stock -=new_quantity
-            elif new_type=='purchase':
-                current_target_stock+=new_quantity
-
-            cursor.execute('''
-                UPDATE Product
-                SET stock_quantity = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (current_target_stock, new_product_id))
-
-
-            #update the transaction record
-            cursor.execute('''
-                UPDATE "Transaction"
-                SET product_id = ?, quantity = ?, type = ?, date = ?, unit_price = ?
-                WHERE id = ?
-            ''', (new_product_id, new_quantity,new_type,new_date_str,new_unit_price,transaction_id))
-            db_conn.commit()
+            # the original transaction is re-read under the write lock, then its stock effect
+            # is reverted and the new one applied with the same guarded updates as add_transaction
+            with write_transaction(db):
+                stock.update_transaction(db, transaction_id, cleaned['product_id'], cleaned['type'],
+                                         cleaned['quantity'], cleaned['date'], cleaned['unit_price'])
+            invalidate('transactions', 'products')
             flash('Transaction updated successfully!','success')
             return redirect(url_for('transactions'))
+        except StockError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('edit_transaction', transaction_id=transaction_id))
         except Exception as e:
-            db_conn.rollback()
             flash(f'An error occurred during transaction update: {e}', 'danger')
 
     return render_template('edit_transaction.html',
                            transaction=transaction,
-                           products=products_list,
-                           current_date=transaction['date'].strftime('%Y-%m-%d'))
+                           current_date=transaction.date.strftime('%Y-%m-%d'))
 
 
-@app.route('/delete_transaction/<int:transaction_id>', methods=['POST'])
+@route('/delete_transaction/<int:transaction_id>', methods=['POST'])
 def delete_transaction(transaction_id):
     """loads deleting a transaction and reverting product stoc"""
     db=get_db()
-    cursor=db.cursor()
-    transaction =get_transaction_by_id(transaction_id)
-
-    if not transaction:
-        flash('Transaction not found.', 'danger')
-        return redirect(url_for('transactions'))
-
-    product_id= transaction['product_id']
-    quantity=transaction['quantity']
-    transaction_type=transaction['type']
-
     try:
-        # get current product stock
-        product=get_product_by_id(product_id)
-        if not product:
-            flash('Associated product not found for this transaction.', 'danger')
-            return redirect(url_for('transactions'))
-
-        new_stock=product['stock_quantity']
-
-        #revert stock change
-        if transaction_type == 'sale':
-            new_stock += quantity
-        elif transaction_type == 'purchase':
-            # ensure stock doesnt go negative if a purchase that made it positive is deleted
-            if new_stock-quantity< 0:
-                 flash(f'Cannot delete purchase transaction. Stock for {product["name"]} would become negative.', 'danger')
-                 return redirect(url_for('transactions'))
-            new_stock-=quantity
-
-        #update product stock
-        cursor.execute('''
-            UPDATE Product
-            SET stock_quantity = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (new_stock,product_id))
-
-        #delete the transaction
-        cursor.execute('DELETE FROM "Transaction" WHERE id = ?', (transaction_id,))
-        db.commit()
+        # reverting a purchase is refused if the units are already sold (stock would go negative)
+        with write_transaction(db):
+            stock.delete_transaction(db, transaction_id)
+        invalidate('transactions', 'products')
         flash('Transaction deleted and stock reverted successfully!', 'success')
+    except StockError as e:
+        flash(str(e), 'danger')
     except Exception as e:
-        db.rollback()
         flash(f'An error occurred while deleting transaction: {e}', 'danger')
     return redirect(url_for('transactions'))
 
 
-@app.route('/reports')
+@route('/reports')
 def reports():
     """loads the reports page with inventory summaries and charts"""
-    db=get_db()
-
-    total_value_row=db.execute('SELECT SUM(stock_quantity * unit_price) FROM Product').fetchone()
-    total_value=round(total_value_row[0] if total_value_row[0] is not None else 0, 2)
-
-    low_stock_products_raw=db.execute('''
-        SELECT p.id, p.name, p.stock_quantity, s.name AS supplier_name
-        FROM Product p
-        LEFT JOIN Supplier s ON p.supplier_id = s.id
-        WHERE p.stock_quantity < 10
-        ORDER BY p.stock_quantity ASC
-    ''').fetchall()
-    low_stock_count =len(low_stock_products_raw)
-
-    supplier_count= db.execute('SELECT COUNT(*) FROM Supplier').fetchone()[0]
-
-
-
-    # sales over time (Units Sold)
-    sales_data_raw=db.execute('''
-        SELECT
-            strftime('%Y-%m', date) as month,
-            SUM(quantity) as total_sold
-        FROM "Transaction"
-        WHERE type = 'sale'
-        GROUP BY month
-        ORDER BY month DESC
-        LIMIT 6
-    ''').fetchall()
-    sales_months= [row['month'] for row in reversed(sales_data_raw)]
-    sales_values=[row['total_sold'] for row in reversed(sales_data_raw)]
-
-    # net sales value over time
-    net_sales_value_raw = db.execute('''
-        SELECT
-            strftime('%Y-%m', date) as month,
-            SUM(quantity * unit_price) as total_sales_value
-        FROM "Transaction"
-        WHERE type = 'sale'
-        GROUP BY month
-        ORDER BY month DESC
-        LIMIT 6
-    ''').fetchall()
-    net_sales_months = [row['month'] for row in reversed(net_sales_value_raw)]
-    net_sales_values = [round(row['total_sales_value'], 2) for row in reversed(net_sales_value_raw)]
-
-
-    # net profit over time
-    net_profit_raw= db.execute('''
-        SELECT
-            strftime('%Y-%m', date) as month,
-            SUM(CASE WHEN type = 'sale' THEN quantity * unit_price ELSE 0 END) -
-            SUM(CASE WHEN type = 'purchase' THEN quantity * unit_price ELSE 0 END) AS net_profit
-        FROM "Transaction"
-        GROUP BY month
-        ORDER BY month DESC
-        LIMIT 6
-    ''').fetchall()
-    net_profit_months=[row['month'] for row in reversed(net_profit_raw)]
-    net_profit_values= [round(row['net_profit'], 2) for row in reversed(net_profit_raw)]
-
-
-    top_products_raw=db.execute('''
-        SELECT
-            p.name,
-            SUM(t.quantity) AS total_sold_quantity
-        FROM "Transaction" t
-        JOIN Product p ON t.product_id = p.id
-        WHERE t.type = 'sale'
-        GROUP BY p.name
-        ORDER BY total_sold_quantity DESC
-        LIMIT 5
-    ''').fetchall()
-
-    top_products_names=[row['name'] for row in top_products_raw]
-    top_products_counts=[row['total_sold_quantity'] for row in top_products_raw]
-
-
-    purchase_count=db.execute("SELECT COUNT(*) FROM \"Transaction\" WHERE type = 'purchase'").fetchone()[0]
-    sale_count=db.execute("SELECT COUNT(*) FROM \"Transaction\" WHERE type = 'sale'").fetchone()[0]
-    type_counts= [purchase_count, sale_count]
-
+    summary=get_inventory_summary()
+    low_stock_products=get_low_stock_products()
 
     return render_template('reports.html',
-                           total_value=total_value,
-                           low_stock_count=low_stock_count,
-                           supplier_count=supplier_count,
-                           low_stock_products=low_stock_products_raw,
-                           sales_months=sales_months,
-                           sales_values=sales_values,
-                           net_sales_months=net_sales_months, # New data
-                           net_sales_values=net_sales_values, # New data
-                           net_profit_months=net_profit_months, # New data
-                           net_profit_values=net_profit_values, # New data
-                           top_products_names=top_products_names,
-                           top_products_counts=top_products_counts,
-                           type_counts=type_counts)
-
-@app.route('/api/suggest_reorder/<int:product_id>', methods=['GET'])
+                           total_value=summary['total_value'],
+                           low_stock_count=len(low_stock_products),
+                           supplier_count=get_supplier_count(),
+                           low_stock_products=low_stock_products,
+                           suppliers=get_all_suppliers(),
+                           snapshot_at=snapshot.as_of(),
+                           **get_report_series())
+
+@route('/api/reports', methods=['GET'])
+def api_reports():
+    """units/value sold and bought per day, week or month, transaction counts and top products.
+    ?date_from=&date_to= (default: the last months up to the newest transaction), ?granularity=day|week|month,
+    ?supplier_id=, ?product_id= (repeatable), ?top=. snapshot_at is set when read from the reporting snapshot"""
+    db=snapshot.get_db()
+    date_from,date_to=report_queries.default_range(db, current_app.config['REPORT_DEFAULT_MONTHS'])
+    params,error=report_queries.parse_params(request.args, date_from, date_to, current_app.config['REPORT_MAX_BUCKETS'])
+    if error:
+        return jsonify({'error': error}), 400
+    key='report:'+json.dumps({k: (v.isoformat() if hasattr(v, 'isoformat') else v) for k,v in params.items()},
+                             sort_keys=True)
+    report=cached(snapshot.cache_key(key), lambda: report_queries.summary(db, params), tags=('transactions', 'products'))
+    as_of=snapshot.as_of()
+    return jsonify({**report, 'snapshot_at': as_of.isoformat(timespec='seconds') if as_of else None})
+
+@route('/analytics')
+def analytics_report():
+    """abc classes, turnover and dead stock over ?window_days= ending ?as_of=, with ?dead_days="""
+    params,error=analytics.parse_params(request.args, current_app.config)
+    if error:
+        flash(error, 'danger')
+        params=analytics.default_params(current_app.config)
+    result=get_analytics(params)
+    products=result['products']
+    stocked=[p for p in products if p['stock']>0]
+    return render_template('analytics.html',
+                           result=result,
+                           top_products=products[:25],
+                           slow_movers=sorted(stocked, key=lambda p: (p['turnover'] or 0, -p['stock_value']))[:25],
+                           dead_stock=sorted((p for p in stocked if p['dead_stock']), key=lambda p: -p['stock_value'])[:50],
+                           pareto=analytics.pareto_curve(products),
+                           snapshot_at=snapshot.as_of())
+
+@route('/api/analytics', methods=['GET'])
+def api_analytics():
+    """abc class, turnover, days of supply and dead stock per product, ranked by sales value.
+    ?as_of= (default today), ?window_days=, ?dead_days=; ?abc=A|B|C and ?dead=1 filter the products, ?limit= caps them"""
+    params,error=analytics.parse_params(request.args, current_app.config)
+    if error:
+        return jsonify({'error': error}), 400
+    abc_class=request.args.get('abc')
+    if abc_class and abc_class not in analytics.ABC_CLASSES:
+        return jsonify({'error': 'abc must be A, B or C.'}), 400
+    result=get_analytics(params)
+    products=result['products']
+    if abc_class:
+        products=[p for p in products if p['abc_class']==abc_class]
+    if request.args.get('dead')=='1':
+        products=[p for p in products if p['dead_stock']]
+    limit=clamp_int(request.args.get('limit'), None, 0, len(products))
+    as_of=snapshot.as_of()
+    return jsonify({**result, 'products': products if limit is None else products[:limit],
+                    'snapshot_at': as_of.isoformat(timespec='seconds') if as_of else None})
+
+@route('/api/suggest_reorder/<int:product_id>', methods=['GET'])
 def api_suggest_reorder(product_id):
-    response_data,status_code=suggest_reorder_quantity_from_ai(product_id)
+    """reorder suggestion from the local engine, ?explain=1 adds ai wording, ?mode=ai asks the model for the number too.
+    with ?async=1 the model call is queued when a job worker runs: 202 and a status_url to poll"""
+    mode=request.args.get('mode', current_app.config['REORDER_MODE'])
+    explain=request.args.get('explain')=='1'
+    if request.args.get('async')=='1' and (mode=='ai' or explain):
+        queued=queue_job_response('reorder_suggestion', {"product_id": product_id, "explain": explain, "mode": mode})
+        if queued:
+            return queued
+    if mode=='ai':
+        response_data,status_code=suggest_reorder_quantity_from_ai(product_id)
+    else:
+        response_data,status_code=suggest_reorder_quantity(product_id, explain=explain)
     return jsonify(response_data),status_code
 
+@route('/api/reorder_suggestions', methods=['GET'])
+def api_reorder_suggestions():
+    """local reorder suggestions for every product. ?only_needed=1 keeps the ones to reorder now;
+    lead_time_days, cover_days, lookback_days, service_z, alpha and method override the defaults"""
+    overrides={}
+    try:
+        for key,cast in (('lead_time_days', int), ('cover_days', int), ('lookback_days', int),
+                         ('service_z', float), ('alpha', float), ('method', str)):
+            if request.args.get(key):
+                overrides[key]=cast(request.args[key])
+        params=forecast.ForecastParams.from_config(current_app.config, **overrides) if overrides else None
+    except ValueError as e:
+        return jsonify({"error": f"Invalid forecast parameter: {e}"}), 400
+    rows=get_reorder_forecasts(params=params)
+    if request.args.get('only_needed')=='1':
+        rows=[row for row in rows if row['needs_reorder']]
+    return jsonify({"suggestions": rows, "count": len(rows)})
+
+IMPORTERS = {'products': importer.import_products, 'transactions': importer.import_transactions}
+
+"""csv or jsonl, from an explicit format value or else the file extension."""
+def detect_import_format(filename, fmt=None):
+    if fmt:
+        return fmt.lower()
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return 'csv'
+
+@route('/import/<kind>', methods=['POST'])
+def bulk_import(kind):
+    """bulk import of an uploaded csv/jsonl file (multipart field 'file'), answers with a json summary"""
+    if kind not in IMPORTERS:
+        return jsonify({"error": f"Unknown import type '{kind}'."}), 404
+    upload=request.files.get('file')
+    if upload is None:
+        return jsonify({"error": "No file uploaded (expected multipart field 'file')."}), 400
+    fmt=detect_import_format(upload.filename, request.form.get('format'))
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({"error": "format must be 'csv' or 'jsonl'."}), 400
+
+    if request.args.get('async')=='1' and jobs.workers_alive(get_db()):
+        # the worker reads the file from disk, the request returns as soon as it is saved
+        os.makedirs(current_app.config['JOB_UPLOAD_DIR'], exist_ok=True)
+        path=os.path.abspath(os.path.join(current_app.config['JOB_UPLOAD_DIR'], f'{uuid.uuid4().hex}.{fmt}'))
+        upload.save(path)
+        # no second workers_alive check: it could send us inline with the file already on disk
+        return enqueue_job_response('import', {"kind": kind, "path": path, "fmt": fmt}, dedupe=False)
+
+    # the upload is wrapped, not read: rows are parsed as they stream in
+    stream=io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    result=IMPORTERS[kind](get_db(), stream, fmt,
+                           batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+                           max_errors=current_app.config['IMPORT_MAX_ERRORS'])
+    invalidate('products', 'transactions')
+    return jsonify(result.to_dict()), 200
+
+EXPORT_MIMETYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+"""filters for an export: the ledger filters for transactions, supplier_id for products."""
+def parse_export_filters(kind, args):
+    if kind=='transactions':
+        return parse_transaction_filters(args)
+    if args.get('supplier_id'):
+        try:
+            return {'supplier_id': int(args['supplier_id'])}, None
+        except ValueError:
+            return None, 'supplier_id must be a number.'
+    return {}, None
+
+@route('/export/<kind>', methods=['GET'])
+def export(kind):
+    """streams the full ledger or product list as csv/jsonl (?format=, ?gzip=1, plus filters)"""
+    if kind not in exporter.EXPORTS:
+        return jsonify({"error": f"Unknown export type '{kind}'."}), 404
+    fmt=request.args.get('format', 'csv')
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify({"error": "format must be 'csv' or 'jsonl'."}), 400
+    filters,error=parse_export_filters(kind, request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    gzip=request.args.get('gzip') in ('1', 'true', 'yes')
+
+    filename=f"{kind}-{datetime.now().strftime('%Y%m%d')}.{fmt}" + ('.gz' if gzip else '')
+    rows=exporter.export_rows(snapshot.get_db(), kind, filters, fmt, gzip=gzip,
+                              chunk_rows=current_app.config['EXPORT_CHUNK_ROWS'])
+    headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    as_of=snapshot.as_of()
+    if as_of:
+        headers['X-Snapshot-At']=as_of.isoformat(timespec='seconds')
+    # stream_with_context keeps the request (and its connection) alive until the last chunk
+    return Response(stream_with_context(rows),
+                    mimetype='application/gzip' if gzip else EXPORT_MIMETYPES[fmt],
+                    headers=headers)
+
+@route('/api/suggest_reorder/batch', methods=['GET'])
+def api_suggest_reorder_batch():
+    """ai suggestions for all low stock products, or the ones given as ?product_id=1&product_id=2"""
+    try:
+        product_ids=[int(pid) for pid in request.args.getlist('product_id')]
+    except ValueError:
+        return jsonify({"error": "product_id must be a number."}), 400
+    started=datetime.now()
+    suggestions=suggest_reorder_batch(product_ids)
+    elapsed_ms=round((datetime.now()-started).total_seconds()*1000)
+    return jsonify({"suggestions": suggestions, "elapsed_ms": elapsed_ms, "ai_stats": reorder_ai.stats()})
+
+@route('/api/stock_at', methods=['GET'])
+def api_stock_at():
+    """point-in-time stock and value per product at the end of ?date= (default today), from snapshots + movements"""
+    as_of=request.args.get('date') or datetime.now().strftime('%Y-%m-%d')
+    if not is_iso_date(as_of):
+        return jsonify({'error': 'date must be a YYYY-MM-DD date.'}), 400
+    product_ids=None
+    if request.args.get('product_id'):
+        try:
+            product_ids=[int(value) for value in request.args.getlist('product_id')]
+        except ValueError:
+            return jsonify({'error': 'product_id must be a number.'}), 400
+    return jsonify(ledger.inventory_at(get_db(), as_of, product_ids))
+
+@route('/api/valuation', methods=['GET'])
+def api_valuation():
+    """monthly revenue, cogs, gross margin and inventory value at cost; ?product_id= for one product"""
+    months=clamp_int(request.args.get('months'), current_app.config['VALUATION_REPORT_MONTHS'], 1, 600)
+    refresh_valuation()
+    db=get_db()
+    method=current_app.config['VALUATION_METHOD']
+    if request.args.get('product_id'):
+        try:
+            product_id=int(request.args['product_id'])
+        except ValueError:
+            return jsonify({'error': 'product_id must be a number.'}), 400
+        return jsonify({'method': method, **valuation.product_summary(db, product_id, months)})
+    return jsonify({'method': method, 'months': valuation.monthly_summary(db, months)})
+
+@route('/api/jobs', methods=['POST'])
+def api_enqueue_job():
+    """queue a job: {"kind": ..., "payload": {...}}. answers 202 with the job id and its status_url"""
+    data=request.get_json(silent=True) or {}
+    kind=data.get('kind')
+    payload=data.get('payload') or {}
+    if kind not in CLIENT_JOB_KINDS:
+        return jsonify({"error": f"kind must be one of {', '.join(CLIENT_JOB_KINDS)}."}), 400
+    if not isinstance(payload, dict):
+        return jsonify({"error": "payload must be an object."}), 400
+    db=get_db()
+    job_id=jobs.enqueue(db, kind, payload, max_attempts=current_app.config['JOB_MAX_ATTEMPTS'], dedupe=True)
+    status_url=url_for('api_job', job_id=job_id)
+    return jsonify({"job_id": job_id, "status": jobs.get(db, job_id)['status'], "status_url": status_url,
+                    "workers": jobs.workers_alive(db)}), 202, {'Location': status_url}
+
+@route('/api/jobs/<int:job_id>', methods=['GET'])
+def api_job(job_id):
+    """status of one job (queued, running, done, failed) with its result or last error, for polling"""
+    job=jobs.get(get_db(), job_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify(job)
+
+@route('/api/jobs', methods=['GET'])
+def api_jobs():
+    """recent jobs, newest first (?status=, ?kind=, ?limit=), job counts per status and live workers"""
+    status=request.args.get('status')
+    if status and status not in jobs.STATUSES:
+        return jsonify({"error": f"status must be one of {', '.join(jobs.STATUSES)}."}), 400
+    db=get_db()
+    result=jobs.recent(db, status, request.args.get('kind'), clamp_int(request.args.get('limit'), 50, 1, 500))
+    return jsonify({**result, "workers": jobs.workers_alive(db)})
+
+@route('/api/alerts', methods=['GET'])
+def api_alerts():
+    """low stock alerts after ?after=<id> (default: the latest 50), plus the current low stock count"""
+    db=get_db()
+    after=request.args.get('after')
+    after=clamp_int(after, 0, 0, 2**63 - 1) if after is not None else max(0, alerts.latest_id(db) - 50)
+    return jsonify({'alerts': alerts.since(db, after), 'low_count': alerts.low_count(db),
+                    'default_threshold': alerts.default_threshold(db)})
+
+@route('/api/alerts/stream', methods=['GET'])
+def api_alerts_stream():
+    """server-sent events for low stock crossings after ?after= or the Last-Event-ID of a reconnect"""
+    after=request.headers.get('Last-Event-ID') or request.args.get('after')
+    if after is None:
+        after=alerts.latest_id(get_db())
+    after=clamp_int(after, 0, 0, 2**63 - 1)
+    events=alerts.stream(current_app._get_current_object(), after, current_app.config['ALERT_POLL_INTERVAL'], current_app.config['ALERT_STREAM_SECONDS'])
+    return Response(events, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@route('/api/db_stats', methods=['GET'])
+def api_db_stats():
+    """connection pool counters of this worker for monitoring"""
+    return jsonify(pool_stats())
+
+@route('/api/cache_stats', methods=['GET'])
+def api_cache_stats():
+    """aggregate cache hit/miss counters of this worker"""
+    return jsonify(cache.get_cache().stats())
+
+@route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """request latency, per query timings and pool/cache counters in prometheus text format"""
+    if not metrics.REGISTRY.enabled:
+        return Response('metrics are disabled, set ERP_METRICS_ENABLED=1\n', status=404, mimetype='text/plain')
+    body=metrics.render(pool=pool_stats(), cache=cache.get_cache().stats())
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@route('/api/slow_queries', methods=['GET'])
+def api_slow_queries():
+    """most recent slow statements with their query plans, newest first"""
+    if not metrics.REGISTRY.enabled:
+        return jsonify({'error': 'metrics are disabled, set ERP_METRICS_ENABLED=1'}), 404
+    return jsonify({'threshold_ms': metrics.REGISTRY.slow_query_ms, 'queries': metrics.REGISTRY.slow_queries()})
+
+# --- CLI commands (flask --app app <command>) ---
+
+@commands.command('init-db')
+def init_db_command():
+    """create the tables and apply pending migrations"""
+    init_db()
+
+@commands.command('migrate')
+def migrate_command():
+    """apply pending schema migrations"""
+    db=get_db()
+    applied=migrations.migrate(db)
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
+    print(f"Schema version: {migrations.current_version(db)}")
+
+@commands.command('rebuild-rollup')
+def rebuild_rollup_command():
+    """recompute the MonthlyRollup table from the full ledger"""
+    db=get_db()
+    with write_transaction(db):
+        for statement in migrations.ROLLUP_REBUILD_SQL:
+            db.execute(statement)
+    invalidate('transactions')
+    rows=db.execute('SELECT COUNT(*) FROM MonthlyRollup').fetchone()[0]
+    print(f"MonthlyRollup rebuilt: {rows} rows.")
+
+@commands.command('revalue-stock')
+@click.option('--full', is_flag=True, help='drop the stored valuation and value every product from scratch')
+def revalue_stock_command(full):
+    """bring the inventory valuation (cogs, margin, value at cost) up to date"""
+    db=get_db()
+    method=current_app.config['VALUATION_METHOD']
+    with write_transaction(db):
+        if full:
+            valuation.reset(db, method)
+        count=valuation.refresh(db, method)
+    invalidate('transactions')
+    print(f"Revalued {count} products ({method}).")
+
+@commands.command('refresh-snapshot')
+def refresh_snapshot_command():
+    """copy the database to the reporting snapshot now (see snapshot.py)"""
+    taken=snapshot.refresh()
+    print(f"Snapshot written to {snapshot.path()} at {datetime.fromtimestamp(taken).strftime('%Y-%m-%d %H:%M:%S')}.")
+
+@commands.command('analytics-refresh')
+def analytics_refresh_command():
+    """load new ledger rows into the analytics columns and save them to their file (see analytics.py)"""
+    store=analytics.get_store()
+    added=store.refresh(snapshot.get_db())
+    store.save()
+    print(f"Loaded {added} new movements, {len(store)} in total, saved to {store.cache_path or 'nowhere (cache disabled)'}.")
+
+@commands.command('vendor-assets')
+@click.option('--force', is_flag=True, help='download again even if the file is there')
+def vendor_assets_command(force):
+    """download the pinned Bootstrap and Chart.js files into static/vendor (see assets.py)"""
+    for name,size in assets.download_vendor(current_app.static_folder, force):
+        print(f"{name}: {'kept' if size is None else f'{size} bytes'}")
+
+@commands.command('jobs-worker')
+@click.option('--processes', default=1, show_default=True, help='worker processes to start')
+@click.option('--threads', type=int, default=None, help='jobs run at once per process (ERP_JOB_WORKER_THREADS)')
+@click.option('--kind', 'kinds', multiple=True, type=click.Choice(sorted(jobs.TASKS)), help='only run these job kinds')
+def jobs_worker_command(processes, threads, kinds):
+    """run background job workers until interrupted (SIGINT/SIGTERM finish the running jobs first)"""
+    threads=threads or current_app.config['JOB_WORKER_THREADS']
+    print(f"Job workers: {processes} process(es) x {threads} thread(s), kinds: {', '.join(kinds or sorted(jobs.TASKS))}")
+    jobs.run_workers(current_app._get_current_object(), __name__, processes, threads, list(kinds) or None)
+
+@commands.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(IMPORTERS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='defaults to the file extension')
+def import_data_command(kind, path, fmt):
+    """bulk import products or transactions from a csv/jsonl file"""
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        result=IMPORTERS[kind](get_db(), stream, detect_import_format(path, fmt),
+                               batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+                               max_errors=current_app.config['IMPORT_MAX_ERRORS'])
+    invalidate('products', 'transactions')
+    summary=result.to_dict()
+    print(f"{summary['rows']} rows read, {summary['inserted']} imported, {summary['error_count']} rejected.")
+    for error in summary['errors']:
+        print(f"  line {error['line']}: {error['error']}")
+
+@commands.command('export-data')
+@click.argument('kind', type=click.Choice(sorted(exporter.EXPORTS)))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(sorted(EXPORT_MIMETYPES)), default='csv')
+@click.option('--gzip', is_flag=True, help='gzip the output')
+@click.option('--product-id', type=int, help='transactions only')
+@click.option('--type', 'transaction_type', type=click.Choice(['purchase', 'sale']), help='transactions only')
+@click.option('--date-from', help='YYYY-MM-DD, transactions only')
+@click.option('--date-to', help='YYYY-MM-DD, transactions only')
+@click.option('--supplier-id', type=int, help='products only')
+def export_data_command(kind, path, fmt, gzip, product_id, transaction_type, date_from, date_to, supplier_id):
+    """stream the ledger or product list to a csv/jsonl file"""
+    args={'product_id': product_id, 'type': transaction_type, 'date_from': date_from,
+          'date_to': date_to, 'supplier_id': supplier_id}
+    filters,error=parse_export_filters(kind, {key: str(value) for key, value in args.items() if value is not None})
+    if error:
+        raise click.BadParameter(error)
+    with open(path, 'wb') as out:
+        for chunk in exporter.export_rows(get_db(), kind, filters, fmt, gzip=gzip,
+                                          chunk_rows=current_app.config['EXPORT_CHUNK_ROWS']):
+            out.write(chunk)
+    print(f"Exported {kind} to {path}.")
+
+@commands.command('explain-hot-queries')
+def explain_hot_queries_command():
+    """print EXPLAIN QUERY PLAN for the hot queries and flag full table scans"""
+    for name,result in migrations.check_hot_queries(get_db()).items():
+        print(f"{name}: {'indexed' if result['indexed'] else 'FULL SCAN'}")
+        for step in result['plan']:
+            print(f"    {step}")
+
+@commands.command('snapshot-stock')
+@click.option('--date', 'as_of', help='YYYY-MM-DD, defaults to today')
+@click.option('--backfill', is_flag=True, help='also snapshot every past month end that has none yet')
+@click.option('--rebuild', is_flag=True, help='drop all snapshots and backfill them from the ledger')
+def snapshot_stock_command(as_of, backfill, rebuild):
+    """store per-product stock snapshots (run daily or monthly from cron)"""
+    if as_of and not is_iso_date(as_of):
+        raise click.BadParameter('date must be YYYY-MM-DD')
+    db=get_db()
+    if rebuild:
+        with write_transaction(db):
+            db.execute('DELETE FROM StockSnapshot')
+            db.execute('DELETE FROM StockSnapshotRun')
+        backfill=True
+    days=ledger.missing_month_end_snapshots(db) if backfill else []
+    days.append(as_of or datetime.now().strftime('%Y-%m-%d'))
+    # oldest first, so each snapshot starts from the one before it
+    for day in sorted(set(days)):
+        with write_transaction(db):
+            count=ledger.take_snapshot(db, day)
+        print(f"Snapshot {day}: {count} products with stock.")
+
+@commands.command('reconcile-stock')
+@click.option('--fix', is_flag=True, help='append adjustment movements so the ledger matches stock_quantity')
+def reconcile_stock_command(fix):
+    """check every product's stock_quantity against its movement ledger and snapshots"""
+    db=get_db()
+    mismatches=ledger.reconcile(db)
+    for row in mismatches:
+        print(f"product {row['product_id']} ({row['name']}): stock {row['stock_quantity']}, "
+              f"ledger {row['ledger_quantity']}, snapshots {row['snapshot_quantity']}")
+    if not mismatches:
+        print("Stock matches the ledger for every product.")
+        return
+    if not fix:
+        raise SystemExit(f"{len(mismatches)} products do not reconcile.")
+    today=datetime.now().strftime('%Y-%m-%d')
+    with write_transaction(db):
+        for row in mismatches:
+            if row['difference']:
+                stock.record_movement(db, row['product_id'], row['difference'], today, 'reconcile')
+    print(f"Recorded {sum(1 for row in mismatches if row['difference'])} reconciling adjustments.")
+    remaining=ledger.reconcile(db)
+    if remaining:
+        # stock and ledger agree now, so what is left is a snapshot that is wrong
+        raise SystemExit(f"{len(remaining)} products still differ from their snapshots, run snapshot-stock --rebuild.")
+
+# --- App factory ---
+
+"""builds the app: settings from config.Config (each overridable with ERP_* variables), the
+pooled db, cache, snapshot and metrics hooks, the json api and this module's views and commands.
+
+with DB_INIT_ON_START the schema is created/migrated right here. under gunicorn with
+preload_app (gunicorn.conf.py) that happens once in the master before any worker forks,
+so the connections used for it are closed again: a sqlite handle must not cross a fork.
+"""
+def create_app(config=Config):
+    app=Flask(__name__)
+    app.config.from_object(config)
+    app.secret_key=app.config['SECRET_KEY']
+
+    # get_db() hands out one pooled connection per request (cached on g) and
+    # the teardown registered here puts it back into the pool, see db.py
+    init_db_app(app)
+    # after_request hooks run in reverse order, so compression (registered first) runs last
+    compress.init_app(app)
+    assets.init_app(app)
+    cache.init_app(app)
+    snapshot.init_app(app)
+    # ledger columns for /analytics, filled on first use
+    analytics.init_app(app)
+    # request/sql instrumentation, only hooked in when METRICS_ENABLED is set
+    metrics.init_app(app)
+    # versioned json api for suppliers, products and transactions, see api.py
+    app.register_blueprint(api.bp)
+    for rule,view,options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    for command in commands.commands.values():
+        app.cli.add_command(command)
+
+    if app.config['DB_INIT_ON_START']:
+        init_db(app, quiet=True)
+        close_pool(app)
+    return app
+
+# `flask --app app`, gunicorn app:app and the job workers use this instance
+app=create_app()
+
 if __name__=='__main__':
-    with app.app_context():
-        init_db()
     app.run(debug=True)
 
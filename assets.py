@@ -0,0 +1,90 @@
+"""static assets: vendored front-end libraries and fingerprinted urls with long-lived caching.
+
+the pages need Bootstrap and Chart.js. `flask vendor-assets` downloads the pinned
+versions below into static/vendor once (commit them, or run it when building the
+deployment), after which no page load needs the internet. until a file is there,
+vendor_url() falls back to the same pinned file on jsDelivr.
+
+asset_url() / vendor_url() add ?v=<content hash> to a static url. such a url never
+changes meaning, so it is served with a one year, immutable Cache-Control and the
+browser does not even revalidate it; a changed file gets a new hash and a new url.
+plain static urls keep flask's default (revalidate with the ETag every time).
+"""
+import hashlib
+import os
+import threading
+import urllib.request
+
+from flask import current_app, request, url_for
+
+# file in static/vendor -> pinned source
+VENDOR = {
+    'bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'chart.umd.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js',
+}
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_digests = {}  # path -> (mtime, size, digest)
+_digests_lock = threading.Lock()
+
+
+def digest(path):
+    """short content hash of a file, recomputed only when its mtime or size changes."""
+    stat = os.stat(path)
+    entry = _digests.get(path)
+    if entry is None or entry[:2] != (stat.st_mtime, stat.st_size):
+        with open(path, 'rb') as f:
+            value = hashlib.sha256(f.read()).hexdigest()[:12]
+        entry = (stat.st_mtime, stat.st_size, value)
+        with _digests_lock:
+            _digests[path] = entry
+    return entry[2]
+
+
+def asset_url(filename):
+    """url of static/<filename> with its content hash."""
+    path = os.path.join(current_app.static_folder, filename)
+    return url_for('static', filename=filename, v=digest(path))
+
+
+def vendor_url(name):
+    """the vendored copy of a VENDOR file if present, else its pinned CDN url."""
+    if os.path.exists(os.path.join(current_app.static_folder, 'vendor', name)):
+        return asset_url(f'vendor/{name}')
+    return VENDOR[name]
+
+
+def download_vendor(static_folder, force=False):
+    """fetches every VENDOR file into static/vendor. returns [(name, bytes or None if kept)]."""
+    target = os.path.join(static_folder, 'vendor')
+    os.makedirs(target, exist_ok=True)
+    results = []
+    for name, url in VENDOR.items():
+        path = os.path.join(target, name)
+        if os.path.exists(path) and not force:
+            results.append((name, None))
+            continue
+        with urllib.request.urlopen(url, timeout=30) as response:
+            data = response.read()
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+        results.append((name, len(data)))
+    return results
+
+
+def _cache_headers(response):
+    if request.endpoint == 'static' and response.status_code in (200, 304) and request.args.get('v'):
+        path = os.path.join(current_app.static_folder, request.view_args['filename'])
+        # only a hash that matches the file is cached for good, an old one may be refetched
+        if os.path.isfile(path) and request.args['v'] == digest(path):
+            response.headers['Cache-Control'] = IMMUTABLE
+            response.expires = None
+    return response
+
+
+def init_app(app):
+    app.jinja_env.globals.update(asset_url=asset_url, vendor_url=vendor_url)
+    app.after_request(_cache_headers)
@@ -0,0 +1,108 @@
+"""time of the columnar analytics (analytics.py) on a generated database, against a budget.
+
+works on a copy of the database in a temporary directory and prints:
+
+  sqlite load    every StockMovement row read into the numpy columns (a cold process, no file)
+  file load      the same columns mapped in from the saved .npy file, then caught up
+  catch up       loading --append new sales after a refresh (one short read by id)
+  compute        abc classes, turnover, days of supply and dead stock of every product,
+                 best of --runs, against --budget-ms (exit 1 above it)
+  sql group by   for comparison: units and value sold and last sale per product in one
+                 grouped sqlite query (a part of what compute returns)
+
+    python bench/generate_data.py /tmp/bench.db --preset large
+    python bench/bench_analytics.py /tmp/bench.db --runs 5 --budget-ms 1000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SQL_GROUP_BY = '''
+    SELECT product_id, SUM(quantity), SUM(quantity * unit_price), MAX(date)
+    FROM "Transaction"
+    WHERE type = 'sale' AND date >= ? AND date <= ?
+    GROUP BY product_id
+'''
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def _append_sales(path, count):
+    db = sqlite3.connect(path)
+    products = [row[0] for row in db.execute('SELECT id FROM Product')]
+    today = date.today().isoformat()
+    with db:
+        db.executemany('INSERT INTO "Transaction" (product_id, type, quantity, unit_price, date) VALUES (?, ?, ?, ?, ?)',
+                       [(random.choice(products), 'sale', 1, 100.0, today) for _ in range(count)])
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('database', help='generated database (bench/generate_data.py), copied first')
+    parser.add_argument('--runs', type=int, default=5, help='compute runs, the best one is reported')
+    parser.add_argument('--append', type=int, default=1000, help='new sales for the catch up timing')
+    parser.add_argument('--budget-ms', type=float, default=1000.0, help='fail when compute takes longer')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='erp-analytics-')
+    path = os.path.join(workdir, 'analytics.db')
+    source = sqlite3.connect(args.database)
+    target = sqlite3.connect(path)
+    source.backup(target)
+    source.close()
+    target.close()
+    os.environ.update({'ERP_DATABASE': path, 'ERP_CACHE_PATH': os.path.join(workdir, 'cache.db'),
+                       'ERP_ANALYTICS_CACHE_PATH': os.path.join(workdir, 'analytics.npy')})
+
+    import analytics
+    from app import app
+    from db import connection
+
+    with app.app_context(), connection(app) as db:
+        cache_path = app.config['ANALYTICS_CACHE_PATH']
+        store = analytics.ColumnStore()
+        load_ms, rows = _timed(lambda: store.refresh(db))
+        print(f'sqlite load:  {load_ms:8.1f} ms   {rows} movements')
+
+        saved = analytics.ColumnStore(cache_path, save_rows=rows + 1)
+        saved.refresh(db)
+        saved.save()
+        size_mb = os.path.getsize(cache_path) / 2 ** 20
+        file_ms, _ = _timed(lambda: analytics.ColumnStore(cache_path).refresh(db))
+        print(f'file load:    {file_ms:8.1f} ms   {size_mb:.1f} MB .npy')
+
+        _append_sales(path, args.append)
+        catch_up_ms, added = _timed(lambda: store.refresh(db))
+        print(f'catch up:     {catch_up_ms:8.1f} ms   {added} new movements')
+
+        params = analytics.default_params(app.config)
+        compute_ms = min(_timed(lambda: analytics.compute(db, store, params))[0] for _ in range(max(1, args.runs)))
+        result = analytics.compute(db, store, params)
+        print(f'compute:      {compute_ms:8.1f} ms   {result["totals"]["products"]} products, '
+              f'{result["window_days"]} day window, budget {args.budget_ms:.0f} ms')
+
+        end = params['as_of']
+        start = end - timedelta(days=params['window_days'] - 1)
+        sql_ms, _ = _timed(lambda: db.execute(SQL_GROUP_BY, (start.isoformat(), end.isoformat())).fetchall())
+        print(f'sql group by: {sql_ms:8.1f} ms   units/value sold and last sale only')
+
+    ok = compute_ms <= args.budget_ms
+    print('PASS' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""time and memory of loading rows as models records vs the old sqlite3.Row -> dict path.
+
+loads the ledger (with product names, like the transactions page) and the product list
+of a generated database both ways and prints, per 100k rows, the load time and the
+memory the loaded list holds (tracemalloc):
+
+  dict       sqlite3.Row, copied to a dict, date strings parsed up front (the old helpers)
+  records    models.Transaction / models.Product, dates left unread
+  records+   the same records with every date read (parsed on access, cached per string)
+
+    python bench/generate_data.py /tmp/bench.db --preset medium
+    python bench/bench_models.py /tmp/bench.db --rows 100000
+"""
+import argparse
+import gc
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models  # noqa: E402
+
+TRANSACTIONS_SQL = '''
+    SELECT {columns}
+    FROM "Transaction" t
+    JOIN Product p ON t.product_id = p.id
+    ORDER BY t.date DESC, t.id DESC
+    LIMIT ?
+'''
+PRODUCTS_SQL = '''
+    SELECT {columns}
+    FROM Product p
+    LEFT JOIN Supplier s ON p.supplier_id = s.id
+    ORDER BY p.name
+    LIMIT ?
+'''
+OLD_TRANSACTION_COLUMNS = 't.*, p.name AS product_name, p.sku AS product_sku, p.unit_price AS product_current_price'
+OLD_PRODUCT_COLUMNS = 'p.*, s.name AS supplier_name'
+
+
+def _dict_transactions(db, rows):
+    result = []
+    for row in db.execute(TRANSACTIONS_SQL.format(columns=OLD_TRANSACTION_COLUMNS), (rows,)):
+        txn = dict(row)
+        if txn['date']:
+            txn['date'] = datetime.strptime(txn['date'], '%Y-%m-%d')
+        result.append(txn)
+    return result
+
+
+def _dict_products(db, rows):
+    result = []
+    for row in db.execute(PRODUCTS_SQL.format(columns=OLD_PRODUCT_COLUMNS), (rows,)):
+        product = dict(row)
+        for key in ('created_at', 'updated_at'):
+            if product[key]:
+                product[key] = datetime.strptime(product[key], '%Y-%m-%d %H:%M:%S')
+        result.append(product)
+    return result
+
+
+def _record_transactions(db, rows):
+    return models.fetch(db, models.Transaction,
+                        TRANSACTIONS_SQL.format(columns=models.TRANSACTION_COLUMNS), (rows,))
+
+
+def _record_products(db, rows):
+    return models.fetch(db, models.Product, PRODUCTS_SQL.format(columns=models.PRODUCT_COLUMNS), (rows,))
+
+
+def _read_dates(records, fields):
+    for record in records:
+        for field in fields:
+            getattr(record, field)
+    return records
+
+
+def _measure(load, repeat):
+    best = None
+    for _ in range(repeat):
+        models.parse_date.cache_clear()
+        models.parse_timestamp.cache_clear()
+        gc.collect()
+        started = time.perf_counter()
+        rows = load()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        del rows
+    # memory in a separate run, tracemalloc slows allocation down
+    gc.collect()
+    tracemalloc.start()
+    rows = load()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return best, held, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('path', help='a database made by bench/generate_data.py')
+    parser.add_argument('--rows', type=int, default=100_000, help='rows to load per query')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs, the best one is reported')
+    args = parser.parse_args()
+
+    db = sqlite3.connect(args.path)
+    db.row_factory = sqlite3.Row
+    cases = (
+        ('transactions', _dict_transactions, _record_transactions, ('date',)),
+        ('products', _dict_products, _record_products, ('created_at', 'updated_at')),
+    )
+    print(f'{"rows":<14}{"path":<10}{"loaded":>9}{"ms/100k":>11}{"MB/100k":>10}{"bytes/row":>11}')
+    for name, dict_load, record_load, dates in cases:
+        for label, load in (
+                ('dict', lambda: dict_load(db, args.rows)),
+                ('records', lambda: record_load(db, args.rows)),
+                ('records+', lambda: _read_dates(record_load(db, args.rows), dates))):
+            elapsed, held, loaded = _measure(load, args.repeat)
+            if not loaded:
+                print(f'{name:<14}{label:<10}{0:>9}')
+                continue
+            scale = 100_000 / loaded
+            print(f'{name:<14}{label:<10}{loaded:>9}{elapsed * 1000 * scale:>11.1f}'
+                  f'{held * scale / 1e6:>10.1f}{held / loaded:>11.0f}')
+    db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
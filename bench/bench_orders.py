@@ -0,0 +1,117 @@
+"""throughput of multi-line orders: one request per line vs one request per basket.
+
+records the same baskets twice against throwaway databases: first line by line through
+/add_transaction (a write transaction and a commit per line), then a basket at a time
+through POST /api/v1/orders (one write transaction and one commit per basket). prints
+lines/s and baskets/s for both and checks that stock still matches the movement ledger.
+
+    python bench/bench_orders.py --baskets 200 --lines 20
+    python bench/bench_orders.py --synchronous FULL   # an fsync per commit, like a server would
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _make_app(workdir, synchronous):
+    os.environ['ERP_DATABASE'] = os.path.join(workdir, 'single.db')
+    os.environ['ERP_DB_SYNCHRONOUS'] = synchronous
+    sys.path.insert(0, ROOT)
+    import app
+    return app
+
+
+def _prepare(app_module, database, products):
+    # each run gets a fresh database, so drop the pool of the previous one
+    pool = app_module.app.extensions.pop('db_pool', None)
+    if pool is not None:
+        pool.close_all()
+    app_module.app.config['DATABASE'] = database
+    with app_module.app.app_context():
+        app_module.init_db()
+        db = app_module.get_db()
+        db.execute("INSERT INTO Supplier (name) VALUES ('bench')")
+        db.executemany('INSERT INTO Product (name, sku, stock_quantity, unit_price, supplier_id) '
+                       'VALUES (?, ?, 1000000, 10, 1)',
+                       [(f'bench {n}', f'BENCH-{n}') for n in range(products)])
+        db.commit()
+        return [row[0] for row in db.execute('SELECT id FROM Product ORDER BY id')]
+
+
+def _check(app_module):
+    with app_module.app.app_context():
+        db = app_module.get_db()
+        # the products were created with their stock, so only the ledger deltas are compared
+        rows = db.execute('''
+            SELECT p.stock_quantity - 1000000,
+                   COALESCE(SUM(CASE WHEN t.type = 'purchase' THEN t.quantity ELSE -t.quantity END), 0)
+            FROM Product p LEFT JOIN "Transaction" t ON t.product_id = p.id
+            GROUP BY p.id
+        ''').fetchall()
+        lines = db.execute('SELECT COUNT(*) FROM "Transaction"').fetchone()[0]
+    return all(stock == ledger for stock, ledger in rows), lines
+
+
+def _baskets(product_ids, baskets, lines, seed):
+    rng = random.Random(seed)
+    return [[{'product_id': rng.choice(product_ids), 'type': 'sale', 'quantity': rng.randint(1, 3),
+              'unit_price': 10, 'date': '2025-01-01'} for _ in range(lines)]
+            for _ in range(baskets)]
+
+
+def run_single(client, orders):
+    started = time.perf_counter()
+    for basket in orders:
+        for line in basket:
+            response = client.post('/add_transaction', data=line)
+            assert response.status_code == 302, response.status_code
+    return time.perf_counter() - started
+
+
+def run_orders(client, orders):
+    started = time.perf_counter()
+    for basket in orders:
+        response = client.post('/api/v1/orders', json={'lines': basket})
+        assert response.status_code == 201, response.get_json()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--baskets', type=int, default=200)
+    parser.add_argument('--lines', type=int, default=20, help='lines per basket')
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--synchronous', default='NORMAL', choices=('OFF', 'NORMAL', 'FULL'),
+                        help='PRAGMA synchronous for the run (FULL syncs every commit)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='erp-orders-')
+    app_module = _make_app(workdir, args.synchronous)
+    client = app_module.app.test_client()
+    total = args.baskets * args.lines
+    print(f'{args.baskets} baskets x {args.lines} lines = {total} lines, '
+          f'synchronous={args.synchronous}')
+
+    ok = True
+    for label, database, run in (('line by line  /add_transaction', 'single.db', run_single),
+                                 ('per basket    /api/v1/orders  ', 'orders.db', run_orders)):
+        product_ids = _prepare(app_module, os.path.join(workdir, database), args.products)
+        orders = _baskets(product_ids, args.baskets, args.lines, args.seed)
+        elapsed = run(client, orders)
+        consistent, recorded = _check(app_module)
+        ok = ok and consistent and recorded == total
+        print(f'{label}: {elapsed:7.2f}s  {total / elapsed:8.0f} lines/s  '
+              f'{args.baskets / elapsed:7.1f} baskets/s  '
+              f'{recorded} recorded, {"OK" if consistent else "MISMATCH"}')
+    print('PASS' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""cold start time of the app, from `python -X importtime -c "import app"`, against a budget.
+
+importing app.py builds the app (create_app: config, pool, blueprints, schema check), so
+this is what every gunicorn master, `flask` command and job worker process pays before
+doing anything. each run is a fresh interpreter on a throwaway copy of the schema; the
+first run creates the schema and is reported separately, the rest are steady restarts.
+prints the best total, the heaviest modules app.py imports, and fails (exit 1) when the total
+is over --budget-ms or a module listed in --forbid (default: the Together SDK and numpy,
+imported on the first model call and the first analytics request) was loaded at startup.
+
+    python bench/bench_startup.py
+    python bench/bench_startup.py --budget-ms 300 --runs 10 --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _importtime(env):
+    # importtime lines: "import time: self [us] | cumulative | imported package", nested by indent
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(cumulative), depth))
+    return modules
+
+
+def _total_ms(modules):
+    return sum(cumulative for _, cumulative, depth in modules if depth == 0) / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5, help='steady restarts, the best one is reported')
+    parser.add_argument('--budget-ms', type=float, default=400.0, help='fail above this import total')
+    parser.add_argument('--forbid', default='together,numpy', help='comma separated modules that must not load at startup')
+    parser.add_argument('--top', type=int, default=10, help='heaviest imports of app.py to list')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='erp-startup-')
+    env = {**os.environ, 'ERP_DATABASE': os.path.join(workdir, 'startup.db'),
+           'ERP_CACHE_PATH': os.path.join(workdir, 'cache.db')}
+    first = _importtime(env)
+    runs = [_importtime(env) for _ in range(max(1, args.runs))]
+    best = min(runs, key=_total_ms)
+    total = _total_ms(best)
+
+    print(f'first start (creates the schema): {_total_ms(first):8.1f} ms')
+    print(f'restart, best of {len(runs)}:           {total:8.1f} ms   budget {args.budget_ms:.0f} ms')
+    # app is the last top-level import; its direct imports are the depth 1 lines between
+    # the top-level import before it (site, at interpreter startup) and itself
+    start = max(i for i, m in enumerate(best[:-1]) if m[2] == 0) + 1
+    app_imports = [m for m in best[start:-1] if m[2] == 1]
+    print(f'\n{best[-1][0]}: {best[-1][1] / 1000:.1f} ms, heaviest imports:')
+    for name, cumulative, _ in sorted(app_imports, key=lambda m: -m[1])[:args.top]:
+        print(f'  {cumulative / 1000:8.1f} ms  {name}')
+
+    loaded = {name for name, _, _ in best}
+    forbidden = [name for name in filter(None, args.forbid.split(','))
+                 if name in loaded or any(module.startswith(name + '.') for module in loaded)]
+    ok = total <= args.budget_ms and not forbidden
+    if forbidden:
+        print(f'\nloaded at startup but should not be: {", ".join(forbidden)}')
+    print('PASS' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""synthetic dataset generator for benchmarks.
+
+builds a fresh database with the app's own schema (init_db, so migrations,
+indexes and triggers are the real ones) and fills it with:
+
+  * suppliers with unique names and emails
+  * products with category prefixed SKUs (LAP-00042), log-normal list prices
+    around a per category base, and Zipf distributed popularity
+  * a ledger over the last N days: sales are drawn by popularity with busier
+    weekends and month ends, purchases restock a product in bulk whenever a sale
+    would otherwise exceed its stock, so stock_quantity always equals the ledger sum
+
+    python bench/generate_data.py /tmp/bench.db --products 2000 --transactions 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CATEGORIES = [
+    # sku prefix, name, base price
+    ('LAP', 'Laptop', 55000), ('SSD', 'SSD', 5000), ('RAM', 'RAM', 2500),
+    ('CHG', 'Charger', 1500), ('MOU', 'Mouse', 600), ('KBD', 'Keyboard', 1200),
+    ('MON', 'Monitor', 12000), ('CAB', 'Cable', 300), ('HDP', 'Headphones', 2500),
+    ('PRN', 'Printer', 9000),
+]
+
+PRESETS = {
+    'small': {'suppliers': 10, 'products': 200, 'transactions': 10_000},
+    'medium': {'suppliers': 50, 'products': 2_000, 'transactions': 100_000},
+    'large': {'suppliers': 200, 'products': 20_000, 'transactions': 1_000_000},
+}
+
+
+def _init_schema(path):
+    os.environ['ERP_DATABASE'] = path
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    app = app_module.app
+    app.config['DATABASE'] = path
+    with app.app_context():
+        app_module.init_db()
+    app.extensions['db_pool'].close_all()
+    del app.extensions['db_pool']
+
+
+def generate(path, suppliers=10, products=200, transactions=10_000, days=365, seed=42,
+             zipf=1.1, purchase_batch=(50, 200)):
+    """writes a new database at path, returns row counts."""
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    rng = random.Random(seed)
+    _init_schema(path)
+
+    import sqlite3
+    db = sqlite3.connect(path)
+    db.execute('PRAGMA synchronous = OFF')
+    db.executemany('INSERT INTO Supplier (id, name, contact_email) VALUES (?, ?, ?)',
+                   [(i, f'Supplier {i:04d}', f'orders@supplier{i:04d}.example')
+                    for i in range(1, suppliers + 1)])
+
+    catalogue = []
+    for i in range(1, products + 1):
+        prefix, label, base = rng.choice(CATEGORIES)
+        price = round(base * rng.lognormvariate(0, 0.35), 2)
+        catalogue.append((i, f'{label} {rng.choice("ABCDEFGHJK")}{rng.randint(10, 999)}',
+                          f'{prefix}-{i:05d}', price, rng.randint(1, suppliers)))
+    # rank 1 is the best seller
+    weights = [1 / (rank ** zipf) for rank in range(1, products + 1)]
+    rng.shuffle(weights)
+
+    # day weights: weekends and the last days of a month are busier
+    start = date.today() - timedelta(days=days - 1)
+    day_list = [start + timedelta(days=n) for n in range(days)]
+    day_weights = [(1.4 if d.weekday() >= 5 else 1.0) * (1.3 if d.day >= 26 else 1.0) for d in day_list]
+
+    # restocking purchases are added as needed, the loop stops once the ledger is full
+    sale_count = transactions
+    sale_days = sorted(rng.choices(range(days), weights=day_weights, k=sale_count))
+    sale_products = rng.choices(range(products), weights=weights, k=sale_count)
+
+    stock = [0] * products
+    ledger = []
+    for day_index, product_index in zip(sale_days, sale_products):
+        if len(ledger) >= transactions:
+            break
+        product_id, _, _, price, _ = catalogue[product_index]
+        day = day_list[day_index].isoformat()
+        quantity = rng.randint(1, 5)
+        if stock[product_index] < quantity:
+            restock = rng.randint(*purchase_batch)
+            ledger.append((product_id, restock, 'purchase', day, round(price * 0.7, 2)))
+            stock[product_index] += restock
+        ledger.append((product_id, quantity, 'sale', day, round(price * rng.uniform(0.95, 1.1), 2)))
+        stock[product_index] -= quantity
+    ledger = ledger[:transactions]
+
+    # recompute stock from exactly the rows kept
+    stock = [0] * products
+    for product_id, quantity, kind, _, _ in ledger:
+        stock[product_id - 1] += quantity if kind == 'purchase' else -quantity
+
+    # products start empty and get their stock from the ledger, so the movement
+    # ledger written by the triggers has no opening balances to double count
+    db.executemany('''
+        INSERT INTO Product (id, name, sku, stock_quantity, unit_price, supplier_id)
+        VALUES (?, ?, ?, 0, ?, ?)
+    ''', catalogue)
+    db.executemany('''
+        INSERT INTO "Transaction" (product_id, quantity, type, date, unit_price)
+        VALUES (?, ?, ?, ?, ?)
+    ''', ledger)
+    db.executemany('UPDATE Product SET stock_quantity = ? WHERE id = ?',
+                   [(stock[pid - 1], pid) for pid, *_ in catalogue])
+    db.commit()
+    db.execute('ANALYZE')
+    db.commit()
+    db.close()
+    return {'suppliers': suppliers, 'products': products, 'transactions': len(ledger)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='generate a synthetic ERP database')
+    parser.add_argument('path')
+    parser.add_argument('--preset', choices=sorted(PRESETS))
+    parser.add_argument('--suppliers', type=int)
+    parser.add_argument('--products', type=int)
+    parser.add_argument('--transactions', type=int)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    sizes = dict(PRESETS[args.preset or 'small'])
+    for key in ('suppliers', 'products', 'transactions'):
+        if getattr(args, key) is not None:
+            sizes[key] = getattr(args, key)
+    started = time.perf_counter()
+    counts = generate(args.path, days=args.days, seed=args.seed, **sizes)
+    print(f"{args.path}: {counts['suppliers']} suppliers, {counts['products']} products, "
+          f"{counts['transactions']} transactions in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
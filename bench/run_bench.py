@@ -0,0 +1,291 @@
+"""route benchmark: latency, throughput and memory per dataset size.
+
+for every dataset size a database is generated once (bench/generate_data.py,
+cached in --data-dir) and copied before each run, since /add_transaction writes.
+the model is replaced by bench/stub_model.py, so reorder calls never leave the machine.
+
+two modes, both run in fresh spawned processes so peak RSS belongs to one dataset:
+
+  * sequential (default): Flask test client, --iterations requests per route,
+    p50/p99 latency and requests/s per route
+  * load (--workers N): N processes x --threads threads hit a weighted route mix
+    for --duration seconds, overall and per route p50/p99 and requests/s
+
+results are printed and written as JSON with --output. pass a previous result file
+as --baseline to fail (exit 1) when a route's p99 got slower than --tolerance allows.
+
+    python bench/run_bench.py --sizes small,medium --iterations 100
+    python bench/run_bench.py --sizes medium --workers 4 --threads 4 --duration 15
+    python bench/run_bench.py --sizes small --output new.json --baseline old.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, BENCH)
+
+import generate_data  # noqa: E402
+import stub_model  # noqa: E402
+
+# name -> (method, weight in the load mix)
+ROUTES = {
+    'dashboard': ('GET', 4),
+    'products': ('GET', 2),
+    'transactions': ('GET', 3),
+    'transactions_filtered': ('GET', 1),
+    'reports': ('GET', 1),
+    'add_transaction': ('POST', 2),
+    'suggest_reorder': ('GET', 2),
+    'suggest_reorder_ai': ('GET', 1),
+}
+
+
+def _request(client, name, rng, product_count):
+    """sends one request of the given kind, returns the status code."""
+    product_id = rng.randint(1, product_count)
+    if name == 'dashboard':
+        return client.get('/').status_code
+    if name == 'products':
+        return client.get('/products').status_code
+    if name == 'transactions':
+        return client.get('/transactions').status_code
+    if name == 'transactions_filtered':
+        return client.get(f'/transactions?product_id={product_id}&type=sale').status_code
+    if name == 'reports':
+        return client.get('/reports').status_code
+    if name == 'add_transaction':
+        return client.post('/add_transaction', data={
+            'product_id': product_id, 'type': 'purchase', 'quantity': rng.randint(1, 20),
+            'unit_price': 100, 'date': time.strftime('%Y-%m-%d')}).status_code
+    if name == 'suggest_reorder':
+        return client.get(f'/api/suggest_reorder/{product_id}').status_code
+    if name == 'suggest_reorder_ai':
+        return client.get(f'/api/suggest_reorder/{product_id}?mode=ai').status_code
+    raise ValueError(name)
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def _summary(latencies, elapsed, errors=0):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(_percentile(latencies, 50) * 1000, 2) if latencies else None,
+        'p99_ms': round(_percentile(latencies, 99) * 1000, 2) if latencies else None,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _load_app(database, env):
+    os.environ.update(env)
+    os.environ['ERP_DATABASE'] = database
+    sys.path.insert(0, ROOT)
+    import app
+    return app.app
+
+
+def _sequential(database, env, routes, iterations, product_count, seed, results):
+    app = _load_app(database, env)
+    client = app.test_client()
+    rng = random.Random(seed)
+    report = {}
+    for name in routes:
+        # one warm-up request so imports and the first pool connection are not counted
+        _request(client, name, rng, product_count)
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            status = _request(client, name, rng, product_count)
+            latencies.append(time.perf_counter() - t0)
+            errors += status >= 400
+        report[name] = _summary(latencies, time.perf_counter() - started, errors)
+    results.put({'routes': report, 'peak_rss_mb': _peak_rss_mb()})
+
+
+def _load_worker(database, env, routes, threads, duration, product_count, seed, results):
+    app = _load_app(database, env)
+    names = list(routes)
+    weights = [ROUTES[name][1] for name in names]
+    deadline = time.perf_counter() + duration
+
+    def run(thread_seed):
+        rng = random.Random(thread_seed)
+        client = app.test_client()
+        samples = []
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights=weights)[0]
+            t0 = time.perf_counter()
+            status = _request(client, name, rng, product_count)
+            samples.append((name, time.perf_counter() - t0, status >= 400))
+        return samples
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        samples = [s for chunk in pool.map(run, range(seed * 1000, seed * 1000 + threads)) for s in chunk]
+    results.put({'samples': samples, 'peak_rss_mb': _peak_rss_mb()})
+
+
+def _dataset(data_dir, size, seed):
+    path = os.path.join(data_dir, f'erp-bench-{size}-{seed}.db')
+    if not os.path.exists(path):
+        print(f'generating {size} dataset ...', flush=True)
+        # in a child process: generation imports the app against the new database
+        context = multiprocessing.get_context('spawn')
+        child = context.Process(target=generate_data.generate, args=(path,),
+                                kwargs=dict(seed=seed, **generate_data.PRESETS[size]))
+        child.start()
+        child.join()
+        if child.exitcode:
+            raise SystemExit(f'generating the {size} dataset failed')
+    return path
+
+
+def run_size(size, args, env):
+    source = _dataset(args.data_dir, size, args.seed)
+    product_count = generate_data.PRESETS[size]['products']
+    workdir = tempfile.mkdtemp(prefix='erp-bench-')
+    database = os.path.join(workdir, 'bench.db')
+    shutil.copyfile(source, database)
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    try:
+        if not args.workers:
+            child = context.Process(target=_sequential, args=(database, env, args.routes, args.iterations,
+                                                              product_count, args.seed, results))
+            child.start()
+            report = results.get()
+            child.join()
+            return {'mode': 'sequential', **report}
+
+        workers = [context.Process(target=_load_worker,
+                                   args=(database, env, args.routes, args.threads, args.duration,
+                                         product_count, args.seed + n, results))
+                   for n in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        outputs = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        # rates over the load window, not process start-up
+        elapsed = args.duration
+        samples = [s for output in outputs for s in output['samples']]
+        per_route = {}
+        for name, latency, failed in samples:
+            per_route.setdefault(name, ([], [0]))
+            per_route[name][0].append(latency)
+            per_route[name][1][0] += failed
+        return {
+            'mode': 'load',
+            'workers': args.workers,
+            'threads': args.threads,
+            'overall': _summary([s[1] for s in samples], elapsed, sum(s[2] for s in samples)),
+            'routes': {name: _summary(lat, elapsed, err[0]) for name, (lat, err) in sorted(per_route.items())},
+            'peak_rss_mb': max(output['peak_rss_mb'] for output in outputs),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_report(size, report):
+    counts = generate_data.PRESETS[size]
+    print(f"\n== {size}: {counts['products']} products, {counts['transactions']} transactions "
+          f"({report['mode']}, peak RSS {report['peak_rss_mb']} MB)")
+    print(f"{'route':24} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9}")
+    rows = list(report['routes'].items())
+    if 'overall' in report:
+        rows.append(('(all)', report['overall']))
+    for name, stats in rows:
+        print(f"{name:24} {stats['requests']:>9} {stats['errors']:>7} {stats['p50_ms']!s:>9} "
+              f"{stats['p99_ms']!s:>9} {stats['throughput_rps']!s:>9}")
+
+
+def regressions(results, baseline, tolerance):
+    """routes whose p99 is more than tolerance (fraction) slower than in the baseline."""
+    found = []
+    for size, report in results.items():
+        old = baseline.get(size)
+        if not old or old.get('mode') != report['mode']:
+            continue
+        for name, stats in report['routes'].items():
+            before = old['routes'].get(name, {}).get('p99_ms')
+            after = stats['p99_ms']
+            if before and after and after > before * (1 + tolerance):
+                found.append(f'{size}/{name}: p99 {before} ms -> {after} ms')
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='small', help=f"comma separated, from {', '.join(generate_data.PRESETS)}")
+    parser.add_argument('--routes', default=','.join(ROUTES), help='comma separated subset of the routes')
+    parser.add_argument('--iterations', type=int, default=50, help='requests per route in sequential mode')
+    parser.add_argument('--workers', type=int, default=0, help='processes for load mode, 0 runs sequentially')
+    parser.add_argument('--threads', type=int, default=4, help='threads per load worker')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load per dataset')
+    parser.add_argument('--model-delay', type=float, default=0.05, help='seconds the stub model takes to answer')
+    parser.add_argument('--no-cache', action='store_true', help='run with the aggregate cache disabled')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=tempfile.gettempdir(), help='where generated datasets are kept')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--baseline', help='earlier --output file to compare p99 against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p99 slowdown, 0.25 = 25%%')
+    args = parser.parse_args()
+
+    args.routes = [name for name in args.routes.split(',') if name]
+    unknown = [name for name in args.routes if name not in ROUTES]
+    sizes = [size for size in args.sizes.split(',') if size]
+    unknown += [size for size in sizes if size not in generate_data.PRESETS]
+    if unknown:
+        parser.error(f"unknown route or size: {', '.join(unknown)}")
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    server, base_url = stub_model.start(delay=args.model_delay)
+    env = {'TOGETHER_API_KEY': 'bench', 'TOGETHER_BASE_URL': base_url,
+           # the cached AI answers would hide the model round trip
+           'ERP_AI_CACHE_TTL': '0'}
+    if args.no_cache:
+        env['ERP_CACHE_ENABLED'] = '0'
+
+    results = {}
+    for size in sizes:
+        results[size] = run_size(size, args, env)
+        print_report(size, results[size])
+    server.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f'REGRESSION {line}')
+        if found:
+            return 1
+        print('no p99 regressions against the baseline')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""concurrency stress check for stock updates.
+
+fires thousands of parallel sales (plus some purchases) at /add_transaction from
+several processes with several threads each, like gunicorn workers would, against
+a throwaway database. afterwards every product's stock_quantity must equal the sum
+of its ledger (purchases - sales) and must never be negative.
+
+the form route always answers with a redirect, so each request is judged by the
+message it flashed: a sale refused for lack of stock is expected once the stock
+runs dry, any other error (e.g. "database is locked") fails the run.
+
+    python bench/stress_stock.py --processes 4 --threads 8 --requests 4000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_app(database):
+    os.environ['ERP_DATABASE'] = database
+    sys.path.insert(0, ROOT)
+    import app
+    return app.app
+
+
+def _post(client, data):
+    """posts one transaction form, returns 'ok', 'short' (refused for lack of stock) or the error."""
+    response = client.post('/add_transaction', data=data)
+    with client.session_transaction() as session:
+        flashes = session.pop('_flashes', [])
+    if response.status_code != 302:
+        return f'HTTP {response.status_code}'
+    if any(category == 'success' for category, _ in flashes):
+        return 'ok'
+    messages = [message for _, message in flashes]
+    if messages and all(message.startswith('Not enough stock') for message in messages):
+        return 'short'
+    return '; '.join(messages) or 'redirect without a message'
+
+
+def _worker(database, product_ids, requests, threads, seed, results):
+    app = _load_app(database)
+    rng = random.Random(seed)
+    jobs = [(rng.choice(product_ids), 'purchase' if rng.random() < 0.1 else 'sale', rng.randint(1, 3))
+            for _ in range(requests)]
+
+    def send(job):
+        product_id, transaction_type, quantity = job
+        return _post(app.test_client(), {
+            'product_id': product_id, 'type': transaction_type, 'quantity': quantity,
+            'unit_price': 10, 'date': '2025-01-01'})
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        outcomes = list(pool.map(send, jobs))
+    results.put(outcomes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=4000, help='total across all processes')
+    parser.add_argument('--products', type=int, default=3)
+    # low enough that the sales run the stock dry and the no-negative guard gets exercised
+    parser.add_argument('--initial-stock', type=int, default=500)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='erp-stress-')
+    database = os.path.join(workdir, 'stress.db')
+    app = _load_app(database)
+    import app as app_module
+    with app.app_context():
+        app_module.init_db()
+        db = app_module.get_db()
+        db.execute("INSERT INTO Supplier (name) VALUES ('stress')")
+        product_ids = []
+        for n in range(args.products):
+            cursor = db.execute('INSERT INTO Product (name, sku, stock_quantity, unit_price, supplier_id) '
+                                'VALUES (?, ?, 0, 10, 1)', (f'stress {n}', f'STRESS-{n}'))
+            product_ids.append(cursor.lastrowid)
+        db.commit()
+    client = app.test_client()
+    for product_id in product_ids:
+        # opening stock goes in as a purchase so the ledger explains all of it
+        outcome = _post(client, {'product_id': product_id, 'type': 'purchase',
+                                 'quantity': args.initial_stock, 'unit_price': 10, 'date': '2025-01-01'})
+        if outcome != 'ok':
+            print(f'opening stock for product {product_id} was rejected: {outcome}')
+            return 1
+
+    # spawn, not fork: children must open their own sqlite connections
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    per_process = args.requests // args.processes
+    started = time.perf_counter()
+    workers = [context.Process(target=_worker,
+                               args=(database, product_ids, per_process, args.threads, seed, results))
+               for seed in range(args.processes)]
+    for worker in workers:
+        worker.start()
+    # drain the queue before joining, a child blocks on exit until its results are read
+    outcomes = [outcome for _ in workers for outcome in results.get()]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    failures = [outcome for outcome in outcomes if outcome not in ('ok', 'short')]
+
+    db = sqlite3.connect(database)
+    rows = db.execute('''
+        SELECT p.id, p.stock_quantity,
+               COALESCE(SUM(CASE WHEN t.type = 'purchase' THEN t.quantity ELSE -t.quantity END), 0),
+               SUM(t.type = 'sale')
+        FROM Product p LEFT JOIN "Transaction" t ON t.product_id = p.id
+        GROUP BY p.id
+    ''').fetchall()
+    ok = not failures
+    total = per_process * args.processes
+    print(f'{total} requests from {args.processes} processes x {args.threads} threads '
+          f'in {elapsed:.2f}s ({total / elapsed:.0f} req/s)')
+    print(f'{outcomes.count("ok")} recorded, {outcomes.count("short")} refused for lack of stock, '
+          f'{len(failures)} rejected unexpectedly')
+    for product_id, stock_quantity, ledger_sum, sales in rows:
+        consistent = stock_quantity == ledger_sum and stock_quantity >= 0
+        ok = ok and consistent
+        print(f'product {product_id}: stock {stock_quantity}, ledger sum {ledger_sum}, '
+              f'{sales} sales recorded -> {"OK" if consistent else "MISMATCH"}')
+    for message in sorted(set(failures)):
+        print(f'rejected {failures.count(message)}x: {message}')
+    print('PASS' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
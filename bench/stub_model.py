@@ -0,0 +1,61 @@
+"""local stand-in for the Together chat completions API.
+
+answers every POST .../chat/completions with a fixed reorder suggestion after an
+optional delay, so the AI code paths can be exercised and timed without network
+access or an API key. point the app at it with TOGETHER_BASE_URL.
+
+    python bench/stub_model.py --port 8765 --delay 0.2
+    TOGETHER_API_KEY=stub TOGETHER_BASE_URL=http://127.0.0.1:8765/v1 python app.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _handler(delay):
+
+    class StubHandler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}')
+            if delay:
+                time.sleep(delay)
+            content = json.dumps({'reorder_quantity': 50,
+                                  'reasoning': 'Stub model: fixed suggestion for benchmarking.'})
+            payload = json.dumps({
+                'id': 'stub', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': body.get('model', 'stub'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': content}}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+def start(port=0, delay=0.0):
+    """runs the stub on a daemon thread, returns (server, base_url)."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), _handler(delay))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/v1'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='local stub of the Together chat completions API')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to wait before answering')
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), _handler(args.delay))
+    print(f'stub model listening on http://127.0.0.1:{args.port}/v1')
+    server.serve_forever()
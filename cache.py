@@ -0,0 +1,247 @@
+"""small cache for read-mostly aggregates (dashboard/report numbers).
+
+entries expire after a TTL and are also dropped as soon as a write route
+invalidates one of their tags ('products', 'suppliers', 'transactions').
+MemoryCache is per worker process; SQLiteCache keeps the entries in a shared
+file so every gunicorn worker sees the same values and invalidations.
+
+keys may carry request values (report ranges, search text), so both backends hold
+at most max_entries: set() drops the expired entries (memory: at most once per
+SWEEP_INTERVAL) and then the least recently used (memory) or the soonest to
+expire (sqlite) ones until there is room.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+SWEEP_INTERVAL = 30  # seconds between sweeps of expired MemoryCache entries
+
+
+class MemoryCache:
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags), least recently used first
+        self._generation = 0
+        self._swept_at = time.time()
+        self._lock = threading.Lock()
+
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _evict(self, now):
+        if now - self._swept_at >= SWEEP_INTERVAL:
+            self._swept_at = now
+            for key in [k for k, entry in self._entries.items() if entry[0] < now]:
+                del self._entries[key]
+        while len(self._entries) >= self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set(self, key, value, ttl, tags=(), generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            now = time.time()
+            self._entries.pop(key, None)
+            self._evict(now)
+            self._entries[key] = (now + ttl, value, frozenset(tags))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def invalidate(self, *tags):
+        tags = set(tags)
+        with self._lock:
+            self._generation += 1
+            for key in [k for k, entry in self._entries.items() if entry[2] & tags]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+class SQLiteCache:
+    """values are stored as JSON, so only cache plain dicts/lists/numbers."""
+
+    def __init__(self, path, max_entries=5000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        # a connection of its own, closed again: the app may be built in a gunicorn
+        # master (preload_app) and a thread local opened here would be inherited by forks
+        db = sqlite3.connect(path, timeout=5, isolation_level=None)
+        db.execute('PRAGMA journal_mode = WAL')
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS cache_entry (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_cache_entry_expires ON cache_entry (expires_at);
+            CREATE TABLE IF NOT EXISTS cache_tag (
+                tag TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (tag, key)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS cache_generation (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                generation INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO cache_generation (id, generation) VALUES (1, 0);
+        ''')
+        db.close()
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute('PRAGMA synchronous = NORMAL')
+            self._local.db = db
+        return db
+
+    def generation(self):
+        return self._db().execute('SELECT generation FROM cache_generation').fetchone()[0]
+
+    def get(self, key):
+        row = self._db().execute('SELECT value, expires_at FROM cache_entry WHERE key = ?',
+                                 (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl, tags=(), generation=None):
+        db = self._db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            if generation is not None and generation != db.execute(
+                    'SELECT generation FROM cache_generation').fetchone()[0]:
+                return
+            now = time.time()
+            # expired rows, then the ones expiring soonest while the file is full
+            stale = db.execute('SELECT key FROM cache_entry WHERE expires_at < ?', (now,)).fetchall()
+            others = db.execute('SELECT COUNT(*) FROM cache_entry WHERE key != ?', (key,)).fetchone()[0]
+            over = others - len(stale) - self.max_entries + 1
+            if over > 0:
+                stale += db.execute('SELECT key FROM cache_entry WHERE expires_at >= ? AND key != ? '
+                                    'ORDER BY expires_at LIMIT ?', (now, key, over)).fetchall()
+            if stale:
+                db.executemany('DELETE FROM cache_entry WHERE key = ?', stale)
+                db.executemany('DELETE FROM cache_tag WHERE key = ?', stale)
+            db.execute('INSERT OR REPLACE INTO cache_entry (key, value, expires_at) VALUES (?, ?, ?)',
+                       (key, json.dumps(value), now + ttl))
+            db.executemany('INSERT OR IGNORE INTO cache_tag (tag, key) VALUES (?, ?)',
+                           [(tag, key) for tag in tags])
+
+    def invalidate(self, *tags):
+        db = self._db()
+        marks = ','.join('?' * len(tags))
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            db.execute(f'DELETE FROM cache_entry WHERE key IN (SELECT key FROM cache_tag WHERE tag IN ({marks}))', tags)
+            db.execute(f'DELETE FROM cache_tag WHERE tag IN ({marks})', tags)
+            db.execute('UPDATE cache_generation SET generation = generation + 1')
+
+    def clear(self):
+        db = self._db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            db.execute('DELETE FROM cache_entry')
+            db.execute('DELETE FROM cache_tag')
+            db.execute('UPDATE cache_generation SET generation = generation + 1')
+
+
+class AggregateCache:
+    """backend plus per-key hit/miss counters (counters are per worker)."""
+
+    def __init__(self, backend, default_ttl=60, enabled=True, max_counters=500):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.enabled = enabled
+        self.max_counters = max_counters
+        self._counters = {}
+        self._totals = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key, field):
+        with self._lock:
+            self._totals[field] += 1
+            # per key counters for the first max_counters keys only, the totals count all
+            counter = self._counters.get(key)
+            if counter is None:
+                if len(self._counters) >= self.max_counters:
+                    return
+                counter = self._counters[key] = {'hits': 0, 'misses': 0}
+            counter[field] += 1
+
+    def get_or_compute(self, key, compute, tags=(), ttl=None):
+        """cached value for key, calling compute() and storing its result on a miss."""
+        if not self.enabled:
+            return compute()
+        value = self.backend.get(key)
+        if value is not None:
+            self._count(key, 'hits')
+            return value
+        self._count(key, 'misses')
+        # if a write invalidates anything while we compute, the result may already be
+        # stale, so the backend skips storing it (the next read recomputes)
+        generation = self.backend.generation()
+        value = compute()
+        self.backend.set(key, value, ttl or self.default_ttl, tags, generation=generation)
+        return value
+
+    def invalidate(self, *tags):
+        if self.enabled and tags:
+            self.backend.invalidate(*tags)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            keys = {key: dict(counter) for key, counter in self._counters.items()}
+            hits, misses = self._totals['hits'], self._totals['misses']
+        return {'backend': type(self.backend).__name__,
+                'enabled': self.enabled,
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+                'keys': keys}
+
+
+def init_app(app):
+    config = app.config
+    if config['CACHE_BACKEND'] == 'sqlite':
+        backend = SQLiteCache(config['CACHE_PATH'], config['CACHE_MAX_ENTRIES'])
+    else:
+        backend = MemoryCache(config['CACHE_MAX_ENTRIES'])
+    app.extensions['aggregate_cache'] = AggregateCache(backend, config['CACHE_DEFAULT_TTL'],
+                                                       enabled=config['CACHE_ENABLED'])
+
+
+def get_cache():
+    return current_app.extensions['aggregate_cache']
+
+
+def cached(key, compute, tags=(), ttl=None):
+    return get_cache().get_or_compute(key, compute, tags, ttl)
+
+
+def invalidate(*tags):
+    get_cache().invalidate(*tags)
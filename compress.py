@@ -0,0 +1,93 @@
+"""gzip / brotli compression of responses, negotiated with Accept-Encoding.
+
+html pages, json and the css/js assets shrink 4-8x, which is most of a page load on
+a slow warehouse LAN. brotli is used when the optional `brotli` package is installed
+and the browser accepts it, gzip (stdlib) otherwise.
+
+left alone: small bodies (COMPRESS_MIN_SIZE), already encoded or streamed responses
+(exports gzip themselves, /api/alerts/stream must flush every event), partial content
+and anything that is not text. compressed static files are kept in memory per file
+version, so an asset is compressed once per process, not per request.
+"""
+import gzip
+import os
+from functools import lru_cache
+
+from flask import current_app, request
+
+import assets
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only
+    brotli = None
+
+COMPRESSIBLE = ('text/', 'application/json', 'application/javascript', 'application/x-ndjson',
+                'image/svg+xml')
+
+
+def _encode(data, encoding, level):
+    if encoding == 'br':
+        # brotli quality 0-11; map the gzip style 1-9 level onto it
+        return brotli.compress(data, quality=min(11, level + 2))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+@lru_cache(maxsize=128)
+def _static_encoded(path, digest, encoding, level):
+    # digest is part of the key: a changed file is compressed again
+    with open(path, 'rb') as f:
+        return _encode(f.read(), encoding, level)
+
+
+def choose_encoding(accept_encoding, allow_brotli=True):
+    """'br', 'gzip' or None for an Accept-Encoding header (q=0 excludes an encoding)."""
+    if brotli is not None and allow_brotli and accept_encoding['br']:
+        return 'br'
+    if accept_encoding['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(response):
+    config = current_app.config
+    # a file served by send_file counts as streamed too, static files are handled below
+    static_file = response.direct_passthrough and request.endpoint == 'static'
+    if (response.status_code not in (200, 201) or (response.is_streamed and not static_file)
+            or 'Content-Encoding' in response.headers
+            or not (response.mimetype or '').startswith(COMPRESSIBLE)):
+        return response
+    encoding = choose_encoding(request.accept_encodings, config['COMPRESS_BROTLI'])
+    if encoding is None:
+        return response
+    level = config['COMPRESS_LEVEL']
+
+    if static_file:
+        # compress the file itself, once per version
+        if response.content_length is None or response.content_length < config['COMPRESS_MIN_SIZE']:
+            return response
+        path = os.path.join(current_app.static_folder, request.view_args['filename'])
+        data = _static_encoded(path, assets.digest(path), encoding, level)
+        response.response.close()
+        response.direct_passthrough = False
+        # ranges are served from the uncompressed file, don't offer them on the encoded body
+        response.headers.pop('Accept-Ranges', None)
+    else:
+        body = response.get_data()
+        if len(body) < config['COMPRESS_MIN_SIZE']:
+            return response
+        data = _encode(body, encoding, level)
+
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # a strong validator belongs to one exact byte sequence, the encoded body is another
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    if app.config['COMPRESS_ENABLED']:
+        app.after_request(_compress)
@@ -0,0 +1,164 @@
+import os
+
+
+class Config:
+    """default settings, every value can be overridden through the environment."""
+    SECRET_KEY = os.environ.get('ERP_SECRET_KEY', 'ERP')
+
+    # --- DB ---
+    DATABASE = os.environ.get('ERP_DATABASE', 'database.db')
+    # max connections handed out at once per worker process, extra requests wait
+    DB_POOL_SIZE = int(os.environ.get('ERP_DB_POOL_SIZE', 8))
+    # seconds a request waits for a free pooled connection before failing
+    DB_POOL_TIMEOUT = float(os.environ.get('ERP_DB_POOL_TIMEOUT', 10))
+    # milliseconds sqlite retries on a locked db before raising "database is locked"
+    DB_BUSY_TIMEOUT_MS = int(os.environ.get('ERP_DB_BUSY_TIMEOUT_MS', 5000))
+    DB_JOURNAL_MODE = os.environ.get('ERP_DB_JOURNAL_MODE', 'WAL')
+    DB_SYNCHRONOUS = os.environ.get('ERP_DB_SYNCHRONOUS', 'NORMAL')
+    DB_MMAP_SIZE = int(os.environ.get('ERP_DB_MMAP_SIZE', 256 * 1024 * 1024))
+    # negative value = size in KiB (sqlite convention), so -16000 is ~16MB per connection
+    DB_CACHE_SIZE = int(os.environ.get('ERP_DB_CACHE_SIZE', -16000))
+    # create/migrate the schema when the app is built (idempotent); with gunicorn
+    # preload_app that is once in the master, see gunicorn.conf.py
+    DB_INIT_ON_START = os.environ.get('ERP_DB_INIT_ON_START', '1') == '1'
+
+    # --- Pagination ---
+    TRANSACTIONS_PAGE_SIZE = int(os.environ.get('ERP_TRANSACTIONS_PAGE_SIZE', 50))
+    TRANSACTIONS_MAX_PAGE_SIZE = int(os.environ.get('ERP_TRANSACTIONS_MAX_PAGE_SIZE', 500))
+    PRODUCTS_PAGE_SIZE = int(os.environ.get('ERP_PRODUCTS_PAGE_SIZE', 50))
+    PRODUCTS_MAX_PAGE_SIZE = int(os.environ.get('ERP_PRODUCTS_MAX_PAGE_SIZE', 500))
+    # typeahead results per query, /api/products/search?limit= is capped at the max
+    SEARCH_LIMIT = int(os.environ.get('ERP_SEARCH_LIMIT', 10))
+    SEARCH_MAX_LIMIT = int(os.environ.get('ERP_SEARCH_MAX_LIMIT', 50))
+
+    # --- JSON API (/api/v1) ---
+    API_PAGE_SIZE = int(os.environ.get('ERP_API_PAGE_SIZE', 100))
+    API_MAX_PAGE_SIZE = int(os.environ.get('ERP_API_MAX_PAGE_SIZE', 1000))
+    # objects per POST /api/v1/<entity>/bulk, created in one transaction
+    API_BULK_MAX_ITEMS = int(os.environ.get('ERP_API_BULK_MAX_ITEMS', 1000))
+    # lines per POST /api/v1/orders
+    ORDER_MAX_LINES = int(os.environ.get('ERP_ORDER_MAX_LINES', 500))
+
+    # --- Aggregate cache ---
+    CACHE_ENABLED = os.environ.get('ERP_CACHE_ENABLED', '1') == '1'
+    # 'memory' (per worker) or 'sqlite' (file shared by all workers on the host)
+    CACHE_BACKEND = os.environ.get('ERP_CACHE_BACKEND', 'memory')
+    CACHE_PATH = os.environ.get('ERP_CACHE_PATH', 'cache.db')
+    CACHE_DEFAULT_TTL = int(os.environ.get('ERP_CACHE_DEFAULT_TTL', 60))
+    # entries kept per backend; past it the least recently used (memory) / soonest expiring (sqlite) go
+    CACHE_MAX_ENTRIES = int(os.environ.get('ERP_CACHE_MAX_ENTRIES', 5000))
+
+    # --- Page fragments, static assets, compression (fragments.py, assets.py, compress.py) ---
+    # cached html of the product/supplier tables and the low stock card; entries are keyed
+    # by data version, so this only bounds how long unused ones are kept
+    FRAGMENT_CACHE_TTL = int(os.environ.get('ERP_FRAGMENT_CACHE_TTL', 3600))
+    COMPRESS_ENABLED = os.environ.get('ERP_COMPRESS_ENABLED', '1') == '1'
+    # bytes; smaller responses are sent as they are
+    COMPRESS_MIN_SIZE = int(os.environ.get('ERP_COMPRESS_MIN_SIZE', 500))
+    # gzip level 1-9 (brotli gets level + 2)
+    COMPRESS_LEVEL = int(os.environ.get('ERP_COMPRESS_LEVEL', 6))
+    # offer brotli when the optional brotli package is installed
+    COMPRESS_BROTLI = os.environ.get('ERP_COMPRESS_BROTLI', '1') == '1'
+
+    # --- Bulk import ---
+    IMPORT_BATCH_SIZE = int(os.environ.get('ERP_IMPORT_BATCH_SIZE', 1000))
+    # per-row errors listed in the import result, the total count is always reported
+    IMPORT_MAX_ERRORS = int(os.environ.get('ERP_IMPORT_MAX_ERRORS', 1000))
+
+    # --- Export ---
+    # rows fetched from the cursor and encoded per streamed chunk
+    EXPORT_CHUNK_ROWS = int(os.environ.get('ERP_EXPORT_CHUNK_ROWS', 1000))
+
+    # --- AI reorder suggestions (Together) ---
+    TOGETHER_API_KEY = os.environ.get('TOGETHER_API_KEY', '')
+    # point at a local stub of the chat completions API for tests/benchmarks
+    TOGETHER_BASE_URL = os.environ.get('TOGETHER_BASE_URL', '')
+    AI_MODEL = os.environ.get('ERP_AI_MODEL', 'meta-llama/Llama-3.3-70B-Instruct-Turbo-Free')
+    # seconds per model call, and for a whole batch request
+    AI_TIMEOUT = float(os.environ.get('ERP_AI_TIMEOUT', 20))
+    AI_BATCH_TIMEOUT = float(os.environ.get('ERP_AI_BATCH_TIMEOUT', 30))
+    AI_MAX_RETRIES = int(os.environ.get('ERP_AI_MAX_RETRIES', 1))
+    AI_MAX_CONCURRENCY = int(os.environ.get('ERP_AI_MAX_CONCURRENCY', 4))
+    # suggestions are reused while product stock and 30 day sales are unchanged
+    AI_CACHE_TTL = int(os.environ.get('ERP_AI_CACHE_TTL', 3600))
+
+    # --- Local reorder-point engine ---
+    # 'local' answers /api/suggest_reorder from forecast.py, 'ai' asks the model for the quantity
+    REORDER_MODE = os.environ.get('ERP_REORDER_MODE', 'local')
+    REORDER_METHOD = os.environ.get('ERP_REORDER_METHOD', 'ewma')  # or 'sma'
+    REORDER_LOOKBACK_DAYS = int(os.environ.get('ERP_REORDER_LOOKBACK_DAYS', 90))
+    REORDER_LEAD_TIME_DAYS = int(os.environ.get('ERP_REORDER_LEAD_TIME_DAYS', 7))
+    REORDER_COVER_DAYS = int(os.environ.get('ERP_REORDER_COVER_DAYS', 30))
+    # z for the safety stock, 1.65 ~ 95% service level
+    REORDER_SERVICE_Z = float(os.environ.get('ERP_REORDER_SERVICE_Z', 1.65))
+    REORDER_ALPHA = float(os.environ.get('ERP_REORDER_ALPHA', 0.3))
+
+    # --- Inventory valuation ---
+    # 'wavg' (moving weighted average cost) or 'fifo'; changing it revalues everything once
+    VALUATION_METHOD = os.environ.get('ERP_VALUATION_METHOD', 'wavg')
+    # months shown in the cogs / gross margin / inventory value charts
+    VALUATION_REPORT_MONTHS = int(os.environ.get('ERP_VALUATION_REPORT_MONTHS', 12))
+
+    # --- Reports (/reports, /api/reports) ---
+    # months shown by default, ending with the month of the newest transaction
+    REPORT_DEFAULT_MONTHS = int(os.environ.get('ERP_REPORT_DEFAULT_MONTHS', 6))
+    # points per series, e.g. about 2.7 years by day
+    REPORT_MAX_BUCKETS = int(os.environ.get('ERP_REPORT_MAX_BUCKETS', 1000))
+
+    # --- Analytics (analytics.py, /analytics, /api/analytics) ---
+    # days of sales behind abc classes, turnover and days of supply
+    ANALYTICS_WINDOW_DAYS = int(os.environ.get('ERP_ANALYTICS_WINDOW_DAYS', 365))
+    # products in stock this long without a sale are dead stock
+    ANALYTICS_DEAD_STOCK_DAYS = int(os.environ.get('ERP_ANALYTICS_DEAD_STOCK_DAYS', 90))
+    # cumulative share of sales value that closes class A, and class B
+    ANALYTICS_ABC_A = float(os.environ.get('ERP_ANALYTICS_ABC_A', 0.8))
+    ANALYTICS_ABC_B = float(os.environ.get('ERP_ANALYTICS_ABC_B', 0.95))
+    # keep the ledger columns in a .npy file, so a new process does not read the whole ledger
+    ANALYTICS_CACHE_ENABLED = os.environ.get('ERP_ANALYTICS_CACHE_ENABLED', '1') == '1'
+    # default: the database path plus .analytics.npy
+    ANALYTICS_CACHE_PATH = os.environ.get('ERP_ANALYTICS_CACHE_PATH', '')
+    # the file is rewritten once this many new rows were loaded
+    ANALYTICS_SAVE_ROWS = int(os.environ.get('ERP_ANALYTICS_SAVE_ROWS', 50000))
+
+    # --- Reporting snapshot (snapshot.py) ---
+    # reports, exports and dashboard aggregates read a periodic copy of the database
+    SNAPSHOT_ENABLED = os.environ.get('ERP_SNAPSHOT_ENABLED', '0') == '1'
+    # default: the database path plus .snapshot
+    SNAPSHOT_PATH = os.environ.get('ERP_SNAPSHOT_PATH', '')
+    # seconds: an older snapshot is retaken before anything reads it
+    SNAPSHOT_MAX_AGE = float(os.environ.get('ERP_SNAPSHOT_MAX_AGE', 300))
+    # seconds: past this a read renews the snapshot in the background
+    SNAPSHOT_REFRESH_AGE = float(os.environ.get('ERP_SNAPSHOT_REFRESH_AGE', 60))
+
+    # --- Low stock alerts (alerts.py) ---
+    # threshold for products with no reorder level of their own or from their supplier,
+    # applied to the database by `flask init-db`
+    LOW_STOCK_THRESHOLD = int(os.environ.get('ERP_LOW_STOCK_THRESHOLD', 10))
+    # seconds between checks of the alert log by each open /api/alerts/stream
+    ALERT_POLL_INTERVAL = float(os.environ.get('ERP_ALERT_POLL_INTERVAL', 1.0))
+    # a stream ends after this and the browser reconnects, freeing its worker thread
+    ALERT_STREAM_SECONDS = float(os.environ.get('ERP_ALERT_STREAM_SECONDS', 300))
+
+    # --- Background jobs (jobs.py, `flask jobs-worker`) ---
+    # seconds an idle worker waits before looking for work again
+    JOB_POLL_INTERVAL = float(os.environ.get('ERP_JOB_POLL_INTERVAL', 1.0))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('ERP_JOB_MAX_ATTEMPTS', 3))
+    # retry n waits about JOB_BACKOFF_BASE * 2^(n-1) seconds, at most JOB_BACKOFF_MAX
+    JOB_BACKOFF_BASE = float(os.environ.get('ERP_JOB_BACKOFF_BASE', 2.0))
+    JOB_BACKOFF_MAX = float(os.environ.get('ERP_JOB_BACKOFF_MAX', 300.0))
+    # a running job not finished within this is assumed lost and retried
+    JOB_LEASE_SECONDS = float(os.environ.get('ERP_JOB_LEASE_SECONDS', 600.0))
+    JOB_WORKER_THREADS = int(os.environ.get('ERP_JOB_WORKER_THREADS', 4))
+    # finished jobs stay pollable this long
+    JOB_KEEP_SECONDS = float(os.environ.get('ERP_JOB_KEEP_SECONDS', 7 * 24 * 3600))
+    # uploads waiting for an import job
+    JOB_UPLOAD_DIR = os.environ.get('ERP_JOB_UPLOAD_DIR', 'uploads')
+
+    # --- Metrics ---
+    # request timing, sql profiling and /metrics; when off nothing is wrapped or hooked
+    METRICS_ENABLED = os.environ.get('ERP_METRICS_ENABLED', '0') == '1'
+    # statements slower than this are logged with their EXPLAIN QUERY PLAN
+    SLOW_QUERY_MS = float(os.environ.get('ERP_SLOW_QUERY_MS', 100))
+    SLOW_QUERY_LOG_SIZE = int(os.environ.get('ERP_SLOW_QUERY_LOG_SIZE', 100))
+    # distinct (endpoint, statement) series kept, the rest is counted as query="other"
+    METRICS_MAX_QUERY_SERIES = int(os.environ.get('ERP_METRICS_MAX_QUERY_SERIES', 500))
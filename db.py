@@ -0,0 +1,199 @@
+import sqlite3
+import threading
+import queue
+from contextlib import contextmanager
+from flask import current_app, g
+import metrics
+
+
+class PoolTimeout(Exception):
+    """raised when no pooled connection became free within DB_POOL_TIMEOUT."""
+
+
+class ConnectionPool:
+    """bounded pool of sqlite connections shared by the request threads of one worker.
+
+    connections are opened lazily up to `size`, handed out one per request and put
+    back on teardown, so a worker keeps a handful of warm connections instead of
+    opening (and leaking) one per helper call.
+    """
+
+    def __init__(self, database, size=8, timeout=10.0, busy_timeout_ms=5000,
+                 journal_mode='WAL', synchronous='NORMAL', mmap_size=0, cache_size=-2000,
+                 factory=sqlite3.Connection):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.factory = factory
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._stats = {'created': 0, 'reused': 0, 'released': 0, 'discarded': 0,
+                       'waits': 0, 'timeouts': 0, 'in_use': 0}
+
+    def _connect(self):
+        # check_same_thread off: a connection moves between threads, but only ever
+        # belongs to one request at a time
+        conn = sqlite3.connect(self.database, timeout=self.busy_timeout_ms / 1000,
+                               check_same_thread=False, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        conn.execute(f'PRAGMA journal_mode = {self.journal_mode}')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size = {int(self.cache_size)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def acquire(self):
+        """return an idle connection, or a new one if the pool is not yet full."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['waits'] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise PoolTimeout(f'no database connection free after {self.timeout}s')
+        try:
+            conn = self._idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+            reused = False
+        with self._lock:
+            self._stats['reused' if reused else 'created'] += 1
+            self._stats['in_use'] += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        """hand a connection back. anything left uncommitted is rolled back first."""
+        try:
+            if not discard and conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            discard = True
+        if discard:
+            conn.close()
+        else:
+            self._idle.put(conn)
+        with self._lock:
+            self._stats['discarded' if discard else 'released'] += 1
+            self._stats['in_use'] -= 1
+        self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['idle'] = self._idle.qsize()
+        stats['size'] = self.size
+        stats['database'] = self.database
+        return stats
+
+
+def _pool_from_config(config):
+    return ConnectionPool(config['DATABASE'],
+                          size=config['DB_POOL_SIZE'],
+                          timeout=config['DB_POOL_TIMEOUT'],
+                          busy_timeout_ms=config['DB_BUSY_TIMEOUT_MS'],
+                          journal_mode=config['DB_JOURNAL_MODE'],
+                          synchronous=config['DB_SYNCHRONOUS'],
+                          mmap_size=config['DB_MMAP_SIZE'],
+                          cache_size=config['DB_CACHE_SIZE'],
+                          factory=metrics.connection_factory(config))
+
+
+_pool_init_lock = threading.Lock()
+
+
+def get_pool(app=None):
+    """the pool of the given (or current) app, created on first use."""
+    app = app or current_app
+    pool = app.extensions.get('db_pool')
+    if pool is None:
+        with _pool_init_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None:
+                pool = _pool_from_config(app.config)
+                app.extensions['db_pool'] = pool
+    return pool
+
+
+def close_pool(app):
+    """closes the app's idle connections and drops its pool, the next get_db() starts a new one.
+
+    create_app() calls it after initializing the schema: under gunicorn's preload_app that
+    runs in the master, and sqlite connections must not be inherited by forked workers.
+    """
+    pool = app.extensions.pop('db_pool', None)
+    if pool is not None:
+        pool.close_all()
+
+
+def get_db():
+    """connection for the current request/app context, checked out of the pool once and cached on g."""
+    db = getattr(g, '_database', None)
+    if db is None:
+        db = g._database = get_pool().acquire()
+    return db
+
+
+def close_connection(exception):
+    """puts the request's connection back in the pool at the end of the request."""
+    db = g.pop('_database', None)
+    if db is not None:
+        get_pool().release(db, discard=isinstance(exception, sqlite3.DatabaseError))
+
+
+@contextmanager
+def connection(app=None):
+    """pooled connection for code running outside a request (cli commands, worker threads)."""
+    pool = get_pool(app)
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+@contextmanager
+def write_transaction(db):
+    """BEGIN IMMEDIATE ... COMMIT around a block of writes, rolled back if it raises.
+
+    taking the write lock up front means every read inside the block already sees
+    the final state, and busy_timeout handles the wait instead of a failed upgrade
+    from a read to a write lock halfway through.
+    """
+    if db.in_transaction:
+        db.commit()
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        yield db
+    except BaseException:
+        db.rollback()
+        raise
+    db.commit()
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def init_app(app):
+    app.teardown_appcontext(close_connection)
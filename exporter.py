@@ -0,0 +1,99 @@
+"""streaming CSV/JSONL export of the ledger and the product list.
+
+rows come off a single cursor in fetchmany() chunks and are encoded chunk by
+chunk, so memory stays flat however many rows are exported. with gzip on the
+chunks go through one streaming compressor instead of being buffered.
+"""
+import csv
+import io
+import json
+import zlib
+from utils import transaction_filter_sql
+
+TRANSACTION_COLUMNS = ['id', 'date', 'type', 'product_id', 'product_sku', 'product_name',
+                       'quantity', 'unit_price', 'total_value']
+PRODUCT_COLUMNS = ['id', 'sku', 'name', 'stock_quantity', 'unit_price', 'supplier_id',
+                   'supplier_name', 'reorder_level', 'created_at', 'updated_at']
+
+
+def transactions_query(filters):
+    where, params = transaction_filter_sql(filters)
+    where_sql = ('WHERE ' + ' AND '.join(where)) if where else ''
+    return f'''
+        SELECT t.id, t.date, t.type, t.product_id, p.sku AS product_sku, p.name AS product_name,
+               t.quantity, t.unit_price, ROUND(t.quantity * t.unit_price, 2) AS total_value
+        FROM "Transaction" t
+        JOIN Product p ON t.product_id = p.id
+        {where_sql}
+        ORDER BY t.date, t.id
+    ''', params
+
+
+def products_query(filters):
+    where_sql, params = '', []
+    if 'supplier_id' in filters:
+        where_sql, params = 'WHERE p.supplier_id = ?', [filters['supplier_id']]
+    return f'''
+        SELECT p.id, p.sku, p.name, p.stock_quantity, p.unit_price, p.supplier_id,
+               s.name AS supplier_name, p.reorder_level, p.created_at, p.updated_at
+        FROM Product p
+        LEFT JOIN Supplier s ON p.supplier_id = s.id
+        {where_sql}
+        ORDER BY p.id
+    ''', params
+
+
+EXPORTS = {
+    'transactions': (transactions_query, TRANSACTION_COLUMNS),
+    'products': (products_query, PRODUCT_COLUMNS),
+}
+
+
+def _encode_chunks(cursor, columns, fmt, chunk_rows):
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            writer.writerows(rows)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+    elif fmt == 'jsonl':
+        dumps = json.JSONEncoder(separators=(',', ':')).encode
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield ''.join(dumps(dict(zip(columns, row))) + '\n' for row in rows).encode()
+    else:
+        raise ValueError(f'unsupported export format: {fmt}')
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_rows(db, kind, filters=None, fmt='csv', gzip=False, chunk_rows=1000):
+    """generator of encoded bytes for the export of `kind` ('transactions' or 'products')."""
+    build_query, columns = EXPORTS[kind]
+    sql, params = build_query(filters or {})
+    cursor = db.cursor()
+    # plain tuples, no sqlite3.Row objects needed for encoding
+    cursor.row_factory = None
+    cursor.execute(sql, params)
+    try:
+        chunks = _encode_chunks(cursor, columns, fmt, chunk_rows)
+        yield from (_gzip_chunks(chunks) if gzip else chunks)
+    finally:
+        cursor.close()
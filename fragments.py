@@ -0,0 +1,43 @@
+"""rendered html fragments cached until the data they show changes.
+
+the big parts of the pages (product table, supplier table, low-stock card) are
+rendered from their own templates (templates/_*.html) and cached as html in the
+aggregate cache. the key carries the DataVersion counters of the tables the fragment
+shows: the triggers of migration 6 bump them on every insert, update and delete from
+any write path, so a changed table means a new key and a cached fragment is never
+stale. a repeat page load costs one read of the counters and a cache lookup instead
+of the queries and the template loop. the entries are tagged with the same tables,
+so the write routes' invalidate() also clears out the superseded ones.
+"""
+from flask import current_app, render_template
+from markupsafe import Markup
+
+from cache import cached
+
+
+def data_versions(db, tables):
+    """{table: version} of the DataVersion counters of `tables`."""
+    marks = ','.join('?' * len(tables))
+    return dict(db.execute(f'SELECT name, version FROM DataVersion WHERE name IN ({marks})', tables).fetchall())
+
+
+def render(db, name, template, context, tables, key='', cache=True):
+    """html of templates/<template> rendered with context(), which is only called (and
+    its queries run) when the fragment is not cached for the current data versions.
+    `key` tells variants apart; db is the connection the data comes from. with cache=False
+    it is just rendered: for variants built from free-form input (search text, cursors),
+    which would fill the cache with pages hardly anyone asks for twice."""
+    if not cache:
+        return Markup(render_template(template, **context()))
+    return Markup(cached_for_versions(db, name, lambda: render_template(template, **context()), tables, key))
+
+
+def cached_for_versions(db, name, compute, tables, key=''):
+    """compute() cached like a fragment, under the current data versions of `tables`. for
+    a fragment that comes with values shown elsewhere on the page (a count in another card):
+    compute returns both, so they are always built from the same rows. compute must read
+    from db, not from the aggregate cache, or an older list could be stored under new versions."""
+    versions = data_versions(db, tables)
+    version_key = ','.join(f'{table}={versions.get(table, 0)}' for table in tables)
+    return cached(f'fragment:{name}:{key}:{version_key}', compute,
+                  tags=tables, ttl=current_app.config['FRAGMENT_CACHE_TTL'])
@@ -0,0 +1,28 @@
+"""gunicorn settings, read from the working directory by `gunicorn` (or `gunicorn -c gunicorn.conf.py`).
+
+preload_app imports app.py once in the master: create_app() creates/migrates the schema
+there, a single time before any worker exists, and closes the connections it used. the
+workers fork with every module already imported instead of each importing them again.
+"""
+import os
+
+wsgi_app = 'app:app'
+bind = os.environ.get('ERP_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('ERP_WORKERS', 2))
+# threads per worker; each open /api/alerts/stream holds one for ALERT_STREAM_SECONDS
+threads = int(os.environ.get('ERP_THREADS', 8))
+preload_app = True
+
+
+# pools found in a worker right after the fork, kept referenced so they are never closed
+_inherited = []
+
+
+def post_fork(server, worker):
+    # create_app() leaves no pool behind; one here means a connection was opened in the
+    # master after startup. the worker starts its own pool instead of sharing those
+    # connections, and does not close them either, which could disturb the master's locks
+    from app import app
+    if 'db_pool' in app.extensions:
+        server.log.warning('database pool inherited from the master, worker %s opens its own', worker.pid)
+        _inherited.append(app.extensions.pop('db_pool'))
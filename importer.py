@@ -0,0 +1,180 @@
+"""streaming bulk import of products and transactions from CSV or JSON lines.
+
+rows are read one at a time from the file, validated with the same rules as the
+form routes and written in batches: one BEGIN IMMEDIATE ... COMMIT and one
+executemany per batch, with stock changes summed per product and applied as a
+single UPDATE each. a bad row is recorded in the result and skipped, it never
+aborts the rest of the import.
+"""
+import csv
+import json
+from validation import ValidationError, clean_product, clean_transaction
+
+
+class ImportResult:
+
+    def __init__(self, max_errors=1000):
+        self.inserted = 0
+        self.rows = 0
+        self.error_count = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self):
+        return {'rows': self.rows, 'inserted': self.inserted,
+                'error_count': self.error_count,
+                'errors': sorted(self.errors, key=lambda error: error['line']),
+                'errors_truncated': self.error_count > len(self.errors)}
+
+
+def iter_records(stream, fmt):
+    """yields (line number, dict) from a text stream without reading it all into memory."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, e
+                continue
+            yield line_number, record if isinstance(record, dict) else ValueError('expected a JSON object')
+    else:
+        raise ValueError(f'unsupported import format: {fmt}')
+
+
+def _batches(records, size):
+    batch = []
+    for item in records:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_products(db, stream, fmt='csv', batch_size=1000, max_errors=1000):
+    result = ImportResult(max_errors)
+    supplier_ids = {row[0] for row in db.execute('SELECT id FROM Supplier')}
+
+    for batch in _batches(iter_records(stream, fmt), batch_size):
+        valid = []
+        for line, record in batch:
+            result.rows += 1
+            if isinstance(record, Exception):
+                result.add_error(line, f'Malformed row: {record}')
+                continue
+            try:
+                product = clean_product(record)
+            except (ValidationError, TypeError, ValueError) as e:
+                # any shape the rules missed still fails only its own row
+                result.add_error(line, str(e))
+                continue
+            if product['supplier_id'] not in supplier_ids:
+                result.add_error(line, f'Supplier {product["supplier_id"]} does not exist.')
+                continue
+            valid.append((line, product))
+        if not valid:
+            continue
+
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            skus = [product['sku'] for _, product in valid]
+            marks = ','.join('?' * len(skus))
+            taken = {row[0] for row in db.execute(f'SELECT sku FROM Product WHERE sku IN ({marks})', skus)}
+            params = []
+            for line, product in valid:
+                if product['sku'] in taken:
+                    result.add_error(line, f'Product with SKU "{product["sku"]}" already exists.')
+                    continue
+                taken.add(product['sku'])
+                params.append((product['name'], product['sku'], product['stock_quantity'],
+                               product['unit_price'], product['supplier_id'], product['reorder_level']))
+            db.executemany('''
+                INSERT INTO Product (name, sku, stock_quantity, unit_price, supplier_id, reorder_level)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', params)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        result.inserted += len(params)
+    return result
+
+
+def import_transactions(db, stream, fmt='csv', batch_size=1000, max_errors=1000):
+    """rows name their product by product_id or sku. rows are applied in file order, so a
+    sale is checked against the stock left after the earlier rows of the same file."""
+    result = ImportResult(max_errors)
+    sku_to_id = {}
+
+    for batch in _batches(iter_records(stream, fmt), batch_size):
+        cleaned = []
+        for line, record in batch:
+            result.rows += 1
+            if isinstance(record, Exception):
+                result.add_error(line, f'Malformed row: {record}')
+                continue
+            try:
+                cleaned.append((line, clean_transaction(record)))
+            except (ValidationError, TypeError, ValueError) as e:
+                result.add_error(line, str(e))
+        if not cleaned:
+            continue
+
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            missing_skus = {t['sku'] for _, t in cleaned if t['product_id'] is None} - sku_to_id.keys()
+            if missing_skus:
+                marks = ','.join('?' * len(missing_skus))
+                sku_to_id.update(db.execute(f'SELECT sku, id FROM Product WHERE sku IN ({marks})',
+                                            list(missing_skus)).fetchall())
+            for _, txn in cleaned:
+                if txn['product_id'] is None:
+                    txn['product_id'] = sku_to_id.get(txn['sku'])
+
+            ids = {t['product_id'] for _, t in cleaned if t['product_id'] is not None}
+            marks = ','.join('?' * len(ids))
+            # stock as of the start of this batch, moved along row by row below
+            stock = dict(db.execute(f'SELECT id, stock_quantity FROM Product WHERE id IN ({marks})',
+                                    list(ids)).fetchall()) if ids else {}
+            deltas = {}
+            params = []
+            for line, txn in cleaned:
+                product_id = txn['product_id']
+                if product_id not in stock:
+                    result.add_error(line, 'Selected product not found.')
+                    continue
+                change = txn['quantity'] if txn['type'] == 'purchase' else -txn['quantity']
+                if stock[product_id] + change < 0:
+                    result.add_error(line, f'Not enough stock for sale! Only {stock[product_id]} units available.')
+                    continue
+                stock[product_id] += change
+                deltas[product_id] = deltas.get(product_id, 0) + change
+                params.append((product_id, txn['quantity'], txn['type'], txn['date'], txn['unit_price']))
+
+            db.executemany('''
+                INSERT INTO "Transaction" (product_id, quantity, type, date, unit_price)
+                VALUES (?, ?, ?, ?, ?)
+            ''', params)
+            db.executemany('''
+                UPDATE Product
+                SET stock_quantity = stock_quantity + ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', [(delta, product_id) for product_id, delta in deltas.items() if delta])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        result.inserted += len(params)
+    return result
@@ -0,0 +1,285 @@
+"""local background job queue: a Job table in the app database plus worker processes.
+
+no broker. a job is a row (kind, json payload, status); workers started with
+`flask --app app jobs-worker` claim queued rows and run the handler registered for
+the kind with @task. claiming happens under BEGIN IMMEDIATE, so two workers never get
+the same job and the per-kind concurrency limit holds across all worker processes.
+
+    queued --claim--> running --ok--> done
+                         |--error, attempts left--> queued again, run_at = now + backoff
+                         |--error, no attempts left (or JobError)--> failed
+
+a running job holds a lease (JOB_LEASE_SECONDS). if its worker dies the lease runs
+out and the next claim puts the job back through the failure path above. workers
+record a heartbeat in JobWorker, so the web side can tell whether anyone is serving
+the queue (workers_alive) and run the work inline when no one is.
+"""
+import json
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+from collections import namedtuple
+from datetime import datetime
+
+from db import connection, write_transaction
+
+STATUSES = ('queued', 'running', 'done', 'failed')
+
+Task = namedtuple('Task', 'handler concurrency max_attempts')
+
+# kind -> Task, filled by @task at import time
+TASKS = {}
+
+
+class JobError(Exception):
+    """a failure that retrying will not fix, the job fails at once."""
+
+
+def task(kind, concurrency=1, max_attempts=None):
+    """registers fn(**payload) -> json serializable result as the handler of a job kind.
+
+    at most `concurrency` jobs of this kind run at once over all workers. the handler
+    runs inside an app context, so get_db() and app.config work as in a request.
+    """
+    def register(fn):
+        TASKS[kind] = Task(fn, max(1, concurrency), max_attempts)
+        return fn
+    return register
+
+
+def backoff(attempt, base, cap):
+    """seconds to wait before retry number `attempt` (1 = first retry): exponential, capped, jittered."""
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + random.random() * delay / 2
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat(timespec='seconds') if timestamp else None
+
+
+def to_dict(row):
+    job = dict(zip(('id', 'kind', 'payload', 'status', 'attempts', 'max_attempts', 'result', 'error',
+                    'run_at', 'created_at', 'started_at', 'finished_at', 'worker'), row))
+    job['payload'] = json.loads(job['payload'])
+    job['result'] = json.loads(job['result']) if job['result'] is not None else None
+    for key in ('run_at', 'created_at', 'started_at', 'finished_at'):
+        job[key] = _iso(job[key])
+    return job
+
+
+_COLUMNS = '''id, kind, payload, status, attempts, max_attempts, result, error,
+              run_at, created_at, started_at, finished_at, worker'''
+
+
+def enqueue(db, kind, payload=None, max_attempts=3, delay=0.0, dedupe=False):
+    """adds a job in its own write transaction and returns its id. with dedupe an
+    identical job that is still queued or running is returned instead.
+    """
+    # a kind registered with its own max_attempts (e.g. imports, which must not rerun) keeps it
+    if kind not in TASKS:
+        raise ValueError(f'unknown job kind {kind!r}')
+    body = json.dumps(payload or {}, sort_keys=True, separators=(',', ':'))
+    now = time.time()
+    with write_transaction(db):
+        if dedupe:
+            row = db.execute('''
+                SELECT id FROM Job WHERE kind = ? AND payload = ? AND status IN ('queued', 'running')
+                ORDER BY id LIMIT 1
+            ''', (kind, body)).fetchone()
+            if row:
+                return row[0]
+        cursor = db.execute('''
+            INSERT INTO Job (kind, payload, status, max_attempts, run_at, created_at)
+            VALUES (?, ?, 'queued', ?, ?, ?)
+        ''', (kind, body, TASKS[kind].max_attempts or max_attempts, now + delay, now))
+    return cursor.lastrowid
+
+
+def get(db, job_id):
+    row = db.execute(f'SELECT {_COLUMNS} FROM Job WHERE id = ?', (job_id,)).fetchone()
+    return to_dict(row) if row else None
+
+
+def recent(db, status=None, kind=None, limit=50):
+    """newest jobs first, optionally of one status/kind, plus the number of jobs per status."""
+    where, params = [], []
+    if status:
+        where.append('status = ?')
+        params.append(status)
+    if kind:
+        where.append('kind = ?')
+        params.append(kind)
+    where_sql = ('WHERE ' + ' AND '.join(where)) if where else ''
+    rows = db.execute(f'SELECT {_COLUMNS} FROM Job {where_sql} ORDER BY id DESC LIMIT ?',
+                      (*params, limit)).fetchall()
+    counts = dict(db.execute('SELECT status, COUNT(*) FROM Job GROUP BY status').fetchall())
+    return {'jobs': [to_dict(row) for row in rows],
+            'counts': {status: counts.get(status, 0) for status in STATUSES}}
+
+
+def _fail(db, job_id, attempts, max_attempts, error, config, now, permanent=False):
+    if permanent or attempts >= max_attempts:
+        db.execute('''
+            UPDATE Job SET status = 'failed', error = ?, finished_at = ?, leased_until = NULL WHERE id = ?
+        ''', (error, now, job_id))
+    else:
+        retry_at = now + backoff(attempts, config['JOB_BACKOFF_BASE'], config['JOB_BACKOFF_MAX'])
+        db.execute('''
+            UPDATE Job SET status = 'queued', error = ?, run_at = ?, leased_until = NULL, worker = NULL
+            WHERE id = ?
+        ''', (error, retry_at, job_id))
+
+
+def claim(db, worker, config, kinds=None):
+    """takes the next runnable job for one of `kinds` (default: all registered) whose kind is
+    below its concurrency limit, marks it running and returns (id, kind, payload), or None.
+    expired leases are failed (and so retried) first. run inside write_transaction.
+    """
+    now = time.time()
+    for job_id, attempts, max_attempts in db.execute('''
+        SELECT id, attempts, max_attempts FROM Job WHERE status = 'running' AND leased_until < ?
+    ''', (now,)).fetchall():
+        _fail(db, job_id, attempts, max_attempts, 'lease expired, worker stopped or job took too long',
+              config, now)
+
+    running = dict(db.execute("SELECT kind, COUNT(*) FROM Job WHERE status = 'running' GROUP BY kind"))
+    allowed = [kind for kind in (kinds or TASKS)
+               if kind in TASKS and running.get(kind, 0) < TASKS[kind].concurrency]
+    if not allowed:
+        return None
+    row = db.execute(f'''
+        SELECT id, kind, payload FROM Job
+        WHERE status = 'queued' AND run_at <= ? AND kind IN ({','.join('?' * len(allowed))})
+        ORDER BY run_at, id LIMIT 1
+    ''', (now, *allowed)).fetchone()
+    if row is None:
+        return None
+    db.execute('''
+        UPDATE Job SET status = 'running', attempts = attempts + 1, started_at = ?, leased_until = ?,
+                       worker = ?, error = NULL
+        WHERE id = ?
+    ''', (now, now + config['JOB_LEASE_SECONDS'], worker, row[0]))
+    return row[0], row[1], json.loads(row[2])
+
+
+def run_one(app, worker, kinds=None):
+    """claims and runs one job. returns False if there was nothing to run."""
+    config = app.config
+    with connection(app) as db:
+        with write_transaction(db):
+            claimed = claim(db, worker, config, kinds)
+    if claimed is None:
+        return False
+    job_id, kind, payload = claimed
+    try:
+        with app.app_context():
+            result = TASKS[kind].handler(**payload)
+        body, error, permanent = json.dumps(result, separators=(',', ':')), None, False
+    except JobError as e:
+        body, error, permanent = None, str(e), True
+    except Exception as e:
+        app.logger.warning('job %s (%s) failed: %s', job_id, kind, traceback.format_exc())
+        body, error, permanent = None, f'{type(e).__name__}: {e}', False
+    with connection(app) as db:
+        with write_transaction(db):
+            row = db.execute('SELECT attempts, max_attempts, worker FROM Job WHERE id = ?', (job_id,)).fetchone()
+            # the lease may have expired and the job moved on without us
+            if row is None or row[2] != worker:
+                return True
+            now = time.time()
+            if error is None:
+                db.execute('''
+                    UPDATE Job SET status = 'done', result = ?, finished_at = ?, leased_until = NULL WHERE id = ?
+                ''', (body, now, job_id))
+            else:
+                _fail(db, job_id, row[0], row[1], error, config, now, permanent)
+    return True
+
+
+def heartbeat(app, name, threads):
+    with connection(app) as db:
+        with write_transaction(db):
+            db.execute('''
+                INSERT INTO JobWorker (name, pid, threads, seen_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET seen_at = excluded.seen_at
+            ''', (name, os.getpid(), threads, time.time()))
+            # finished jobs are kept a while for polling, then dropped
+            db.execute("DELETE FROM Job WHERE status IN ('done', 'failed') AND finished_at < ?",
+                       (time.time() - app.config['JOB_KEEP_SECONDS'],))
+            db.execute('DELETE FROM JobWorker WHERE seen_at < ?', (time.time() - 3600,))
+
+
+def workers_alive(db, within=30.0):
+    """number of worker processes that checked in during the last `within` seconds."""
+    return db.execute('SELECT COUNT(*) FROM JobWorker WHERE seen_at >= ?', (time.time() - within,)).fetchone()[0]
+
+
+def work(app, threads=1, stop=None, kinds=None):
+    """runs `threads` worker loops in this process until stop is set."""
+    stop = stop or threading.Event()
+    name = f'{socket.gethostname()}:{os.getpid()}'
+    poll = app.config['JOB_POLL_INTERVAL']
+
+    def loop(index):
+        worker = f'{name}/{index}'
+        while not stop.is_set():
+            try:
+                if not run_one(app, worker, kinds):
+                    stop.wait(poll)
+            except Exception:
+                app.logger.exception('job worker %s', worker)
+                stop.wait(poll)
+
+    loops = [threading.Thread(target=loop, args=(i,), name=f'job-worker-{i}', daemon=True)
+             for i in range(threads)]
+    for thread in loops:
+        thread.start()
+    while not stop.is_set():
+        try:
+            heartbeat(app, name, threads)
+        except Exception:
+            app.logger.exception('job worker heartbeat')
+        stop.wait(10)
+    for thread in loops:
+        thread.join()
+
+
+def _stop_on_signals(stop):
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+
+def _process_main(module, threads, kinds):
+    # spawned worker process: import the app afresh, then run the loops
+    import importlib
+    app = importlib.import_module(module).app
+    stop = threading.Event()
+    _stop_on_signals(stop)
+    work(app, threads, stop, kinds)
+
+
+def run_workers(app, module, processes=1, threads=1, kinds=None):
+    """runs worker loops in this process, or in `processes` child processes, until SIGINT/SIGTERM."""
+    if processes <= 1:
+        stop = threading.Event()
+        _stop_on_signals(stop)
+        work(app, threads, stop, kinds)
+        return
+    import multiprocessing
+    context = multiprocessing.get_context('spawn')
+    children = [context.Process(target=_process_main, args=(module, threads, kinds), name=f'jobs-{i}')
+                for i in range(processes)]
+    for child in children:
+        child.start()
+    stop = threading.Event()
+    _stop_on_signals(stop)
+    while not stop.is_set():
+        stop.wait(1)
+    for child in children:
+        child.terminate()
+    for child in children:
+        child.join()
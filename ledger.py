@@ -0,0 +1,148 @@
+"""point-in-time stock from the StockMovement ledger and its snapshots (migration 4).
+
+StockMovement is append-only and written by triggers, so it holds every stock change
+with the business date it applies to. stock on a date D is the sum of all movements
+dated <= D; instead of summing the whole ledger, a query starts from the latest
+snapshot S <= D and adds two small deltas:
+
+    stock(D) = snapshot(S)
+             + movements already known at S (id <= last_movement_id) dated in (S, D]
+             + movements recorded after S   (id >  last_movement_id) dated <= D
+
+the second delta is what keeps snapshots exact when an old transaction is edited or
+back-dated after the snapshot was taken.
+"""
+from datetime import date, timedelta
+
+
+def _product_filter(product_ids, column='product_id'):
+    if product_ids is None:
+        return '', []
+    return f"AND {column} IN ({','.join('?' * len(product_ids))})", list(product_ids)
+
+
+def latest_snapshot(db, as_of):
+    """(date, last_movement_id) of the newest snapshot on or before as_of, or None."""
+    row = db.execute('''
+        SELECT date, last_movement_id FROM StockSnapshotRun
+        WHERE date <= ? ORDER BY date DESC LIMIT 1
+    ''', (as_of,)).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def stock_at(db, as_of, product_ids=None):
+    """{product_id: quantity} at the end of the day as_of (YYYY-MM-DD). products with no stock are left out."""
+    if product_ids is not None and not product_ids:
+        return {}
+    product_sql, product_params = _product_filter(product_ids)
+    totals = {}
+    snapshot = latest_snapshot(db, as_of)
+    if snapshot:
+        since, last_id = snapshot
+        for product_id, quantity in db.execute(f'''
+            SELECT product_id, quantity FROM StockSnapshot WHERE date = ? {product_sql}
+        ''', [since, *product_params]):
+            totals[product_id] = quantity
+        deltas = [
+            (f'date > ? AND date <= ? AND id <= ? {product_sql}', [since, as_of, last_id, *product_params]),
+            (f'id > ? AND date <= ? {product_sql}', [last_id, as_of, *product_params]),
+        ]
+    else:
+        deltas = [(f'date <= ? {product_sql}', [as_of, *product_params])]
+
+    for where, params in deltas:
+        for product_id, quantity in db.execute(f'''
+            SELECT product_id, SUM(quantity) FROM StockMovement WHERE {where} GROUP BY product_id
+        ''', params):
+            totals[product_id] = totals.get(product_id, 0) + quantity
+    return {product_id: quantity for product_id, quantity in totals.items() if quantity}
+
+
+def inventory_at(db, as_of, product_ids=None):
+    """stock and its value at current list price per product on as_of, plus totals."""
+    quantities = stock_at(db, as_of, product_ids)
+    rows = []
+    if quantities:
+        marks = ','.join('?' * len(quantities))
+        products = db.execute(f'SELECT id, name, sku, unit_price FROM Product WHERE id IN ({marks})',
+                              list(quantities)).fetchall()
+        for product in products:
+            quantity = quantities[product[0]]
+            rows.append({'product_id': product[0], 'name': product[1], 'sku': product[2],
+                         'quantity': quantity, 'unit_price': product[3],
+                         'value': round(quantity * product[3], 2)})
+        rows.sort(key=lambda row: row['name'])
+    return {'date': as_of,
+            'snapshot': (latest_snapshot(db, as_of) or (None,))[0],
+            'total_quantity': sum(row['quantity'] for row in rows),
+            'total_value': round(sum(row['value'] for row in rows), 2),
+            'products': rows}
+
+
+def take_snapshot(db, as_of=None):
+    """stores every product's stock at the end of as_of (default today), computed from the
+    previous snapshot plus deltas. returns the number of products with stock.
+
+    run it inside db.write_transaction: with the write lock held no movement can be
+    added between reading MAX(id) and summing, so the snapshot is exactly last_movement_id.
+    """
+    as_of = as_of or date.today().isoformat()
+    last_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM StockMovement').fetchone()[0]
+    quantities = stock_at(db, as_of)
+    db.execute('DELETE FROM StockSnapshot WHERE date = ?', (as_of,))
+    db.executemany('INSERT INTO StockSnapshot (date, product_id, quantity) VALUES (?, ?, ?)',
+                   [(as_of, product_id, quantity) for product_id, quantity in quantities.items()])
+    db.execute('INSERT OR REPLACE INTO StockSnapshotRun (date, last_movement_id) VALUES (?, ?)', (as_of, last_id))
+    return len(quantities)
+
+
+def month_ends(first, last):
+    """the last day of every month from first's month up to last (both YYYY-MM-DD), oldest first."""
+    day = date.fromisoformat(first[:7] + '-01')
+    end = date.fromisoformat(last)
+    result = []
+    while True:
+        following = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+        month_end = following - timedelta(days=1)
+        if month_end > end:
+            return result
+        result.append(month_end.isoformat())
+        day = following
+
+
+def missing_month_end_snapshots(db, today=None):
+    """month ends since the first movement that have no snapshot yet (the current month excluded)."""
+    today = today or date.today()
+    first = db.execute('SELECT MIN(date) FROM StockMovement').fetchone()[0]
+    if not first:
+        return []
+    done = {row[0] for row in db.execute('SELECT date FROM StockSnapshotRun')}
+    return [day for day in month_ends(first, (today - timedelta(days=1)).isoformat()) if day not in done]
+
+
+def reconcile(db, product_ids=None):
+    """products whose stock_quantity, full ledger sum and snapshot based stock do not all agree.
+
+    the ledger is summed in full on purpose, so a wrong snapshot is caught as well as a
+    stock_quantity changed behind the ledger's back. returns a list of
+    {product_id, name, stock_quantity, ledger_quantity, snapshot_quantity, difference}
+    where difference is stock_quantity - ledger_quantity.
+    """
+    product_sql, product_params = _product_filter(product_ids, 'p.id')
+    rows = db.execute(f'''
+        SELECT p.id, p.name, p.stock_quantity, COALESCE(m.quantity, 0)
+        FROM Product p
+        LEFT JOIN (SELECT product_id, SUM(quantity) AS quantity FROM StockMovement GROUP BY product_id) m
+               ON m.product_id = p.id
+        WHERE 1 = 1 {product_sql}
+        ORDER BY p.id
+    ''', product_params).fetchall()
+    from_snapshots = stock_at(db, '9999-12-31', product_ids)
+    mismatches = []
+    for product_id, name, stock_quantity, ledger_quantity in rows:
+        snapshot_quantity = from_snapshots.get(product_id, 0)
+        if stock_quantity != ledger_quantity or snapshot_quantity != ledger_quantity:
+            mismatches.append({'product_id': product_id, 'name': name, 'stock_quantity': stock_quantity,
+                               'ledger_quantity': ledger_quantity, 'snapshot_quantity': snapshot_quantity,
+                               'difference': stock_quantity - ledger_quantity})
+    return mismatches
@@ -0,0 +1,331 @@
+"""request timing, sql query profiling and prometheus exposition.
+
+everything here is opt-in (METRICS_ENABLED). when it is off the pool opens plain
+sqlite3 connections and no request hooks are registered, so there is no overhead.
+when it is on:
+
+  * every request's latency goes into a histogram per endpoint and method
+  * pooled connections are ProfilingConnection, whose cursors time each statement
+    from execute until its rows are consumed and count those rows, per endpoint and
+    (normalized) sql text. only statements run while handling a request are profiled:
+    schema setup, migrations, cli commands and job workers are one-offs that would
+    only bury the request series. past METRICS_MAX_QUERY_SERIES distinct series, new
+    statements are counted under query="other"
+  * statements slower than SLOW_QUERY_MS are logged together with their
+    EXPLAIN QUERY PLAN and kept in a bounded in-memory slow log
+
+counters live in this process only, like the pool and cache stats: with several
+gunicorn workers each one reports its own numbers.
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+
+class Registry:
+    """all metrics of this process, guarded by one lock."""
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_query_ms = 100.0
+        self.logger = None
+        self.max_query_series = 500
+        self._lock = threading.Lock()
+        self.reset(slow_log_size=100)
+
+    def reset(self, slow_log_size=None):
+        with self._lock:
+            self.requests = {}
+            self.request_latency = Histogram(LATENCY_BUCKETS)
+            self.query_latency = Histogram(QUERY_BUCKETS)
+            self.query_rows = {}
+            self.slow_queries_total = 0
+            self.slow_log = deque(maxlen=slow_log_size or self.slow_log.maxlen)
+
+    def record_request(self, endpoint, method, status, seconds):
+        with self._lock:
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.request_latency.observe((endpoint, method), seconds)
+
+    def record_query(self, endpoint, query, seconds, rows):
+        with self._lock:
+            key = (endpoint, query)
+            if key not in self.query_rows and len(self.query_rows) >= self.max_query_series:
+                key = (endpoint, 'other')
+            self.query_latency.observe(key, seconds)
+            self.query_rows[key] = self.query_rows.get(key, 0) + rows
+
+    def record_slow(self, entry):
+        with self._lock:
+            self.slow_queries_total += 1
+            self.slow_log.append(entry)
+        if self.logger is not None:
+            self.logger.warning('slow query %.1f ms (%s, %d rows): %s | plan: %s',
+                                entry['duration_ms'], entry['endpoint'], entry['rows'], entry['sql'],
+                                '; '.join(entry['plan']) or '-')
+
+    def slow_queries(self):
+        with self._lock:
+            return list(reversed(self.slow_log))
+
+
+REGISTRY = Registry()
+
+_normalized = {}
+
+
+def normalize(sql):
+    """one line label for a statement, `IN (?, ?, ?)` lists collapsed so they share a series."""
+    label = _normalized.get(sql)
+    if label is None:
+        label = re.sub(r'\s+', ' ', sql).strip()
+        label = re.sub(r'\?(\s*,\s*\?)+', '?,...', label)
+        if len(label) > 200:
+            label = label[:197] + '...'
+        if len(_normalized) < 2000:
+            _normalized[sql] = label
+    return label
+
+
+def _endpoint():
+    return request.endpoint or 'unknown'
+
+
+def _query_plan(conn, sql, params):
+    # a plain cursor, so capturing the plan is not profiled itself
+    try:
+        rows = sqlite3.Cursor(conn).execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    except (sqlite3.Error, ValueError):
+        return []
+    return [row[-1] for row in rows]
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """cursor that times a statement from execute until its rows are consumed.
+
+    a statement is recorded once its result is exhausted, or when the cursor runs
+    its next statement, is closed or is garbage collected.
+    """
+
+    _sql = None
+
+    def _start(self, sql, params):
+        self._finish()
+        self._rows = 0
+        self._elapsed = 0.0
+        if not has_request_context():
+            # left unrecorded: _finish does nothing while _sql is None
+            return
+        self._sql = sql
+        self._params = params
+        self._endpoint = _endpoint()
+
+    def _finish(self):
+        sql = self._sql
+        if sql is None:
+            return
+        self._sql = None
+        rows = self._rows if self.description is not None else max(self.rowcount, 0)
+        query = normalize(sql)
+        REGISTRY.record_query(self._endpoint, query, self._elapsed, rows)
+        duration_ms = self._elapsed * 1000
+        if duration_ms >= REGISTRY.slow_query_ms:
+            params = self._params
+            REGISTRY.record_slow({
+                'at': time.time(),
+                'endpoint': self._endpoint,
+                'sql': query,
+                'duration_ms': round(duration_ms, 2),
+                'rows': rows,
+                # executemany parameters are an iterator that has been used up
+                'plan': _query_plan(self.connection, sql, params) if isinstance(params, (tuple, list, dict)) else [],
+            })
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters)
+        self._timed(super().execute, sql, parameters)
+        if self.description is None:
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql, None)
+        self._timed(super().executemany, sql, seq_of_parameters)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """connection whose statements all run through ProfilingCursor."""
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_factory(config):
+    """class the pool opens connections with."""
+    return ProfilingConnection if config['METRICS_ENABLED'] else sqlite3.Connection
+
+
+def _before_request():
+    g._metrics_started = time.perf_counter()
+
+
+def _after_request(response):
+    started = g.pop('_metrics_started', None)
+    if started is not None:
+        REGISTRY.record_request(request.endpoint or 'unknown', request.method, response.status_code,
+                                time.perf_counter() - started)
+    return response
+
+
+def init_app(app):
+    config = app.config
+    REGISTRY.enabled = config['METRICS_ENABLED']
+    REGISTRY.slow_query_ms = config['SLOW_QUERY_MS']
+    REGISTRY.max_query_series = config['METRICS_MAX_QUERY_SERIES']
+    REGISTRY.logger = app.logger
+    REGISTRY.reset(slow_log_size=config['SLOW_QUERY_LOG_SIZE'])
+    if REGISTRY.enabled:
+        # streamed responses (exports) are timed until the response object is ready
+        app.before_request(_before_request)
+        app.after_request(_after_request)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}'
+
+
+def _le(bound):
+    return 'le="%s"' % bound
+
+
+def _histogram_lines(name, help_text, histogram, label_names):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for labels, (counts, total, count) in sorted(histogram.series.items()):
+        cumulative = 0
+        for bound, n in zip(histogram.buckets, counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{_labels(label_names, labels, _le(bound))} {cumulative}')
+        lines.append(f'{name}_bucket{_labels(label_names, labels, _le("+Inf"))} {count}')
+        series = _labels(label_names, labels)
+        lines.append(f'{name}_sum{series} {total}')
+        lines.append(f'{name}_count{series} {count}')
+    return lines
+
+
+def render(pool=None, cache=None):
+    """all metrics in the prometheus text exposition format."""
+    with REGISTRY._lock:
+        lines = ['# HELP erp_requests_total Requests handled, by endpoint, method and status.',
+                 '# TYPE erp_requests_total counter']
+        for labels, n in sorted(REGISTRY.requests.items()):
+            lines.append(f"erp_requests_total{_labels(('endpoint', 'method', 'status'), labels)} {n}")
+        lines += _histogram_lines('erp_request_duration_seconds', 'Request latency.',
+                                  REGISTRY.request_latency, ('endpoint', 'method'))
+        lines += _histogram_lines('erp_sql_query_duration_seconds',
+                                  'Statement time from execute until its rows were consumed.',
+                                  REGISTRY.query_latency, ('endpoint', 'query'))
+        lines += ['# HELP erp_sql_rows_total Rows returned (or changed) by statements.',
+                  '# TYPE erp_sql_rows_total counter']
+        for labels, n in sorted(REGISTRY.query_rows.items()):
+            lines.append(f"erp_sql_rows_total{_labels(('endpoint', 'query'), labels)} {n}")
+        lines += ['# HELP erp_sql_slow_queries_total Statements slower than SLOW_QUERY_MS.',
+                  '# TYPE erp_sql_slow_queries_total counter',
+                  f'erp_sql_slow_queries_total {REGISTRY.slow_queries_total}']
+    if pool is not None:
+        for key in ('in_use', 'idle', 'size'):
+            lines += [f'# TYPE erp_db_pool_{key} gauge', f'erp_db_pool_{key} {pool[key]}']
+        for key in ('created', 'waits', 'timeouts'):
+            lines += [f'# TYPE erp_db_pool_{key}_total counter', f'erp_db_pool_{key}_total {pool[key]}']
+    if cache is not None:
+        lines += ['# TYPE erp_cache_hits_total counter', f"erp_cache_hits_total {cache['hits']}",
+                  '# TYPE erp_cache_misses_total counter', f"erp_cache_misses_total {cache['misses']}"]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,650 @@
+"""versioned schema migrations, tracked in the schema_version table.
+
+every migration is (version, description, [statements]). versions are applied in
+order, each inside its own transaction, and are never edited once shipped:
+to change the schema append a new entry to MIGRATIONS.
+"""
+
+# (re)fills MonthlyRollup from the ledger, also used by `flask rebuild-rollup`
+ROLLUP_REBUILD_SQL = [
+    'DELETE FROM MonthlyRollup',
+    '''
+    INSERT INTO MonthlyRollup (month, product_id, type, units, value, txn_count)
+    SELECT substr(date, 1, 7), product_id, type, SUM(quantity), SUM(quantity * unit_price), COUNT(*)
+    FROM "Transaction"
+    GROUP BY substr(date, 1, 7), product_id, type
+    ''',
+]
+
+
+def _rollup_add(sign, row):
+    # upsert of one ledger row (NEW or OLD) into its month/product/type bucket
+    return f'''
+        INSERT INTO MonthlyRollup (month, product_id, type, units, value, txn_count)
+        VALUES (substr({row}.date, 1, 7), {row}.product_id, {row}.type,
+                {sign}{row}.quantity, {sign}{row}.quantity * {row}.unit_price, {sign}1)
+        ON CONFLICT (month, product_id, type) DO UPDATE SET
+            units = units + excluded.units,
+            value = value + excluded.value,
+            txn_count = txn_count + excluded.txn_count;
+    '''
+
+
+_ROLLUP_PRUNE = '''
+        DELETE FROM MonthlyRollup
+        WHERE month = substr(OLD.date, 1, 7) AND product_id = OLD.product_id
+          AND type = OLD.type AND txn_count = 0;
+'''
+
+
+def _movement(row, reversal=False):
+    # stock movement of one ledger row (NEW or OLD), negated when it reverts the row
+    sign = '-' if reversal else ''
+    reason = "'reversal'" if reversal else f"CASE WHEN {row}.type = 'purchase' THEN 'receipt' ELSE 'issue' END"
+    return f'''
+        INSERT INTO StockMovement (product_id, transaction_id, date, quantity, unit_price, reason)
+        VALUES ({row}.product_id, {row}.id, {row}.date,
+                {sign}(CASE WHEN {row}.type = 'purchase' THEN {row}.quantity ELSE -{row}.quantity END),
+                {row}.unit_price, {reason});
+    '''
+
+
+def _valuation_total_add(sign, row):
+    # adds (or with sign '-' removes) one ValuationMonthly row to its month's total
+    return f'''
+        INSERT INTO ValuationMonthTotal (month, units_sold, revenue, cogs, purchases, adjustments, value_change)
+        VALUES ({row}.month, {sign}{row}.units_sold, {sign}{row}.revenue, {sign}{row}.cogs,
+                {sign}{row}.purchases, {sign}{row}.adjustments, {sign}{row}.value_change)
+        ON CONFLICT (month) DO UPDATE SET
+            units_sold = units_sold + excluded.units_sold,
+            revenue = revenue + excluded.revenue,
+            cogs = cogs + excluded.cogs,
+            purchases = purchases + excluded.purchases,
+            adjustments = adjustments + excluded.adjustments,
+            value_change = value_change + excluded.value_change;
+    '''
+
+
+# effective reorder threshold of product p: its own level, else its supplier's default,
+# else the global default (migration 8)
+_THRESHOLD = 'COALESCE(p.reorder_level, s.default_reorder_level, d.default_threshold)'
+
+
+def low_stock_sync(where):
+    """statements that bring LowStock in line for the products matching `where` (over
+    Product p) and log a StockAlert for each one crossing its threshold either way."""
+    source = f'''
+        FROM Product p
+        LEFT JOIN Supplier s ON s.id = p.supplier_id
+        CROSS JOIN StockAlertSetting d
+        WHERE {where}'''
+    return [
+        f'''
+        INSERT INTO StockAlert (product_id, event, stock_quantity, threshold)
+        SELECT p.id, 'low', p.stock_quantity, {_THRESHOLD} {source}
+          AND p.stock_quantity < {_THRESHOLD} AND p.id NOT IN (SELECT product_id FROM LowStock);
+        ''',
+        f'''
+        INSERT INTO StockAlert (product_id, event, stock_quantity, threshold)
+        SELECT p.id, 'restocked', p.stock_quantity, {_THRESHOLD} {source}
+          AND p.stock_quantity >= {_THRESHOLD} AND p.id IN (SELECT product_id FROM LowStock);
+        ''',
+        f'''
+        DELETE FROM LowStock WHERE product_id IN (SELECT p.id {source} AND p.stock_quantity >= {_THRESHOLD});
+        ''',
+        f'''
+        INSERT INTO LowStock (product_id, stock_quantity, threshold)
+        SELECT p.id, p.stock_quantity, {_THRESHOLD} {source} AND p.stock_quantity < {_THRESHOLD}
+        ON CONFLICT (product_id) DO UPDATE SET
+            stock_quantity = excluded.stock_quantity,
+            threshold = excluded.threshold;
+        ''',
+    ]
+
+
+# DataVersion counter -> table it follows (migration 6)
+DATA_VERSION_TABLES = {'suppliers': 'Supplier', 'products': 'Product', 'transactions': '"Transaction"'}
+
+
+MIGRATIONS = [
+    (1, 'secondary indexes for the hot ledger/product queries', [
+        # 30 day per-product history in suggest_reorder_quantity_from_ai
+        'CREATE INDEX IF NOT EXISTS idx_transaction_product_date ON "Transaction" (product_id, date)',
+        # WHERE type = ? GROUP BY month in reports(), covering so the monthly
+        # sums never touch the table rows
+        'CREATE INDEX IF NOT EXISTS idx_transaction_type_date ON "Transaction" (type, date, quantity, unit_price)',
+        # keyset pagination of the ledger, ORDER BY date DESC, id DESC
+        'CREATE INDEX IF NOT EXISTS idx_transaction_date_id ON "Transaction" (date, id)',
+        # delete_supplier product check and supplier product counts
+        'CREATE INDEX IF NOT EXISTS idx_product_supplier ON Product (supplier_id)',
+        # dashboard/reports low stock list, only ever holds the handful of low products
+        'CREATE INDEX IF NOT EXISTS idx_product_low_stock ON Product (stock_quantity) WHERE stock_quantity < 10',
+    ]),
+    (2, 'monthly per-product sales/purchase rollup kept current by triggers', [
+        '''
+        CREATE TABLE IF NOT EXISTS MonthlyRollup (
+            month TEXT NOT NULL, -- YYYY-MM
+            product_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            units INTEGER NOT NULL,
+            value REAL NOT NULL,
+            txn_count INTEGER NOT NULL,
+            PRIMARY KEY (month, product_id, type)
+        ) WITHOUT ROWID
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_insert AFTER INSERT ON "Transaction"
+        BEGIN
+            {_rollup_add('', 'NEW')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_delete AFTER DELETE ON "Transaction"
+        BEGIN
+            {_rollup_add('-', 'OLD')}
+            {_ROLLUP_PRUNE}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_update
+        AFTER UPDATE OF product_id, quantity, type, date, unit_price ON "Transaction"
+        BEGIN
+            {_rollup_add('-', 'OLD')}
+            {_ROLLUP_PRUNE}
+            {_rollup_add('', 'NEW')}
+        END
+        ''',
+        *ROLLUP_REBUILD_SQL,
+    ]),
+    (3, 'trigram search index over product name, sku and supplier name', [
+        # rowid is the product id. the trigram tokenizer matches any substring of 3+
+        # characters, case-insensitively, so 'lap' finds 'LAP-00042' and 'Laptop'
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS ProductSearch
+        USING fts5(name, sku, supplier_name, tokenize = 'trigram')
+        ''',
+        # only name/sku/supplier changes touch the index, stock updates do not
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_search_product_insert AFTER INSERT ON Product
+        BEGIN
+            INSERT INTO ProductSearch (rowid, name, sku, supplier_name)
+            VALUES (NEW.id, NEW.name, NEW.sku, (SELECT name FROM Supplier WHERE id = NEW.supplier_id));
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_search_product_update
+        AFTER UPDATE OF id, name, sku, supplier_id ON Product
+        BEGIN
+            DELETE FROM ProductSearch WHERE rowid = OLD.id;
+            INSERT INTO ProductSearch (rowid, name, sku, supplier_name)
+            VALUES (NEW.id, NEW.name, NEW.sku, (SELECT name FROM Supplier WHERE id = NEW.supplier_id));
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_search_product_delete AFTER DELETE ON Product
+        BEGIN
+            DELETE FROM ProductSearch WHERE rowid = OLD.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_search_supplier_update AFTER UPDATE OF name ON Supplier
+        BEGIN
+            UPDATE ProductSearch SET supplier_name = NEW.name
+            WHERE rowid IN (SELECT id FROM Product WHERE supplier_id = NEW.id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_search_supplier_delete AFTER DELETE ON Supplier
+        BEGIN
+            UPDATE ProductSearch SET supplier_name = NULL
+            WHERE rowid IN (SELECT id FROM Product WHERE supplier_id = OLD.id);
+        END
+        ''',
+        'DELETE FROM ProductSearch',
+        '''
+        INSERT INTO ProductSearch (rowid, name, sku, supplier_name)
+        SELECT p.id, p.name, p.sku, s.name FROM Product p LEFT JOIN Supplier s ON s.id = p.supplier_id
+        ''',
+        # keyset pagination of the product list, ORDER BY name, id
+        'CREATE INDEX IF NOT EXISTS idx_product_name ON Product (name)',
+        # exact and prefix lookups (sku = ? / LIKE 'q%' are case-insensitive, so NOCASE)
+        'CREATE INDEX IF NOT EXISTS idx_product_sku_nocase ON Product (sku COLLATE NOCASE)',
+        'CREATE INDEX IF NOT EXISTS idx_product_name_nocase ON Product (name COLLATE NOCASE)',
+    ]),
+    (4, 'append-only stock movement ledger and per-product stock snapshots', [
+        # every change of a product's stock as a signed quantity on a business date.
+        # rows are never updated or deleted: editing a transaction appends a reversal of
+        # the old movement and a new one, so history stays reproducible
+        '''
+        CREATE TABLE IF NOT EXISTS StockMovement (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            transaction_id INTEGER, -- NULL for opening balances and adjustments
+            date TEXT NOT NULL, -- YYYY-MM-DD the stock changed on
+            quantity INTEGER NOT NULL, -- signed: receipts > 0, issues < 0
+            unit_price REAL,
+            reason TEXT NOT NULL, -- receipt, issue, reversal, opening, adjustment, closing, reconcile
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_movement_product_date ON StockMovement (product_id, date)',
+        'CREATE INDEX IF NOT EXISTS idx_movement_date ON StockMovement (date, product_id, quantity)',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_movement_no_update BEFORE UPDATE ON StockMovement
+        BEGIN
+            SELECT RAISE(ABORT, 'StockMovement is append-only');
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_movement_no_delete BEFORE DELETE ON StockMovement
+        BEGIN
+            SELECT RAISE(ABORT, 'StockMovement is append-only');
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_movement_txn_insert AFTER INSERT ON "Transaction"
+        BEGIN
+            {_movement('NEW')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_movement_txn_update
+        AFTER UPDATE OF product_id, quantity, type, date, unit_price ON "Transaction"
+        BEGIN
+            {_movement('OLD', reversal=True)}
+            {_movement('NEW')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_movement_txn_delete AFTER DELETE ON "Transaction"
+        BEGIN
+            {_movement('OLD', reversal=True)}
+        END
+        ''',
+        # stock a product is created with is its opening balance, stock left when it is
+        # deleted is closed out. stock_quantity updates themselves are not watched: the
+        # transaction triggers above and stock.set_stock() record those
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_movement_product_insert AFTER INSERT ON Product
+        WHEN NEW.stock_quantity != 0
+        BEGIN
+            INSERT INTO StockMovement (product_id, date, quantity, unit_price, reason)
+            VALUES (NEW.id, date('now'), NEW.stock_quantity, NEW.unit_price, 'opening');
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_movement_product_delete AFTER DELETE ON Product
+        WHEN OLD.stock_quantity != 0
+        BEGIN
+            INSERT INTO StockMovement (product_id, date, quantity, unit_price, reason)
+            VALUES (OLD.id, date('now'), -OLD.stock_quantity, OLD.unit_price, 'closing');
+        END
+        ''',
+        # one row per snapshot date: every movement with id <= last_movement_id and
+        # date <= snapshot date is included in that date's StockSnapshot rows
+        '''
+        CREATE TABLE IF NOT EXISTS StockSnapshotRun (
+            date TEXT PRIMARY KEY,
+            last_movement_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS StockSnapshot (
+            date TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            PRIMARY KEY (date, product_id)
+        ) WITHOUT ROWID
+        ''',
+        # backfill: the existing ledger, then an opening balance for whatever stock the
+        # ledger does not explain (stock entered with the product), dated before both
+        '''
+        INSERT INTO StockMovement (product_id, transaction_id, date, quantity, unit_price, reason)
+        SELECT product_id, id, date,
+               CASE WHEN type = 'purchase' THEN quantity ELSE -quantity END, unit_price,
+               CASE WHEN type = 'purchase' THEN 'receipt' ELSE 'issue' END
+        FROM "Transaction"
+        ORDER BY date, id
+        ''',
+        '''
+        INSERT INTO StockMovement (product_id, date, quantity, unit_price, reason)
+        SELECT p.id,
+               MIN(COALESCE(date(p.created_at), date('now')), COALESCE(MIN(t.date), date('now'))),
+               p.stock_quantity - COALESCE(SUM(CASE WHEN t.type = 'purchase' THEN t.quantity ELSE -t.quantity END), 0),
+               p.unit_price, 'opening'
+        FROM Product p
+        LEFT JOIN "Transaction" t ON t.product_id = p.id
+        GROUP BY p.id
+        HAVING p.stock_quantity - COALESCE(SUM(CASE WHEN t.type = 'purchase' THEN t.quantity ELSE -t.quantity END), 0) != 0
+        ''',
+    ]),
+    (5, 'inventory valuation at cost (weighted average / fifo), recomputed per product', [
+        # running stock and cost of a product after each of its events (transactions and
+        # non-transaction movements) in business order, so a recompute can resume from any
+        # date. unit_cost is the cost per unit received or issued, cost_after the moving
+        # average (wavg) or the cost of the newest receipt (fifo)
+        '''
+        CREATE TABLE IF NOT EXISTS ValuationEvent (
+            product_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            direction INTEGER NOT NULL, -- 0 in, 1 out: receipts of a day come before its issues
+            source TEXT NOT NULL, -- 't' Transaction, 'm' StockMovement without a transaction
+            source_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL, -- signed
+            unit_cost REAL NOT NULL,
+            revenue REAL NOT NULL DEFAULT 0,
+            qty_after INTEGER NOT NULL,
+            value_after REAL NOT NULL,
+            cost_after REAL NOT NULL,
+            PRIMARY KEY (product_id, date, direction, source, source_id)
+        ) WITHOUT ROWID
+        ''',
+        # per product and month: sales, cost of goods sold, purchases, adjustments and the
+        # closing stock value. value_change is closing value minus the previous closing value
+        '''
+        CREATE TABLE IF NOT EXISTS ValuationMonthly (
+            product_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            units_sold INTEGER NOT NULL,
+            revenue REAL NOT NULL,
+            cogs REAL NOT NULL,
+            purchases REAL NOT NULL,
+            adjustments REAL NOT NULL,
+            closing_qty INTEGER NOT NULL,
+            closing_value REAL NOT NULL,
+            value_change REAL NOT NULL,
+            PRIMARY KEY (product_id, month)
+        ) WITHOUT ROWID
+        ''',
+        # the same summed over all products, one row per month, kept by the triggers below.
+        # inventory value at the end of a month is the running sum of value_change
+        '''
+        CREATE TABLE IF NOT EXISTS ValuationMonthTotal (
+            month TEXT PRIMARY KEY,
+            units_sold INTEGER NOT NULL,
+            revenue REAL NOT NULL,
+            cogs REAL NOT NULL,
+            purchases REAL NOT NULL,
+            adjustments REAL NOT NULL,
+            value_change REAL NOT NULL
+        )
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_valuation_total_insert AFTER INSERT ON ValuationMonthly
+        BEGIN
+            {_valuation_total_add('', 'NEW')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_valuation_total_delete AFTER DELETE ON ValuationMonthly
+        BEGIN
+            {_valuation_total_add('-', 'OLD')}
+        END
+        ''',
+        # products whose valuation must be recomputed, from which date. every stock change
+        # goes through StockMovement, so one trigger there catches all write paths
+        '''
+        CREATE TABLE IF NOT EXISTS ValuationDirty (
+            product_id INTEGER PRIMARY KEY,
+            since TEXT NOT NULL
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_valuation_dirty AFTER INSERT ON StockMovement
+        BEGIN
+            INSERT INTO ValuationDirty (product_id, since) VALUES (NEW.product_id, NEW.date)
+            ON CONFLICT (product_id) DO UPDATE SET since = MIN(since, excluded.since);
+        END
+        ''',
+        # method the stored valuation was computed with. empty until the first refresh,
+        # which then values every product from the start (see valuation.refresh)
+        '''
+        CREATE TABLE IF NOT EXISTS ValuationState (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            method TEXT NOT NULL
+        )
+        ''',
+    ]),
+    (6, 'per-table data version counters for conditional GETs', [
+        # bumped by triggers on every write to the table, from any worker or path, so an
+        # ETag built from it changes exactly when the data behind a response may have
+        '''
+        CREATE TABLE IF NOT EXISTS DataVersion (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        "INSERT OR IGNORE INTO DataVersion (name) VALUES ('suppliers'), ('products'), ('transactions')",
+        *[f'''
+        CREATE TRIGGER IF NOT EXISTS trg_version_{name}_{event.lower()} AFTER {event} ON {table}
+        BEGIN
+            UPDATE DataVersion SET version = version + 1 WHERE name = '{name}';
+        END
+        ''' for name, table in DATA_VERSION_TABLES.items() for event in ('INSERT', 'UPDATE', 'DELETE')],
+    ]),
+    (7, 'background job queue (jobs.py)', [
+        # times are unix seconds. run_at is when a queued job may start (later after a
+        # failed attempt), leased_until when a running one is given up on
+        '''
+        CREATE TABLE IF NOT EXISTS Job (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL, -- json
+            status TEXT NOT NULL CHECK (status IN ('queued', 'running', 'done', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            result TEXT, -- json
+            error TEXT,
+            run_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            leased_until REAL,
+            worker TEXT
+        )
+        ''',
+        # claim: next queued job by run_at; also the running-per-kind counts
+        'CREATE INDEX IF NOT EXISTS idx_job_status_run_at ON Job (status, run_at)',
+        'CREATE INDEX IF NOT EXISTS idx_job_status_kind ON Job (status, kind)',
+        '''
+        CREATE TABLE IF NOT EXISTS JobWorker (
+            name TEXT PRIMARY KEY, -- host:pid
+            pid INTEGER NOT NULL,
+            threads INTEGER NOT NULL,
+            seen_at REAL NOT NULL
+        )
+        ''',
+    ]),
+    (8, 'per-product reorder thresholds, maintained low-stock set and stock alert log', [
+        # NULL: use the supplier's default, then the global one in StockAlertSetting
+        'ALTER TABLE Product ADD COLUMN reorder_level INTEGER',
+        'ALTER TABLE Supplier ADD COLUMN default_reorder_level INTEGER',
+        # set from ERP_LOW_STOCK_THRESHOLD by `flask init-db` (alerts.set_default_threshold)
+        '''
+        CREATE TABLE IF NOT EXISTS StockAlertSetting (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            default_threshold INTEGER NOT NULL
+        )
+        ''',
+        'INSERT OR IGNORE INTO StockAlertSetting (id, default_threshold) VALUES (1, 10)',
+        # products currently below their threshold. the dashboard reads this instead of
+        # scanning Product, and it only ever holds the handful of low products
+        '''
+        CREATE TABLE IF NOT EXISTS LowStock (
+            product_id INTEGER PRIMARY KEY,
+            stock_quantity INTEGER NOT NULL,
+            threshold INTEGER NOT NULL,
+            since TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_low_stock_quantity ON LowStock (stock_quantity)',
+        # threshold crossings in order, read by the /api/alerts/stream event stream
+        '''
+        CREATE TABLE IF NOT EXISTS StockAlert (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            event TEXT NOT NULL, -- low, restocked, deleted
+            stock_quantity INTEGER NOT NULL,
+            threshold INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # a log for live clients, not an archive: keep the newest 10000
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_alert_prune AFTER INSERT ON StockAlert
+        WHEN NEW.id % 1000 = 0
+        BEGIN
+            DELETE FROM StockAlert WHERE id <= NEW.id - 10000;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_low_stock_product_insert AFTER INSERT ON Product
+        BEGIN
+            {''.join(low_stock_sync('p.id = NEW.id'))}
+        END
+        ''',
+        # every stock change ends in an UPDATE of stock_quantity, whichever path made it
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_low_stock_product_update
+        AFTER UPDATE OF stock_quantity, reorder_level, supplier_id ON Product
+        WHEN NEW.stock_quantity IS NOT OLD.stock_quantity OR NEW.reorder_level IS NOT OLD.reorder_level
+          OR NEW.supplier_id IS NOT OLD.supplier_id
+        BEGIN
+            {''.join(low_stock_sync('p.id = NEW.id'))}
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_low_stock_product_delete AFTER DELETE ON Product
+        WHEN OLD.id IN (SELECT product_id FROM LowStock)
+        BEGIN
+            INSERT INTO StockAlert (product_id, event, stock_quantity, threshold)
+            SELECT product_id, 'deleted', stock_quantity, threshold FROM LowStock WHERE product_id = OLD.id;
+            DELETE FROM LowStock WHERE product_id = OLD.id;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_low_stock_supplier_default
+        AFTER UPDATE OF default_reorder_level ON Supplier
+        WHEN NEW.default_reorder_level IS NOT OLD.default_reorder_level
+        BEGIN
+            {''.join(low_stock_sync('p.supplier_id = NEW.id'))}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_low_stock_default AFTER UPDATE ON StockAlertSetting
+        BEGIN
+            {''.join(low_stock_sync('1'))}
+        END
+        ''',
+        # backfill without alerts: the products low right now are the starting set
+        f'''
+        INSERT INTO LowStock (product_id, stock_quantity, threshold)
+        SELECT p.id, p.stock_quantity, {_THRESHOLD}
+        FROM Product p LEFT JOIN Supplier s ON s.id = p.supplier_id CROSS JOIN StockAlertSetting d
+        WHERE p.stock_quantity < {_THRESHOLD}
+        ''',
+        # replaced by LowStock
+        'DROP INDEX IF EXISTS idx_product_low_stock',
+    ]),
+    (9, 'covering index for date range reports', [
+        # day/week reports (reports.py) read every column they need from the index,
+        # in date order, for just the requested range
+        '''
+        CREATE INDEX IF NOT EXISTS idx_transaction_date_report
+        ON "Transaction" (date, type, product_id, quantity, unit_price)
+        ''',
+    ]),
+]
+
+# the queries the indexes above exist for: name -> (sql, sample params)
+HOT_QUERIES = {
+    'reorder_30_day_history': ('''
+        SELECT type, SUM(quantity) as total_quantity
+        FROM "Transaction"
+        WHERE product_id = ? AND date >= ?
+        GROUP BY type
+    ''', (1, '2025-01-01')),
+    'reports_sales_by_month': ('''
+        SELECT strftime('%Y-%m', date) as month, SUM(quantity) as total_sold
+        FROM "Transaction"
+        WHERE type = 'sale'
+        GROUP BY month
+    ''', ()),
+    'reports_date_range': ('''
+        SELECT date, product_id, type, SUM(quantity), SUM(quantity * unit_price), COUNT(*)
+        FROM "Transaction"
+        WHERE date >= ? AND date <= ?
+        GROUP BY date, product_id, type
+    ''', ('2025-01-01', '2025-03-31')),
+    'transactions_page': ('''
+        SELECT t.id FROM "Transaction" t
+        ORDER BY t.date DESC, t.id DESC
+        LIMIT 50
+    ''', ()),
+    'dashboard_low_stock': ('''
+        SELECT p.*, l.threshold, s.name AS supplier_name
+        FROM LowStock l
+        JOIN Product p ON p.id = l.product_id
+        LEFT JOIN Supplier s ON p.supplier_id = s.id
+        ORDER BY l.stock_quantity ASC
+    ''', ()),
+    'delete_supplier_product_check': ('SELECT COUNT(*) FROM Product WHERE supplier_id = ?', (1,)),
+}
+
+
+def current_version(db):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return db.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(db, target=None):
+    """applies every pending migration up to target (default: latest). returns the versions applied."""
+    applied = []
+    version = current_version(db)
+    db.commit()
+    for number, description, statements in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            # re-check under the write lock, another worker may have just run it
+            if db.execute('SELECT 1 FROM schema_version WHERE version = ?', (number,)).fetchone():
+                db.rollback()
+                continue
+            for statement in statements:
+                db.execute(statement)
+            db.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                       (number, description))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        applied.append(number)
+    if applied:
+        # refresh planner statistics so the new indexes are actually picked
+        db.execute('ANALYZE')
+        db.commit()
+    return applied
+
+
+def explain(db, sql, params=()):
+    """EXPLAIN QUERY PLAN detail lines for one query."""
+    return [row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+
+
+def check_hot_queries(db):
+    """plans for HOT_QUERIES. a query counts as indexed if no step is a plain full table scan."""
+    report = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = explain(db, sql, params)
+        full_scans = [step for step in plan
+                      if step.startswith('SCAN ') and ' USING ' not in step]
+        report[name] = {'plan': plan, 'indexed': not full_scans}
+    return report
@@ -0,0 +1,225 @@
+"""typed rows for suppliers, products and transactions, and the queries that load them.
+
+each record is a tuple subclass with empty __slots__: the row tuple sqlite already built
+plus named properties, no per-row dict and no per-row attribute storage. the cursor's
+row factory builds the record straight from the fetched tuple, so list pages skip the
+sqlite3.Row -> dict copy the helpers used to make.
+
+attribute access gives typed values and is what templates and python code use: date
+and timestamp columns are only parsed when read (product.created_at, txn.date), and
+each distinct string is parsed once per process. item access (record['name']),
+keys() and dict(record) give the stored values, so json output keeps the plain
+'YYYY-MM-DD' strings the API has always returned.
+"""
+from datetime import date, datetime
+from functools import lru_cache
+from operator import itemgetter
+
+_tuple_getitem = tuple.__getitem__
+
+
+@lru_cache(maxsize=4096)
+def parse_timestamp(value):
+    """'YYYY-MM-DD HH:MM:SS' as stored by CURRENT_TIMESTAMP."""
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value):
+    return date.fromisoformat(value)
+
+
+def _field(index):
+    return property(itemgetter(index))
+
+
+def _parsed(index, parse):
+    def get(self):
+        value = _tuple_getitem(self, index)
+        return parse(value) if value else None
+    return property(get)
+
+
+class Record(tuple):
+    """base of the row records. subclasses list their columns in FIELDS, in select order,
+    and the columns to parse on read in PARSE."""
+    __slots__ = ()
+    FIELDS = ()
+    PARSE = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._index = {name: i for i, name in enumerate(cls.FIELDS)}
+        for i, name in enumerate(cls.FIELDS):
+            setattr(cls, name, _parsed(i, cls.PARSE[name]) if name in cls.PARSE else _field(i))
+
+        def row_factory(cursor, row, _new=tuple.__new__, _cls=cls):
+            return _new(_cls, row)
+        cls.row_factory = staticmethod(row_factory)
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            key = self._index[key]
+        return _tuple_getitem(self, key)
+
+    def keys(self):
+        return self.FIELDS
+
+    def get(self, key, default=None):
+        return self[key] if key in self._index else default
+
+    def _asdict(self):
+        return dict(zip(self.FIELDS, tuple.__iter__(self)))
+
+    def __repr__(self):
+        values = ', '.join(f'{name}={value!r}' for name, value in zip(self.FIELDS, tuple.__iter__(self)))
+        return f'{type(self).__name__}({values})'
+
+    @classmethod
+    def columns(cls, **joined):
+        """the select list for FIELDS: own columns as `alias.name`, joined ones as given,
+        columns that neither has as NULL."""
+        alias = joined.pop('alias', None)
+        own = joined.pop('own', cls.FIELDS)
+        parts = []
+        for name in cls.FIELDS:
+            if name in joined:
+                parts.append(f'{joined[name]} AS {name}')
+            elif name in own:
+                parts.append(f'{alias}.{name}' if alias else name)
+            else:
+                parts.append(f'NULL AS {name}')
+        return ', '.join(parts)
+
+
+class Supplier(Record):
+    __slots__ = ()
+    FIELDS = ('id', 'name', 'contact_email', 'default_reorder_level', 'created_at', 'updated_at',
+              'product_count')
+    PARSE = {'created_at': parse_timestamp, 'updated_at': parse_timestamp}
+
+
+class Product(Record):
+    __slots__ = ()
+    FIELDS = ('id', 'name', 'sku', 'stock_quantity', 'unit_price', 'supplier_id', 'reorder_level',
+              'created_at', 'updated_at', 'supplier_name')
+    PARSE = {'created_at': parse_timestamp, 'updated_at': parse_timestamp}
+
+
+class Transaction(Record):
+    __slots__ = ()
+    FIELDS = ('id', 'product_id', 'quantity', 'type', 'date', 'unit_price',
+              'product_name', 'product_sku', 'product_current_price', 'current_product_stock')
+    PARSE = {'date': parse_date}
+
+
+def fetch(db, record, sql, params=()):
+    """runs a query whose select list is record.columns(...) and returns records."""
+    cursor = db.cursor()
+    cursor.row_factory = record.row_factory
+    return cursor.execute(sql, params).fetchall()
+
+
+def fetch_one(db, record, sql, params=()):
+    rows = fetch(db, record, sql, params)
+    return rows[0] if rows else None
+
+
+# --- Products ---
+
+_PRODUCT_OWN = Product.FIELDS[:-1]
+PRODUCT_COLUMNS = Product.columns(alias='p', own=_PRODUCT_OWN, supplier_name='s.name')
+
+
+def all_products(db):
+    """every product with its supplier name, by name."""
+    return fetch(db, Product, f'''
+        SELECT {PRODUCT_COLUMNS}
+        FROM Product p
+        LEFT JOIN Supplier s ON p.supplier_id = s.id
+        ORDER BY p.name
+    ''')
+
+
+def products_page(db, where_sql='', params=(), limit=50):
+    """up to `limit` products matching where_sql, ordered by (name, id)."""
+    return fetch(db, Product, f'''
+        SELECT {PRODUCT_COLUMNS}
+        FROM Product p
+        LEFT JOIN Supplier s ON p.supplier_id = s.id
+        {where_sql}
+        ORDER BY p.name, p.id
+        LIMIT ?
+    ''', (*params, limit))
+
+
+def product(db, product_id):
+    return fetch_one(db, Product, f'''
+        SELECT {PRODUCT_COLUMNS}
+        FROM Product p
+        LEFT JOIN Supplier s ON p.supplier_id = s.id
+        WHERE p.id = ?
+    ''', (product_id,))
+
+
+# --- Suppliers ---
+
+_SUPPLIER_OWN = Supplier.FIELDS[:-1]
+
+
+def all_suppliers(db):
+    """every supplier with its product count, by name."""
+    return fetch(db, Supplier, f'''
+        SELECT {Supplier.columns(alias='s', own=_SUPPLIER_OWN, product_count='COUNT(p.id)')}
+        FROM Supplier s
+        LEFT JOIN Product p ON s.id = p.supplier_id
+        GROUP BY s.id
+        ORDER BY s.name
+    ''')
+
+
+def supplier(db, supplier_id):
+    return fetch_one(db, Supplier, f'''
+        SELECT {Supplier.columns(own=_SUPPLIER_OWN)}
+        FROM Supplier
+        WHERE id = ?
+    ''', (supplier_id,))
+
+
+# --- Transactions ---
+
+_TRANSACTION_OWN = Transaction.FIELDS[:6]
+TRANSACTION_COLUMNS = Transaction.columns(alias='t', own=_TRANSACTION_OWN, product_name='p.name',
+                                           product_sku='p.sku', product_current_price='p.unit_price',
+                                           current_product_stock='p.stock_quantity')
+
+
+def all_transactions(db):
+    """the whole ledger with product names, newest first."""
+    return fetch(db, Transaction, f'''
+        SELECT {TRANSACTION_COLUMNS}
+        FROM "Transaction" t
+        JOIN Product p ON t.product_id = p.id
+        ORDER BY t.date DESC, t.id DESC
+    ''')
+
+
+def transactions_page(db, where_sql='', params=(), limit=50):
+    """up to `limit` transactions matching where_sql, newest first by (date, id)."""
+    return fetch(db, Transaction, f'''
+        SELECT {TRANSACTION_COLUMNS}
+        FROM "Transaction" t
+        JOIN Product p ON t.product_id = p.id
+        {where_sql}
+        ORDER BY t.date DESC, t.id DESC
+        LIMIT ?
+    ''', (*params, limit))
+
+
+def transaction(db, transaction_id):
+    return fetch_one(db, Transaction, f'''
+        SELECT {TRANSACTION_COLUMNS}
+        FROM "Transaction" t
+        JOIN Product p ON t.product_id = p.id
+        WHERE t.id = ?
+    ''', (transaction_id,))
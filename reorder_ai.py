@@ -0,0 +1,181 @@
+"""Together AI reorder suggestions: one shared client, a result cache and batched calls.
+
+the model only sees numbers gathered beforehand (stock, 30 day sales/purchases), so
+the calls here never touch the database and can run on a thread pool. results are
+cached on (product, stock, 30 day sales): as long as those are unchanged, asking
+again returns the earlier answer instead of paying for another model call.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from cache import MemoryCache
+
+_client = None
+_client_lock = threading.Lock()
+_suggestions = MemoryCache()
+_stats = {'calls': 0, 'cache_hits': 0, 'errors': 0, 'timeouts': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(field):
+    with _stats_lock:
+        _stats[field] += 1
+
+
+def get_client(config):
+    """the process wide Together client, built once from AI_* settings.
+
+    the SDK is imported here, on the first model call, not at startup: it pulls in
+    aiohttp, pydantic and friends and is most of the app's import time otherwise.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from together import Together
+                _client = Together(api_key=config['TOGETHER_API_KEY'],
+                                   base_url=config['TOGETHER_BASE_URL'] or None,
+                                   timeout=config['AI_TIMEOUT'],
+                                   max_retries=config['AI_MAX_RETRIES'])
+    return _client
+
+
+def build_prompt(product, total_sales_30_days, total_purchases_30_days):
+    return (
+        f"suggest an optimal reorder quantity for {product['name']} (SKU: {product['sku']}). " # we target the product using 'sku'
+        f"current stock: {product['stock_quantity']} units. "
+        f"transaction history for the last 30 days: {total_sales_30_days} units sold, "
+        f"{total_purchases_30_days} units purchased. "
+        "consider a typical lead time of 7 days and aim to maintain stock for approximately 30 days of sales. "
+        "output your suggestion strictly as a JSON object with two keys: 'reorder_quantity' (integer) and 'reasoning' (string)."
+        "for example: {'reorder_quantity': 100, 'reasoning': 'Based on average sales and safety stock.'}"
+    )
+
+
+def _chat_json(config, prompt_text):
+    """one model call expecting a JSON object back. returns (parsed dict or error dict, http status)."""
+    _count('calls')
+    try:
+        response = get_client(config).chat.completions.create(
+            model=config['AI_MODEL'],
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt_text
+                }
+            ],
+            response_format={"type": "json_object"}
+        )
+
+        if response.choices and response.choices[0].message and response.choices[0].message.content is not None:
+            ai_response_content = response.choices[0].message.content
+
+            if not ai_response_content.strip(): # Check if content is empty or just whitespace
+                return {"error": "AI returned an empty response."}, 500
+
+            try:
+                ai_data = json.loads(ai_response_content)
+            except json.JSONDecodeError as e:
+                print(f"ERROR: JSON Decode Error: {e} with raw content: '{ai_response_content}'")
+                return {"error": f"Failed to parse AI response as JSON: {e}. Raw response: {ai_response_content}"}, 500
+            if not isinstance(ai_data, dict):
+                return {"error": "AI returned an invalid reorder quantity format or value."}, 500
+            return ai_data, 200
+        else:
+            return {"error": "Unexpected Together AI response format or missing content."}, 500
+
+    except Exception as e:
+        print(f"An error occurred during Together AI integration: {e}")
+        return {"error": f"Failed to get AI suggestion from Together API: {e}"}, 500
+
+
+def request_suggestion(config, prompt_text):
+    """one model call for a reorder quantity. returns (response dict, http status) like the api route expects."""
+    ai_data, status = _chat_json(config, prompt_text)
+    if status != 200:
+        return ai_data, status
+    reorder_qty = ai_data.get('reorder_quantity')
+    reasoning = ai_data.get('reasoning', 'No specific reasoning provided.')
+
+    if isinstance(reorder_qty, int) and reorder_qty >= 0:
+        return {"reorder_quantity": reorder_qty, "reasoning": reasoning}, 200
+    else:
+        return {"error": "AI returned an invalid reorder quantity format or value."}, 500
+
+
+def build_explanation_prompt(forecast_row, lead_time_days, cover_days):
+    return (
+        f"explain briefly, for a shop owner, the reorder decision for {forecast_row['name']} (SKU: {forecast_row['sku']}). "
+        f"current stock: {forecast_row['stock_quantity']} units. "
+        f"forecast daily demand: {forecast_row['daily_demand']} units (std {forecast_row['demand_std']}). "
+        f"lead time: {lead_time_days} days, safety stock: {forecast_row['safety_stock']} units, "
+        f"reorder point: {forecast_row['reorder_point']} units, cover after delivery: {cover_days} days. "
+        f"decided reorder quantity: {forecast_row['reorder_quantity']} units. "
+        "do not change the quantity. output strictly a JSON object with one key: 'reasoning' (string)."
+    )
+
+
+def explain(config, forecast_row, lead_time_days, cover_days):
+    """AI wording for a locally computed reorder decision. cached like suggestions."""
+    key = (f"explain:{forecast_row['product_id']}:{forecast_row['stock_quantity']}:"
+           f"{forecast_row['reorder_quantity']}:{forecast_row['daily_demand']}")
+    cached = _suggestions.get(key)
+    if cached is not None:
+        _count('cache_hits')
+        return cached, 200
+    ai_data, status = _chat_json(config, build_explanation_prompt(forecast_row, lead_time_days, cover_days))
+    if status != 200:
+        _count('errors')
+        return ai_data, status
+    result = {"reasoning": str(ai_data.get('reasoning', 'No specific reasoning provided.'))}
+    _suggestions.set(key, result, config['AI_CACHE_TTL'])
+    return result, 200
+
+
+def suggest(config, product, total_sales_30_days, total_purchases_30_days):
+    """cached suggestion for one product. only successful answers are cached."""
+    key = f"{product['id']}:{product['stock_quantity']}:{total_sales_30_days}"
+    cached = _suggestions.get(key)
+    if cached is not None:
+        _count('cache_hits')
+        return cached, 200
+    result, status = request_suggestion(
+        config, build_prompt(product, total_sales_30_days, total_purchases_30_days))
+    if status == 200:
+        _suggestions.set(key, result, config['AI_CACHE_TTL'])
+    else:
+        _count('errors')
+    return result, status
+
+
+def suggest_many(config, items):
+    """suggestions for many products at once.
+
+    items are (product, sales_30_days, purchases_30_days). at most AI_MAX_CONCURRENCY
+    calls run at the same time and the whole batch waits at most AI_BATCH_TIMEOUT
+    seconds; products still pending after that are reported as timed out.
+    returns [(product, result dict, status)] in the order of items.
+    """
+    results = [None] * len(items)
+    if not items:
+        return []
+    pool = ThreadPoolExecutor(max_workers=config['AI_MAX_CONCURRENCY'],
+                              thread_name_prefix='reorder-ai')
+    try:
+        futures = {pool.submit(suggest, config, *item): index for index, item in enumerate(items)}
+        done, pending = wait(futures, timeout=config['AI_BATCH_TIMEOUT'])
+        for future in done:
+            results[futures[future]] = future.result()
+        for future in pending:
+            future.cancel()
+            _count('timeouts')
+            results[futures[future]] = ({"error": "Timed out waiting for the AI suggestion."}, 504)
+    finally:
+        # don't block the request on calls that are still running, they finish in the background
+        pool.shutdown(wait=False, cancel_futures=True)
+    return [(item[0], *result) for item, result in zip(items, results)]
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
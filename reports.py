@@ -0,0 +1,213 @@
+"""sales and purchase reports over any date range, by day, week or month (/api/reports).
+
+every series of a report (units and value sold and bought, transaction counts, top
+products) comes out of one statement, and no part of it reads the whole ledger:
+
+- whole months come from MonthlyRollup (one row per month, product and type, kept by
+  triggers) and only the partial months at the ends of the range from the ledger, so
+  a multi-year month report costs a few thousand rollup rows, not the whole ledger.
+  the top products of any report are summed from these rows too.
+- day and week series are one range scan of the ledger over the covering index
+  idx_transaction_date_report (migration 9), summed per day in index order without
+  a sort; weeks are folded from the day sums.
+"""
+from calendar import monthrange
+from datetime import date, timedelta
+
+from utils import is_iso_date
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# bucket label of a YYYY-MM-DD column: the day, the monday of its week, or YYYY-MM
+_BUCKET_SQL = {
+    'day': '{column}',
+    'week': "date({column}, '-' || ((CAST(strftime('%w', {column}) AS INTEGER) + 6) % 7) || ' days')",
+    'month': 'substr({column}, 1, 7)',
+}
+
+SERIES = ('units_sold', 'sales_value', 'sale_count', 'units_purchased', 'purchase_value', 'purchase_count')
+
+
+def _month_floor(day):
+    return day.replace(day=1)
+
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    year = day.year + month // 12
+    return date(year, month % 12 + 1, 1)
+
+
+def default_range(db, months=6):
+    """the last `months` calendar months up to the newest transaction (or today)."""
+    newest = db.execute('SELECT MAX(date) FROM "Transaction"').fetchone()[0]
+    until = date.fromisoformat(newest) if newest else date.today()
+    return _add_months(_month_floor(until), 1 - months), until
+
+
+def default_params(date_from, date_to):
+    """a month by month report of the range over all products."""
+    return {'granularity': 'month', 'date_from': date_from, 'date_to': date_to,
+            'supplier_id': None, 'product_ids': [], 'top': 5}
+
+
+def parse_params(args, default_from, default_to, max_buckets=1000):
+    """reads date_from, date_to, granularity, supplier_id, product_id (repeatable) and top
+    from query args. returns (params, error message)."""
+    params = default_params(default_from, default_to)
+    params['granularity'] = args.get('granularity') or 'month'
+    if params['granularity'] not in GRANULARITIES:
+        return None, f'granularity must be one of {", ".join(GRANULARITIES)}.'
+    for key in ('date_from', 'date_to'):
+        if args.get(key):
+            if not is_iso_date(args[key]):
+                return None, f'{key} must be a YYYY-MM-DD date.'
+            params[key] = date.fromisoformat(args[key])
+    if params['date_from'] > params['date_to']:
+        return None, 'date_from must not be after date_to.'
+    try:
+        if args.get('supplier_id'):
+            params['supplier_id'] = int(args['supplier_id'])
+        params['product_ids'] = [int(value) for value in args.getlist('product_id') if value]
+        if args.get('top'):
+            params['top'] = max(0, min(int(args['top']), 50))
+    except ValueError:
+        return None, 'supplier_id, product_id and top must be numbers.'
+    if len(buckets(params)) > max_buckets:
+        return None, f'The range has more than {max_buckets} {params["granularity"]}s, use a coarser granularity.'
+    return params, None
+
+
+def buckets(params):
+    """every bucket label of the range in order, including the ones without activity."""
+    first, last, granularity = params['date_from'], params['date_to'], params['granularity']
+    if granularity == 'month':
+        labels, current = [], _month_floor(first)
+        while current <= last:
+            labels.append(current.isoformat()[:7])
+            current = _add_months(current, 1)
+        return labels
+    step = 1 if granularity == 'day' else 7
+    current = first if granularity == 'day' else first - timedelta(days=first.weekday())
+    labels = []
+    while current <= last:
+        labels.append(current.isoformat())
+        current += timedelta(days=step)
+    return labels
+
+
+def _full_months(first, last):
+    # the whole months inside [first, last] as (first month, last month), or None
+    start = first if first.day == 1 else _add_months(first, 1)
+    end = _month_floor(last) if last.day == monthrange(last.year, last.month)[1] else _add_months(last, -1)
+    if end < start:
+        return None
+    return start.isoformat()[:7], end.isoformat()[:7]
+
+
+def _product_filter(params):
+    sql, args = '', []
+    if params['product_ids']:
+        sql += f' AND product_id IN ({",".join("?" * len(params["product_ids"]))})'
+        args += params['product_ids']
+    if params['supplier_id'] is not None:
+        sql += ' AND product_id IN (SELECT id FROM Product WHERE supplier_id = ?)'
+        args.append(params['supplier_id'])
+    return sql, args
+
+
+def _ledger(bucket, first, last, params):
+    product_filter, product_args = _product_filter(params)
+    return f'''
+        SELECT {_BUCKET_SQL[bucket].format(column='date')} AS bucket, product_id, type, quantity AS units,
+               quantity * unit_price AS value, 1 AS txn_count
+        FROM "Transaction"
+        WHERE date >= ? AND date <= ?{product_filter}''', [first.isoformat(), last.isoformat(), *product_args]
+
+
+def _by_month(params):
+    # (sql, args) of rows bucket (YYYY-MM), product_id, type, units, value, txn_count over
+    # the range: whole months from the rollup, the partial months at either end from the ledger
+    first, last = params['date_from'], params['date_to']
+    months = _full_months(first, last)
+    if months is None:
+        return _ledger('month', first, last, params)
+    product_filter, product_args = _product_filter(params)
+    parts = [f'''
+        SELECT month AS bucket, product_id, type, units, value, txn_count
+        FROM MonthlyRollup
+        WHERE month >= ? AND month <= ?{product_filter}''']
+    args = [*months, *product_args]
+    head_end = date.fromisoformat(months[0] + '-01') - timedelta(days=1)
+    tail_start = _add_months(date.fromisoformat(months[1] + '-01'), 1)
+    for start, end in ((first, head_end), (tail_start, last)):
+        if start <= end:
+            sql, ledger_args = _ledger('month', start, end, params)
+            parts.append(sql)
+            args += ledger_args
+    return ' UNION ALL '.join(parts), args
+
+
+def summary(db, params):
+    """the report for parsed params: labels plus one list per series, totals, top products."""
+    monthly, monthly_args = _by_month(params)
+    if params['granularity'] == 'month':
+        series, series_args = monthly, monthly_args
+        bucket = 'bucket'
+    else:
+        # one range scan in index order (date, type, ...), summed per day without a sort;
+        # weeks are folded from the ~7x fewer day rows, not computed per ledger row
+        series, series_args = _ledger('day', params['date_from'], params['date_to'], params)
+        bucket = _BUCKET_SQL[params['granularity']].format(column='bucket')
+    rows = db.execute(f'''
+        SELECT 'bucket', {bucket}, type, SUM(units), SUM(value), SUM(txn_count)
+        FROM (
+            SELECT bucket, type, SUM(units) AS units, SUM(value) AS value, SUM(txn_count) AS txn_count
+            FROM ({series})
+            GROUP BY bucket, type
+        )
+        GROUP BY 2, type
+        UNION ALL
+        SELECT 'product', product_id, type, SUM(units), SUM(value), SUM(txn_count)
+        FROM ({monthly})
+        GROUP BY product_id, type
+    ''', [*series_args, *monthly_args]).fetchall()
+
+    labels = buckets(params)
+    index = {label: i for i, label in enumerate(labels)}
+    series = {name: [0] * len(labels) for name in SERIES}
+    products = {}
+    for kind, key, transaction_type, units, value, count in rows:
+        names = ('units_sold', 'sales_value', 'sale_count') if transaction_type == 'sale' else \
+                ('units_purchased', 'purchase_value', 'purchase_count')
+        if kind == 'bucket':
+            i = index.get(key)
+            if i is None:
+                continue
+            for name, amount in zip(names, (units, value, count)):
+                series[name][i] += amount
+        elif transaction_type == 'sale':
+            products[key] = (units, value)
+    for name in ('sales_value', 'purchase_value'):
+        series[name] = [round(value, 2) for value in series[name]]
+
+    top = sorted(products.items(), key=lambda item: (-item[1][0], item[0]))[:params['top']]
+    info = {}
+    if top:
+        ids = [product_id for product_id, _ in top]
+        info = {row[0]: row[1:] for row in db.execute(
+            f'SELECT id, name, sku FROM Product WHERE id IN ({",".join("?" * len(ids))})', ids)}
+    totals = {name: (round(sum(values), 2) if name.endswith('value') else sum(values))
+              for name, values in series.items()}
+    return {'date_from': params['date_from'].isoformat(),
+            'date_to': params['date_to'].isoformat(),
+            'granularity': params['granularity'],
+            'supplier_id': params['supplier_id'],
+            'product_ids': params['product_ids'],
+            'labels': labels,
+            'series': series,
+            'totals': totals,
+            'top_products': [{'product_id': product_id, 'name': info.get(product_id, (None, None))[0],
+                              'sku': info.get(product_id, (None, None))[1],
+                              'units': units, 'value': round(value, 2)}
+                             for product_id, (units, value) in top]}
@@ -0,0 +1,99 @@
+"""product lookup by name, SKU or supplier name over the ProductSearch index (migration 3).
+
+the index is an fts5 table with the trigram tokenizer, kept in sync with Product and
+Supplier by triggers, so every write path (forms, bulk import, supplier changes) is
+covered. a typeahead query is answered in tiers, each one a short index read that
+stops as soon as `limit` products are found:
+
+  1. exact SKU                     (NOCASE index)
+  2. SKU prefix, then name prefix  (NOCASE indexes, LIKE 'q%')
+  3. substring of name, SKU or supplier name  (trigram index, 3+ characters)
+  4. fuzzy: products sharing most of the query's trigrams, so a typo ('laptpo',
+     'LAP-0042') still finds something. only runs when 1-3 found nothing, since it
+     has to rank every product containing any of the trigrams
+"""
+
+MIN_INDEXED_LENGTH = 3
+# share of the query's trigrams a fuzzy match must contain
+FUZZY_MIN_SCORE = 0.5
+
+_SELECT = '''
+    SELECT p.id, p.name, p.sku, p.stock_quantity, p.unit_price, p.supplier_id, s.name AS supplier_name
+    FROM Product p LEFT JOIN Supplier s ON s.id = p.supplier_id
+'''
+
+
+def _phrase(text):
+    # one fts5 string token, so operators and punctuation in the query are taken literally
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _like_prefix(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _trigrams(text):
+    text = text.lower()
+    return list(dict.fromkeys(text[i:i + 3] for i in range(len(text) - 2)))
+
+
+def match_filter(q, alias='p'):
+    """(sql condition, params) limiting Product rows to those matching q, for the paginated list."""
+    q = q.strip()
+    if len(q) >= MIN_INDEXED_LENGTH:
+        return f'{alias}.id IN (SELECT rowid FROM ProductSearch WHERE ProductSearch MATCH ?)', [_phrase(q)]
+    prefix = _like_prefix(q)
+    return (f"({alias}.sku LIKE ? ESCAPE '\\' OR {alias}.name LIKE ? ESCAPE '\\')", [prefix, prefix])
+
+
+def search_products(db, q, limit=10):
+    """top `limit` products for a typeahead, best tier first. each row says which tier found it."""
+    q = (q or '').strip()
+    if not q:
+        return []
+    results = []
+    found = set()
+
+    def add(rows, match):
+        for row in rows:
+            if row['id'] not in found and len(results) < limit:
+                found.add(row['id'])
+                result = dict(row)
+                result['match'] = match
+                results.append(result)
+
+    prefix = _like_prefix(q)
+    add(db.execute(_SELECT + 'WHERE p.sku = ? COLLATE NOCASE', (q,)).fetchall(), 'sku')
+    # limit + len(found) rows, so the tier still fills up after skipping ones already listed
+    for column in ('sku', 'name'):
+        if len(results) < limit:
+            add(db.execute(_SELECT + f'''
+                WHERE p.{column} LIKE ? ESCAPE '\\'
+                ORDER BY p.{column} COLLATE NOCASE
+                LIMIT ?
+            ''', (prefix, limit + len(found))).fetchall(), 'prefix')
+    if len(results) >= limit or len(q) < MIN_INDEXED_LENGTH:
+        return results
+
+    add(db.execute(_SELECT + '''
+        WHERE p.id IN (SELECT rowid FROM ProductSearch WHERE ProductSearch MATCH ? LIMIT ?)
+    ''', (_phrase(q), limit + len(found))).fetchall(), 'substring')
+    if results or len(q) <= MIN_INDEXED_LENGTH:
+        return results
+
+    # fuzzy: any of the trigrams, best bm25 candidates re-scored by trigram overlap
+    grams = _trigrams(q)
+    candidates = db.execute(_SELECT + '''
+        JOIN (SELECT rowid AS id, rank FROM ProductSearch WHERE ProductSearch MATCH ?
+              ORDER BY rank LIMIT ?) f ON f.id = p.id
+        ORDER BY f.rank
+    ''', (' OR '.join(_phrase(gram) for gram in grams), limit * 5)).fetchall()
+    scored = []
+    for row in candidates:
+        haystack = f"{row['name']} {row['sku']} {row['supplier_name'] or ''}".lower()
+        score = sum(gram in haystack for gram in grams) / len(grams)
+        if score >= FUZZY_MIN_SCORE:
+            scored.append((score, row))
+    scored.sort(key=lambda item: -item[0])
+    add((row for _, row in scored), 'fuzzy')
+    return results
@@ -0,0 +1,158 @@
+"""read-only copy of the database for reports, exports and dashboard aggregates.
+
+with ERP_SNAPSHOT_ENABLED=1 those reads go to a snapshot file instead of the live
+database, so a long report scan or a full export never shares a file (or a cache, or
+a checkpoint) with the write path of the sales terminals.
+
+the snapshot is taken with sqlite's online backup API: one read transaction on the
+live database (in WAL mode writers carry on meanwhile), written to a temporary file,
+switched to a rollback journal and renamed over the previous snapshot. the file is
+never changed after that, so readers open it with immutable=1 and take no locks at
+all. its mtime is the moment the copy was taken, which every worker process can see.
+
+staleness is bounded by SNAPSHOT_MAX_AGE: a read finding an older (or no) snapshot
+takes a new one first. past SNAPSHOT_REFRESH_AGE a read starts a refresh in a
+background thread and goes on with the current snapshot, so while the app is in use
+the snapshot is renewed about every SNAPSHOT_REFRESH_AGE seconds and nobody waits.
+`flask refresh-snapshot` takes one on demand (e.g. from cron, or after a bulk import).
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+from flask import current_app, g
+
+import metrics
+from db import connection, get_db as get_live_db
+
+_refresh_lock = threading.Lock()
+_refreshing = set()  # snapshot paths with a background refresh running
+
+
+def enabled(app=None):
+    return (app or current_app).config['SNAPSHOT_ENABLED']
+
+
+def path(app=None):
+    """SNAPSHOT_PATH, or the database path with a .snapshot suffix."""
+    config = (app or current_app).config
+    return config['SNAPSHOT_PATH'] or config['DATABASE'] + '.snapshot'
+
+
+def taken_at(app=None):
+    """unix time the current snapshot was taken, None if there is none."""
+    try:
+        return os.stat(path(app)).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def refresh(app=None):
+    """copies the live database to the snapshot file now, returns the time it was taken."""
+    app = app or current_app._get_current_object()
+    target_path = path(app)
+    temp_path = f'{target_path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    started = time.time()
+    try:
+        target = sqlite3.connect(temp_path)
+        try:
+            with connection(app) as live:
+                # pages=-1: the whole copy in one step, i.e. one consistent read transaction
+                live.backup(target)
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+        os.utime(temp_path, (started, started))
+        os.replace(temp_path, target_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return started
+
+
+def _refresh_in_background(app, target_path):
+    try:
+        refresh(app)
+    except Exception as e:
+        app.logger.warning('snapshot refresh failed: %s', e)
+    finally:
+        with _refresh_lock:
+            _refreshing.discard(target_path)
+
+
+def ensure_fresh(app=None):
+    """refreshes the snapshot if it is older than SNAPSHOT_MAX_AGE (waiting for it), or
+    starts a background refresh past SNAPSHOT_REFRESH_AGE. returns the snapshot time."""
+    app = app or current_app._get_current_object()
+    target_path = path(app)
+    taken = taken_at(app)
+    age = time.time() - taken if taken is not None else None
+    if age is None or age > app.config['SNAPSHOT_MAX_AGE']:
+        with _refresh_lock:
+            # another thread may have refreshed it while this one waited for the lock
+            taken = taken_at(app)
+            if taken is None or time.time() - taken > app.config['SNAPSHOT_MAX_AGE']:
+                taken = refresh(app)
+        return taken
+    if age > app.config['SNAPSHOT_REFRESH_AGE']:
+        with _refresh_lock:
+            if target_path in _refreshing:
+                return taken
+            _refreshing.add(target_path)
+        threading.Thread(target=_refresh_in_background, args=(app, target_path),
+                         name='snapshot-refresh', daemon=True).start()
+    return taken
+
+
+def _connect(app, target_path):
+    conn = sqlite3.connect(f'file:{quote(os.path.abspath(target_path))}?immutable=1', uri=True,
+                           check_same_thread=False, factory=metrics.connection_factory(app.config))
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA query_only = ON')
+    conn.execute(f'PRAGMA cache_size = {int(app.config["DB_CACHE_SIZE"])}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+
+def get_db():
+    """connection for reporting reads in this request: the snapshot when enabled, else the
+    live pooled connection. the snapshot connection is opened once per request, so all
+    reads of a page see the same copy."""
+    if not enabled():
+        return get_live_db()
+    conn = getattr(g, '_snapshot', None)
+    if conn is None:
+        app = current_app._get_current_object()
+        g._snapshot_taken_at = ensure_fresh(app)
+        conn = g._snapshot = _connect(app, path(app))
+    return conn
+
+
+def as_of():
+    """datetime of the snapshot the current request reads, None when reading live data."""
+    if not enabled():
+        return None
+    get_db()
+    return datetime.fromtimestamp(g._snapshot_taken_at)
+
+
+def cache_key(key):
+    """aggregate cache key that follows the snapshot, so a cached number is never older
+    than the snapshot it was computed from."""
+    if not enabled():
+        return key
+    get_db()
+    return f'{key}@{g._snapshot_taken_at:.3f}'
+
+
+def close_snapshot(exception):
+    conn = g.pop('_snapshot', None)
+    if conn is not None:
+        conn.close()
+
+
+def init_app(app):
+    app.teardown_appcontext(close_snapshot)
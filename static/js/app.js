@@ -0,0 +1,30 @@
+// product typeahead: a text input with data-product-search="<hidden input id>" asks
+// /api/products/search as you type and puts the chosen product's id in the hidden input
+document.addEventListener('DOMContentLoaded', function() {
+  document.querySelectorAll('[data-product-search]').forEach(input => {
+    const hidden = document.getElementById(input.dataset.productSearch);
+    const list = document.getElementById(input.getAttribute('list'));
+    let ids = {};
+    let timer = null;
+    const label = p => `${p.name} (${p.sku}) - Stock: ${p.stock_quantity}`;
+    input.addEventListener('input', function() {
+      hidden.value = ids[input.value] || '';
+      clearTimeout(timer);
+      if (hidden.value || !input.value.trim()) return;
+      timer = setTimeout(async () => {
+        const response = await fetch(`/api/products/search?q=${encodeURIComponent(input.value)}`);
+        if (!response.ok) return;
+        const products = await response.json();
+        ids = {};
+        list.innerHTML = '';
+        products.forEach(p => {
+          ids[label(p)] = p.id;
+          const option = document.createElement('option');
+          option.value = label(p);
+          list.appendChild(option);
+        });
+        hidden.value = ids[input.value] || '';
+      }, 150);
+    });
+  });
+});
@@ -0,0 +1,147 @@
+"""every change to Product.stock_quantity caused by a transaction goes through here.
+
+stock is never read into python, changed and written back. each change is one
+guarded UPDATE (stock_quantity + delta, only if the result stays >= 0) run inside
+the caller's BEGIN IMMEDIATE transaction (db.write_transaction), so concurrent
+workers cannot overwrite each other or take stock below zero.
+
+the matching StockMovement rows are written by triggers for transactions; stock set
+by hand (set_stock) records its own adjustment movement here.
+"""
+
+
+class StockError(Exception):
+    """the change was refused, the message is meant for the user."""
+
+
+def effect(transaction_type, quantity):
+    """signed stock change of a transaction: purchases add, sales remove."""
+    return quantity if transaction_type == 'purchase' else -quantity
+
+
+def apply_delta(db, product_id, delta,
+                shortage_message='Not enough stock for sale! Only {stock} units available for {name}.'):
+    """adds delta to the product's stock unless a negative delta would take it below zero."""
+    cursor = db.execute('''
+        UPDATE Product
+        SET stock_quantity = stock_quantity + ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND (? >= 0 OR stock_quantity + ? >= 0)
+    ''', (delta, product_id, delta, delta))
+    if cursor.rowcount == 1:
+        return
+    product = db.execute('SELECT name, stock_quantity FROM Product WHERE id = ?', (product_id,)).fetchone()
+    if product is None:
+        raise StockError('Selected product not found.')
+    raise StockError(shortage_message.format(name=product[0], stock=product[1]))
+
+
+def add_transaction(db, product_id, transaction_type, quantity, date, unit_price):
+    """records a transaction and moves the stock, returns the new transaction id."""
+    apply_delta(db, product_id, effect(transaction_type, quantity))
+    cursor = db.execute('''
+        INSERT INTO "Transaction" (product_id, quantity, type, date, unit_price)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (product_id, quantity, transaction_type, date, unit_price))
+    return cursor.lastrowid
+
+
+def add_order(db, lines):
+    """records several transactions at once: all of them or, if any product is short, none.
+
+    lines are cleaned transactions (product_id, type, quantity, date, unit_price). the
+    stock check reads every product once and the net change per product is applied with
+    one executemany, so a 50 line basket is one write transaction and one commit for the
+    caller instead of 50. returns the new transaction ids in line order.
+    """
+    deltas = {}
+    for line in lines:
+        deltas[line['product_id']] = deltas.get(line['product_id'], 0) + effect(line['type'], line['quantity'])
+    marks = ','.join('?' * len(deltas))
+    stock = {row[0]: (row[1], row[2]) for row in db.execute(
+        f'SELECT id, name, stock_quantity FROM Product WHERE id IN ({marks})', list(deltas))}
+    missing = [product_id for product_id in deltas if product_id not in stock]
+    if missing:
+        raise StockError(f'Products not found: {", ".join(map(str, missing))}.')
+    short = [f'{stock[product_id][0]} (need {-delta}, have {stock[product_id][1]})'
+             for product_id, delta in deltas.items() if stock[product_id][1] + delta < 0]
+    if short:
+        raise StockError(f'Not enough stock for: {"; ".join(short)}.')
+
+    # same guard as apply_delta; under the write lock the check above already holds
+    changes = [(delta, product_id, delta, delta) for product_id, delta in deltas.items() if delta]
+    if changes:
+        cursor = db.executemany('''
+            UPDATE Product
+            SET stock_quantity = stock_quantity + ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND (? >= 0 OR stock_quantity + ? >= 0)
+        ''', changes)
+        if cursor.rowcount != len(changes):
+            raise StockError('Stock changed while the order was applied, nothing was recorded.')
+    db.executemany('''
+        INSERT INTO "Transaction" (product_id, quantity, type, date, unit_price)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(line['product_id'], line['quantity'], line['type'], line['date'], line['unit_price'])
+          for line in lines])
+    # AUTOINCREMENT under the write lock: the order's ids are the last len(lines) ones
+    last = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'Transaction'").fetchone()[0]
+    return list(range(last - len(lines) + 1, last + 1))
+
+
+def _get(db, transaction_id):
+    txn = db.execute('SELECT product_id, quantity, type FROM "Transaction" WHERE id = ?',
+                     (transaction_id,)).fetchone()
+    if txn is None:
+        raise StockError('Transaction not found.')
+    return txn
+
+
+def update_transaction(db, transaction_id, product_id, transaction_type, quantity, date, unit_price):
+    """rewrites a transaction, reverting its old stock effect and applying the new one.
+
+    when the product is unchanged only the net difference is applied, so e.g. raising a
+    sale from 5 to 6 units needs one spare unit, not six.
+    """
+    old_product_id, old_quantity, old_type = _get(db, transaction_id)
+    old_effect = effect(old_type, old_quantity)
+    new_effect = effect(transaction_type, quantity)
+    if old_product_id == product_id:
+        if new_effect != old_effect:
+            apply_delta(db, product_id, new_effect - old_effect)
+    else:
+        apply_delta(db, old_product_id, -old_effect,
+                    'Cannot move this transaction. Stock for {name} would become negative.')
+        apply_delta(db, product_id, new_effect)
+    db.execute('''
+        UPDATE "Transaction"
+        SET product_id = ?, quantity = ?, type = ?, date = ?, unit_price = ?
+        WHERE id = ?
+    ''', (product_id, quantity, transaction_type, date, unit_price, transaction_id))
+
+
+def delete_transaction(db, transaction_id):
+    """deletes a transaction and reverts its stock effect."""
+    product_id, quantity, transaction_type = _get(db, transaction_id)
+    apply_delta(db, product_id, -effect(transaction_type, quantity),
+                'Cannot delete purchase transaction. Stock for {name} would become negative.')
+    db.execute('DELETE FROM "Transaction" WHERE id = ?', (transaction_id,))
+
+
+def record_movement(db, product_id, quantity, date, reason, unit_price=None):
+    """appends a movement that is not caused by a transaction (adjustments, reconciliation)."""
+    db.execute('''
+        INSERT INTO StockMovement (product_id, date, quantity, unit_price, reason)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (product_id, date, quantity, unit_price, reason))
+
+
+def set_stock(db, product_id, quantity, date):
+    """sets stock to a counted quantity and records the difference as an adjustment."""
+    product = db.execute('SELECT stock_quantity, unit_price FROM Product WHERE id = ?', (product_id,)).fetchone()
+    if product is None:
+        raise StockError('Selected product not found.')
+    delta = quantity - product[0]
+    if delta:
+        db.execute('''
+            UPDATE Product SET stock_quantity = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+        ''', (quantity, product_id))
+        record_movement(db, product_id, delta, date, 'adjustment', product[1])
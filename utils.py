@@ -0,0 +1,74 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+
+"""packs the sort key of the last row on a page into an opaque url-safe token."""
+def encode_cursor(*values):
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+"""unpacks a token made by encode_cursor, returns None for anything malformed."""
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+"""True if the string is a YYYY-MM-DD date (the format dates are stored in)."""
+def is_iso_date(value):
+    try:
+        datetime.strptime(value, '%Y-%m-%d')
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+"""reads an int query arg clamped to [minimum, maximum], falling back to default."""
+def clamp_int(value, default, minimum, maximum):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(minimum, min(value, maximum))
+
+
+"""reads product/type/date range filters from query args. returns (filters, error message)."""
+def parse_transaction_filters(args):
+    filters = {}
+    if args.get('product_id'):
+        try:
+            filters['product_id'] = int(args['product_id'])
+        except ValueError:
+            return None, 'product_id must be a number.'
+    if args.get('type'):
+        if args['type'] not in ('purchase', 'sale'):
+            return None, "type must be 'purchase' or 'sale'."
+        filters['type'] = args['type']
+    for key in ('date_from', 'date_to'):
+        if args.get(key):
+            if not is_iso_date(args[key]):
+                return None, f'{key} must be a YYYY-MM-DD date.'
+            filters[key] = args[key]
+    return filters, None
+
+
+"""turns parsed ledger filters (product_id, type, date_from, date_to) into
+WHERE clause fragments and their params for the "Transaction" table alias."""
+def transaction_filter_sql(filters, alias='t'):
+    columns = (('product_id', 'product_id = ?'), ('type', 'type = ?'),
+               ('date_from', 'date >= ?'), ('date_to', 'date <= ?'))
+    where = []
+    params = []
+    for key, condition in columns:
+        if key in filters:
+            where.append(f'{alias}.{condition}')
+            params.append(filters[key])
+    return where, params
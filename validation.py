@@ -0,0 +1,140 @@
+"""input rules for suppliers, products and transactions, shared by the form routes,
+bulk import and the json api.
+
+each clean_* function takes a mapping (request.form, a csv row, a json object) and
+returns the typed values, or raises ValidationError with the message shown to the user.
+"""
+import math
+
+from utils import is_iso_date
+
+TRANSACTION_TYPES = ('purchase', 'sale')
+# sqlite stores integers as signed 64 bit, anything wider can't be bound
+INTEGER_MIN, INTEGER_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+class ValidationError(ValueError):
+    """errors: per item messages when several inputs were checked at once (orders)."""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+def _text(data, key, required=True):
+    # json can send a number, list or object where a string belongs; only str is text
+    value = data.get(key)
+    if value is not None and not isinstance(value, str):
+        raise ValidationError(f'{key} must be text.')
+    value = value.strip() if value else value
+    if not value and required:
+        raise ValidationError(f'{key} is required.')
+    return value or None
+
+
+def _integer(value):
+    # int() of a form/csv string or a json number; json true/false and 2.7 are not whole numbers
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f'{value!r} is not a whole number')
+    value = int(value)
+    if not INTEGER_MIN <= value <= INTEGER_MAX:
+        raise ValueError(f'{value!r} is out of range')
+    return value
+
+
+def _price(value):
+    # finite float: float() also takes 'inf' and 'nan'
+    if isinstance(value, bool):
+        raise ValueError(f'{value!r} is not a number')
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f'{value!r} is not a finite number')
+    return value
+
+
+def _level(data, key):
+    # optional reorder threshold: blank means "inherit" (supplier default, then global)
+    value = data.get(key)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        value = _integer(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f'{key} must be a whole number.')
+    if value < 0:
+        raise ValidationError(f'{key} cannot be negative.')
+    return value
+
+
+def clean_supplier(data):
+    name = _text(data, 'name')
+    contact_email = _text(data, 'contact_email', required=False)
+    if contact_email and '@' not in contact_email:
+        raise ValidationError('contact_email must be an email address.')
+    return {'name': name, 'contact_email': contact_email,
+            'default_reorder_level': _level(data, 'default_reorder_level')}
+
+
+def clean_product(data):
+    name = _text(data, 'name')
+    sku = _text(data, 'sku')
+    try:
+        unit_price = _price(data.get('unit_price'))
+        stock_quantity = _integer(data.get('stock_quantity'))
+        supplier_id = _integer(data.get('supplier_id'))
+    except (TypeError, ValueError):
+        raise ValidationError('Invalid input for price, quantity, or supplier. Please ensure they are numbers.')
+
+    if unit_price <= 0 or stock_quantity < 0:
+        raise ValidationError('Price must be positive and stock quantity cannot be negative.')
+    return {'name': name, 'sku': sku, 'stock_quantity': stock_quantity,
+            'unit_price': unit_price, 'supplier_id': supplier_id,
+            'reorder_level': _level(data, 'reorder_level')}
+
+
+def clean_transaction(data):
+    """product_id is required unless the row names its product by 'sku' (bulk import)."""
+    transaction_type = data.get('type')
+    date = data.get('date')
+    sku = _text(data, 'sku', required=False)
+    try:
+        product_id = _integer(data['product_id']) if data.get('product_id') not in (None, '') else None
+        quantity = _integer(data.get('quantity'))
+        unit_price = _price(data.get('unit_price'))
+    except (TypeError, ValueError):
+        raise ValidationError('Invalid input for quantity or price. Please ensure they are numbers.')
+
+    if product_id is None and not sku:
+        raise ValidationError('product_id is required.')
+    if quantity <= 0 or unit_price <= 0:
+        raise ValidationError('Quantity and Unit Price must be positive.')
+    if transaction_type not in TRANSACTION_TYPES:
+        raise ValidationError('Invalid transaction type.')
+    if not is_iso_date(date):
+        raise ValidationError('Date must be in YYYY-MM-DD format.')
+    return {'product_id': product_id, 'sku': sku, 'type': transaction_type,
+            'date': date, 'quantity': quantity, 'unit_price': unit_price}
+
+
+def clean_order(data, max_lines=500):
+    """an order is {"date", "type" (default 'sale'), "lines": [...]}; each line is a
+    transaction whose missing date/type come from the order. every line is checked and
+    all problems are reported together, as errors [{line, error}] (line counts from 1).
+    """
+    lines = data.get('lines')
+    if not isinstance(lines, list) or not lines:
+        raise ValidationError('An order needs a non-empty list of lines.')
+    if len(lines) > max_lines:
+        raise ValidationError(f'An order can have at most {max_lines} lines.')
+    defaults = {'type': data.get('type') or 'sale', 'date': data.get('date')}
+    cleaned, errors = [], []
+    for number, line in enumerate(lines, start=1):
+        try:
+            if not isinstance(line, dict):
+                raise ValidationError('Each line must be an object.')
+            cleaned.append(clean_transaction({**defaults, **{k: v for k, v in line.items() if v is not None}}))
+        except ValidationError as e:
+            errors.append({'line': number, 'error': str(e)})
+    if errors:
+        raise ValidationError(f'{len(errors)} of {len(lines)} order lines are invalid.', errors)
+    return cleaned
@@ -0,0 +1,290 @@
+"""inventory valuation at cost, cost of goods sold and gross margin (migration 5).
+
+each product's purchases, sales and non-transaction movements (opening balances,
+adjustments, ...) are replayed in business order (date, receipts before issues) with
+either a moving weighted average cost ('wavg') or FIFO cost layers ('fifo'). the
+running state after every event is stored in ValuationEvent, and per-month sums in
+ValuationMonthly, whose per-month totals are kept by triggers in ValuationMonthTotal.
+
+the work is incremental. a trigger on StockMovement marks a product dirty from the
+date of the change (ValuationDirty); refresh() replays only the dirty products, and
+only from the first day of the month of their earliest change, starting from the
+stored state just before it. a new sale costs one product's current month, a
+back-dated edit that product's months since the edit, never the whole ledger.
+
+fifo layers are not stored: the stock left after any event is always made up of the
+newest receipts, so the layers are rebuilt from the receipts before the resume date.
+issues beyond the stock on hand (possible on a back-dated sale) are costed at the
+current unit cost and leave a negative quantity that later receipts fill first.
+"""
+from collections import deque
+from datetime import date
+
+METHODS = ('wavg', 'fifo')
+
+_ORDER = 'date DESC, direction DESC, source DESC, source_id DESC'
+
+
+class Cost:
+    """running stock and cost of one product."""
+
+    def __init__(self, method, quantity=0, value=0.0, unit_cost=0.0, layers=None):
+        self.method = method
+        self.quantity = quantity
+        self.value = value
+        # moving average (wavg) or the newest receipt's cost (fifo)
+        self.unit_cost = unit_cost
+        # fifo only: [quantity, unit cost] oldest first, empty while quantity <= 0
+        self.layers = deque(layers or ())
+
+    def receive(self, quantity, unit_cost):
+        """adds received units at unit_cost each."""
+        if self.method == 'fifo':
+            # units owed by earlier issues are filled first
+            filled = min(quantity, -self.quantity) if self.quantity < 0 else 0
+            if quantity > filled:
+                self.layers.append([quantity - filled, unit_cost])
+            self.quantity += quantity
+            self.unit_cost = unit_cost
+            self._fifo_value()
+        elif self.quantity >= 0:
+            self.value += quantity * unit_cost
+            self.quantity += quantity
+            self.unit_cost = self.value / self.quantity if self.quantity else unit_cost
+        else:
+            self.quantity += quantity
+            self.unit_cost = unit_cost
+            self.value = self.quantity * unit_cost
+
+    def issue(self, quantity):
+        """removes units and returns their cost."""
+        if self.method == 'fifo':
+            cost = 0.0
+            remaining = quantity
+            while remaining and self.layers:
+                layer = self.layers[0]
+                taken = min(remaining, layer[0])
+                cost += taken * layer[1]
+                remaining -= taken
+                layer[0] -= taken
+                if not layer[0]:
+                    self.layers.popleft()
+            cost += remaining * self.unit_cost
+            self.quantity -= quantity
+            self._fifo_value()
+            return cost
+        if self.quantity > 0:
+            self.unit_cost = self.value / self.quantity
+        cost = quantity * self.unit_cost
+        self.quantity -= quantity
+        self.value = self.value - cost if self.quantity > 0 else self.quantity * self.unit_cost
+        return cost
+
+    def _fifo_value(self):
+        if self.quantity > 0:
+            self.value = sum(layer[0] * layer[1] for layer in self.layers)
+        else:
+            self.layers.clear()
+            self.value = self.quantity * self.unit_cost
+
+
+def month_start(day):
+    return day[:7] + '-01'
+
+
+def _state_before(db, method, product_id, since):
+    row = db.execute(f'''
+        SELECT qty_after, value_after, cost_after FROM ValuationEvent
+        WHERE product_id = ? AND date < ?
+        ORDER BY {_ORDER} LIMIT 1
+    ''', (product_id, since)).fetchone()
+    if row is None:
+        return Cost(method)
+    quantity, value, unit_cost = row[0], row[1], row[2]
+    layers = []
+    if method == 'fifo' and quantity > 0:
+        needed = quantity
+        for received, cost in db.execute(f'''
+            SELECT quantity, unit_cost FROM ValuationEvent
+            WHERE product_id = ? AND date < ? AND direction = 0
+            ORDER BY {_ORDER}
+        ''', (product_id, since)):
+            taken = min(received, needed)
+            layers.append([taken, cost])
+            needed -= taken
+            if not needed:
+                break
+        layers.reverse()
+    return Cost(method, quantity, value, unit_cost, layers)
+
+
+def _events(db, product_id, since):
+    # (date, direction, source, source_id, signed quantity, unit price, is a sale).
+    # only opening balances keep their movement price, see revalue()
+    return db.execute('''
+        SELECT date, CASE WHEN type = 'purchase' THEN 0 ELSE 1 END, 't', id,
+               CASE WHEN type = 'purchase' THEN quantity ELSE -quantity END, unit_price, type = 'sale'
+        FROM "Transaction" WHERE product_id = ? AND date >= ?
+        UNION ALL
+        SELECT date, CASE WHEN quantity > 0 THEN 0 ELSE 1 END, 'm', id, quantity,
+               CASE WHEN reason = 'opening' THEN unit_price END, 0
+        FROM StockMovement WHERE product_id = ? AND date >= ? AND transaction_id IS NULL
+        ORDER BY 1, 2, 3, 4
+    ''', (product_id, since, product_id, since)).fetchall()
+
+
+def revalue(db, method, product_id, since):
+    """replays one product from the first day of since's month onwards. returns the events replayed."""
+    since = month_start(since)
+    state = _state_before(db, method, product_id, since)
+    opening_value = state.value
+    db.execute('DELETE FROM ValuationEvent WHERE product_id = ? AND date >= ?', (product_id, since))
+    db.execute('DELETE FROM ValuationMonthly WHERE product_id = ? AND month >= ?', (product_id, since[:7]))
+
+    events = []
+    # month -> [units sold, revenue, cogs, purchases, adjustments, closing qty, closing value]
+    months = {}
+    for day, direction, source, source_id, quantity, unit_price, is_sale in _events(db, product_id, since):
+        month = months.get(day[:7])
+        if month is None:
+            month = months[day[:7]] = [0, 0.0, 0.0, 0.0, 0.0, 0, 0.0]
+        revenue = 0.0
+        if direction == 0:
+            # counted stock (adjustments, reconciliation) comes in at the current cost,
+            # an opening balance at the list price it was entered with
+            unit_cost = state.unit_cost if unit_price is None else unit_price
+            state.receive(quantity, unit_cost)
+            month[3 if source == 't' else 4] += quantity * unit_cost
+        else:
+            cost = state.issue(-quantity)
+            unit_cost = cost / -quantity if quantity else state.unit_cost
+            if is_sale:
+                revenue = -quantity * unit_price
+                month[0] -= quantity
+                month[1] += revenue
+                month[2] += cost
+            else:
+                month[4] -= cost
+        month[5], month[6] = state.quantity, state.value
+        events.append((product_id, day, direction, source, source_id, quantity, unit_cost, revenue,
+                       state.quantity, state.value, state.unit_cost))
+
+    db.executemany('''
+        INSERT INTO ValuationEvent (product_id, date, direction, source, source_id, quantity, unit_cost,
+                                    revenue, qty_after, value_after, cost_after)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', events)
+    rows = []
+    previous_value = opening_value
+    for month, sums in months.items():
+        rows.append((product_id, month, *sums, sums[6] - previous_value))
+        previous_value = sums[6]
+    db.executemany('''
+        INSERT INTO ValuationMonthly (product_id, month, units_sold, revenue, cogs, purchases, adjustments,
+                                      closing_qty, closing_value, value_change)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return len(events)
+
+
+def stored_method(db):
+    row = db.execute('SELECT method FROM ValuationState WHERE id = 1').fetchone()
+    return row[0] if row else None
+
+
+def pending(db, method):
+    """True if refresh() has work to do: dirty products, or the method changed."""
+    if stored_method(db) != method:
+        return True
+    return db.execute('SELECT 1 FROM ValuationDirty LIMIT 1').fetchone() is not None
+
+
+def reset(db, method):
+    """drops the stored valuation and marks every product dirty from its first movement."""
+    db.execute('DELETE FROM ValuationEvent')
+    db.execute('DELETE FROM ValuationMonthly')
+    db.execute('DELETE FROM ValuationMonthTotal')
+    db.execute('DELETE FROM ValuationDirty')
+    db.execute('''
+        INSERT INTO ValuationDirty (product_id, since)
+        SELECT product_id, MIN(date) FROM StockMovement GROUP BY product_id
+    ''')
+    db.execute('INSERT OR REPLACE INTO ValuationState (id, method) VALUES (1, ?)', (method,))
+
+
+def refresh(db, method='wavg'):
+    """revalues every dirty product from its dirty date. run inside db.write_transaction.
+
+    the first run, or a run with a different method than the stored one, values every
+    product from scratch. returns the number of products revalued.
+    """
+    if method not in METHODS:
+        raise ValueError(f'unknown valuation method {method!r}, expected one of {METHODS}')
+    if stored_method(db) != method:
+        reset(db, method)
+    dirty = db.execute('SELECT product_id, since FROM ValuationDirty').fetchall()
+    for product_id, since in dirty:
+        revalue(db, method, product_id, since)
+    db.execute('DELETE FROM ValuationDirty')
+    return len(dirty)
+
+
+def _months(first, last):
+    year, month = int(first[:4]), int(first[5:7])
+    while True:
+        current = f'{year:04d}-{month:02d}'
+        if current > last:
+            return
+        yield current
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _margin(revenue, cogs):
+    return round((revenue - cogs) / revenue * 100, 1) if revenue else None
+
+
+def monthly_summary(db, months=None, until=None):
+    """per month: units sold, revenue, cogs, gross margin, purchases, adjustments and the
+    inventory value at cost at month end, oldest first. the last `months` months up to
+    `until` (YYYY-MM, default this month) if given. months without any activity are
+    included, carrying the inventory value forward.
+    """
+    until = until or date.today().isoformat()[:7]
+    totals = {row[0]: row[1:] for row in db.execute('''
+        SELECT month, units_sold, revenue, cogs, purchases, adjustments, value_change
+        FROM ValuationMonthTotal ORDER BY month
+    ''')}
+    if not totals:
+        return []
+    result = []
+    inventory_value = 0.0
+    for month in _months(min(totals), max(until, max(totals))):
+        units_sold, revenue, cogs, purchases, adjustments, value_change = totals.get(month, (0, 0.0, 0.0, 0.0, 0.0, 0.0))
+        inventory_value += value_change
+        result.append({'month': month, 'units_sold': units_sold, 'revenue': round(revenue, 2),
+                       'cogs': round(cogs, 2), 'gross_margin': round(revenue - cogs, 2),
+                       'margin_pct': _margin(revenue, cogs), 'purchases': round(purchases, 2),
+                       'adjustments': round(adjustments, 2), 'inventory_value': round(inventory_value, 2)})
+    result = [row for row in result if row['month'] <= until]
+    return result[-months:] if months else result
+
+
+def product_summary(db, product_id, months=None):
+    """current stock, value and unit cost of one product, plus its monthly rows oldest first."""
+    last = db.execute(f'''
+        SELECT qty_after, value_after, cost_after FROM ValuationEvent WHERE product_id = ?
+        ORDER BY {_ORDER} LIMIT 1
+    ''', (product_id,)).fetchone()
+    rows = db.execute('''
+        SELECT month, units_sold, revenue, cogs, purchases, adjustments, closing_qty, closing_value
+        FROM ValuationMonthly WHERE product_id = ? ORDER BY month
+    ''', (product_id,)).fetchall()
+    history = [{'month': row[0], 'units_sold': row[1], 'revenue': round(row[2], 2), 'cogs': round(row[3], 2),
+                'gross_margin': round(row[2] - row[3], 2), 'margin_pct': _margin(row[2], row[3]),
+                'purchases': round(row[4], 2), 'adjustments': round(row[5], 2),
+                'closing_qty': row[6], 'closing_value': round(row[7], 2)} for row in rows]
+    return {'product_id': product_id,
+            'quantity': last[0] if last else 0,
+            'value': round(last[1], 2) if last else 0.0,
+            'unit_cost': round(last[2], 4) if last else None,
+            'months': history[-months:] if months else history}